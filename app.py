@@ -1,66 +1,113 @@
-import plotly.express as px
-import matplotlib.dates as mdates
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
+import os
+import importlib.util
 from io import BytesIO
+import render
+from cities import load_registry
+from intervals import COVERAGE, LOWER_COLUMN, UPPER_COLUMN
+from dashboard import AGGREGATES_PATH, ALERT_AQI, aqi_label, aqi_style, load_aggregates
 
-# Load prediction data
-df = pd.read_csv("data/predicted_aqi_72hr.csv")
-df["time"] = pd.to_datetime(df["time"])
+PREDICTIONS_PATH = "data/predicted_aqi_72hr.csv"
+SHAP_VALUES_PATH = "data/shap_values.parquet"
 
-# City selection (default Karachi)
-city_map = {0: "Karachi", 1: "Islamabad", 2: "Lahore"}
-city_name_to_code = {v: k for k, v in city_map.items()}
-city_select = st.selectbox("Select City", ["Karachi", "Islamabad", "Lahore"], index=0, key="city_select")
-selected_city_code = city_name_to_code[city_select]
-city_df = df[df["city"] == selected_city_code].copy()
 
-# Set up Streamlit app
-st.set_page_config(page_title="72-Hour AQI Forecast", layout="centered")
-st.title(f"🌫️ 72-Hour Air Quality Forecast for {city_select}")
+# --- SHAP data (cached per file version) ---
+@st.cache_data
+def load_shap_values(path, mtime):
+    return pd.read_parquet(path)
 
-# Define AQI color bands
-def get_aqi_color(aqi):
-    if aqi <= 50: return "🟢 Good"
-    elif aqi <= 100: return "🟡 Moderate"
-    elif aqi <= 150: return "🟠 Unhealthy (Sensitive)"
-    elif aqi <= 200: return "🔴 Unhealthy"
-    elif aqi <= 300: return "🟣 Very Unhealthy"
-    else: return "⚫ Hazardous"
 
-def highlight_aqi(val):
-        if val <= 50: return 'background-color: #c6f7d0; color: black'      # Green
-        elif val <= 100: return 'background-color: #fffacc; color: black'   # Yellow
-        elif val <= 150: return 'background-color: #ffd3a3; color: black'   # Orange
-        elif val <= 200: return 'background-color: #ff9999; color: black'   # Red
-        elif val <= 300: return 'background-color: #d6a5ff; color: white'   # Purple
-        else: return 'background-color: #3a3a3a; color: white'              # Black
+@st.cache_data
+def shap_importance(path, mtime, city_code):
+    shap_df = load_shap_values(path, mtime)
+    values = shap_df.loc[shap_df["city"] == city_code, shap_df.columns.str.startswith("shap_")]
+    importance = values.abs().mean().sort_values(ascending=False)
+    importance.index = importance.index.str.removeprefix("shap_")
+    return importance.rename_axis("feature").reset_index(name="mean_abs_shap")
 
 
-# elif page == "SHAP & EDA Tabs":
+@st.cache_data
+def shap_beeswarm(path, mtime, predictions_path, city_code):
+    # Long format (time, feature, shap_value, feature_value) for one city, with the
+    # feature value min-max scaled per feature for coloring and a fixed jitter
+    shap_df = load_shap_values(path, mtime)
+    shap_df = shap_df[shap_df["city"] == city_code].drop(columns=["city"])
+    features = city_frame(predictions_path, os.path.getmtime(predictions_path), city_code)
+    shap_df = shap_df.rename(columns=lambda c: c.removeprefix("shap_"))
+    feature_cols = [c for c in shap_df.columns if c not in ("time", "base_value")]
+    long = shap_df.melt(id_vars=["time", "base_value"], value_vars=feature_cols,
+                        var_name="feature", value_name="shap_value")
+    values = features.melt(id_vars=["time"], value_vars=feature_cols, var_name="feature", value_name="feature_value")
+    long = long.merge(values, on=["time", "feature"], how="left")
+    grouped = long.groupby("feature")["feature_value"]
+    span = (grouped.transform("max") - grouped.transform("min")).replace(0, 1)
+    long["feature_value_scaled"] = (long["feature_value"] - grouped.transform("min")) / span
+    long["jitter"] = np.random.default_rng(0).uniform(-0.3, 0.3, len(long))
+    return long
 
-# --- Three Tabs UI ---
-tab1, tab2, tab3 = st.tabs(["📈 Forecast", "🧠 SHAP", "🔬 EDA"])
 
-# --- Forecast Tab ---
-with tab1:
-    # Show metrics
-    latest_aqi = city_df.iloc[-1]["predicted_us_aqi"]
-    st.metric("Latest Predicted AQI", f"{latest_aqi:.1f}", help=get_aqi_color(latest_aqi))
+@st.cache_data
+def shap_summary_hires(path, mtime, predictions_mtime, city_code, city_name):
+    return render.shap_summary_bytes(city_code, city_name, shap_path=path, predictions_path=PREDICTIONS_PATH)
 
-    if latest_aqi > 150:
-        st.warning("🚨 Air quality may be hazardous in the coming hours!")
 
-    # Plot forecast
-    st.subheader(f"📈 AQI Forecast (Next 72 Hours) - {city_select}")
-    fig, ax = plt.subplots(figsize=(10, 5))
+# --- Prediction data and figures (cached per file version, city and feature) ---
+# Plotting libraries are imported inside the functions that draw, so a rerun served
+# from the cache (and a cold boot) never loads matplotlib, seaborn or plotly.
+@st.cache_data
+def load_predictions(path, mtime):
+    # Sorted by city so each city is one contiguous block of rows
+    return pd.read_csv(path, parse_dates=["time"]).sort_values("city", kind="stable", ignore_index=True)
+
+
+@st.cache_data
+def load_dashboard(path, mtime):
+    # Aggregates precomputed by predict.py (dashboard.py): summary, bands, corr, histograms
+    return load_aggregates(path)
+
+
+@st.cache_data
+def city_frame(path, mtime, city_code):
+    df = load_predictions(path, mtime)
+    cities = load_registry()
+    starts, stops = cities.slices(df["city"])
+    i = cities.position(city_code)
+    return df.iloc[starts[i]:stops[i]].reset_index(drop=True)
+
+
+@st.cache_data
+def prediction_table(path, mtime, city_code):
+    display_df = city_frame(path, mtime, city_code).round(1)
+    display_df["AQI Level"] = aqi_label(display_df["predicted_us_aqi"])
+    cols_to_drop = ["city", "month", "hour", "dayofweek"]
+    cols_to_show_first = ["time", "predicted_us_aqi", "AQI Level"]
+    cols_to_show_first += [col for col in (LOWER_COLUMN, UPPER_COLUMN) if col in display_df.columns]
+    display_df = display_df.drop(columns=[col for col in cols_to_drop if col in display_df.columns])
+    other_cols = [col for col in display_df.columns if col not in cols_to_show_first]
+    return display_df[cols_to_show_first + other_cols]
+
+
+def _png_bytes(fig):
+    import matplotlib.pyplot as plt
+
+    buf = BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+@st.cache_data
+def forecast_png(path, mtime, city_code, city_name):
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
     from matplotlib.collections import LineCollection
     import matplotlib.colors as mcolors
     import matplotlib as mpl
-    x = city_df["time"].values
+
+    city_df = city_frame(path, mtime, city_code)
+    fig, ax = plt.subplots(figsize=(10, 5))
     y = city_df["predicted_us_aqi"].values
     x_num = mpl.dates.date2num(city_df["time"])
     points = np.array([x_num, y]).T.reshape(-1, 1, 2)
@@ -70,7 +117,11 @@ with tab1:
     lc.set_array(y)
     lc.set_linewidth(3)
     line = ax.add_collection(lc)
-    scatter = ax.scatter(city_df["time"], y, c=y, cmap="plasma", s=80, edgecolor="white", zorder=3)
+    if UPPER_COLUMN in city_df:
+        ax.fill_between(city_df["time"], city_df[LOWER_COLUMN], city_df[UPPER_COLUMN],
+                        color="#7e57c2", alpha=0.15, linewidth=0, zorder=1, label=f"{COVERAGE:.0%} interval")
+        ax.legend(loc="upper left", frameon=False)
+    ax.scatter(city_df["time"], y, c=y, cmap="plasma", s=80, edgecolor="white", zorder=3)
     cbar = fig.colorbar(line, ax=ax, orientation="vertical", pad=0.02)
     cbar.set_label("Predicted AQI", fontsize=12)
     ax.xaxis.set_major_formatter(mdates.DateFormatter("%b %d\n%H:%M"))
@@ -78,35 +129,142 @@ with tab1:
     fig.autofmt_xdate(rotation=45)
     ax.set_ylabel("Predicted AQI", fontsize=13)
     ax.set_xlabel("Time", fontsize=13)
-    ax.set_title(f"Predicted AQI Trend - {city_select}", fontsize=16, color="#333333", pad=15)
+    ax.set_title(f"Predicted AQI Trend - {city_name}", fontsize=16, color="#333333", pad=15)
     ax.grid(axis="y", linestyle="--", alpha=0.7)
     ax.set_facecolor("#f7f7fa")
     fig.patch.set_facecolor("#f7f7fa")
     ax.spines["top"].set_visible(False)
     ax.spines["right"].set_visible(False)
+    return _png_bytes(fig)
+
+
+@st.cache_data
+def correlation_png(path, mtime, city_code):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    corr = load_dashboard(path, mtime)["cities"][str(city_code)]["corr"]
+    corr = pd.DataFrame(corr["values"], index=corr["columns"], columns=corr["columns"])
+    mask = np.triu(np.ones_like(corr, dtype=bool))
+    fig, ax = plt.subplots(figsize=(10, 8))
+    sns.heatmap(
+        corr,
+        mask=mask,
+        cmap="viridis",
+        vmin=-1,
+        vmax=1,
+        annot=True,
+        fmt=".2f",
+        linewidths=0.5,
+        square=True,
+        cbar_kws={"shrink": 0.75},
+        ax=ax
+    )
+    return _png_bytes(fig)
+
+
+@st.cache_data
+def distribution_png(path, mtime, city_code, feature):
+    # Bin counts come precomputed; weights redraw them as the same 30-bin histogram
+    import matplotlib.pyplot as plt
+
+    hist = load_dashboard(path, mtime)["cities"][str(city_code)]["histograms"][feature]
+    edges = np.asarray(hist["edges"])
+    fig, ax = plt.subplots(figsize=(8, 4))
+    n, bins, patches = ax.hist(
+        edges[:-1],
+        bins=edges,
+        weights=hist["counts"],
+        edgecolor="white",
+        alpha=0.85
+    )
+    for patch, color in zip(patches, plt.cm.plasma(np.linspace(0.2, 0.8, len(patches)))):
+        patch.set_facecolor(color)
+    ax.set_title(f"Distribution of {feature}", fontsize=15, color="#333333")
+    ax.set_xlabel(feature, fontsize=12)
+    ax.set_ylabel("Frequency", fontsize=12)
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    return _png_bytes(fig)
+
+
+def trend_figure(city_df, feature):
+    import plotly.express as px
+
+    fig = px.line(city_df, x="time", y=feature, title=f"Trend of {feature} over Time", markers=True)
+    fig.update_traces(line_color="green")
+    fig.update_layout(xaxis_title="Time", yaxis_title=feature, height=400)
+    return fig
+
+
+@st.cache_data
+def trend_png(path, mtime, city_code, feature):
+    # Only called when the download is requested; needs kaleido
+    return trend_figure(city_frame(path, mtime, city_code), feature).to_image(format="png")
+
+
+# Prediction data version: cached frames and figures are reused until the CSV changes
+predictions_mtime = os.path.getmtime(PREDICTIONS_PATH)
+aggregates_mtime = os.path.getmtime(AGGREGATES_PATH)
+
+# City selection (registry order, first city by default); only cities the last
+# forecast run covered are offered
+cities = load_registry()
+aggregates = load_dashboard(AGGREGATES_PATH, aggregates_mtime)
+forecast_codes = np.array([int(code) for code in aggregates["cities"]])
+city_options = cities.names[np.isin(cities.codes, forecast_codes)].tolist()
+city_select = st.selectbox("Select City", city_options, index=0, key="city_select")
+selected_city_code = cities.code(city_select)
+city_df = city_frame(PREDICTIONS_PATH, predictions_mtime, selected_city_code)
+city_stats = aggregates["cities"][str(selected_city_code)]
+
+# Set up Streamlit app
+st.set_page_config(page_title="72-Hour AQI Forecast", layout="centered")
+st.title(f"🌫️ 72-Hour Air Quality Forecast for {city_select}")
+
+# elif page == "SHAP & EDA Tabs":
+
+# --- Three Tabs UI ---
+tab1, tab2, tab3 = st.tabs(["📈 Forecast", "🧠 SHAP", "🔬 EDA"])
+
+# --- Forecast Tab ---
+with tab1:
+    # Show metrics
+    summary = city_stats["summary"]
+    latest_aqi = summary["latest_aqi"]
+    band_help = summary["latest_band"]
+    if "latest_upper" in summary:
+        band_help += f" · {COVERAGE:.0%} interval {summary['latest_lower']:.0f}–{summary['latest_upper']:.0f}"
+    st.metric("Latest Predicted AQI", f"{latest_aqi:.1f}", help=band_help)
+    st.caption(f"Peak {summary['max_aqi']:.1f} at {pd.Timestamp(summary['max_time']):%b %d %H:%M} · "
+               f"{summary['hours_above_alert']} of {summary['hours']} hours above {ALERT_AQI}")
+
+    if latest_aqi > ALERT_AQI:
+        st.warning("🚨 Air quality may be hazardous in the coming hours!")
+    elif summary.get("first_upper_alert_time"):
+        st.warning(f"⚠️ AQI could exceed {ALERT_AQI} from "
+                   f"{pd.Timestamp(summary['first_upper_alert_time']):%b %d %H:%M} "
+                   f"({summary['hours_upper_above_alert']} hours above it at the upper end of the "
+                   f"{COVERAGE:.0%} interval)")
+
+    # Plot forecast (rendered once per city and predictions file)
+    st.subheader(f"📈 AQI Forecast (Next 72 Hours) - {city_select}")
+    st.image(forecast_png(PREDICTIONS_PATH, predictions_mtime, selected_city_code, city_select),
+             use_container_width=True)
 
     # Download button for forecast plot
-    buf = BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight")
-    st.pyplot(fig)
     st.download_button(
         label="Download Forecast Plot as PNG",
-        data=buf.getvalue(),
+        data=lambda: forecast_png(PREDICTIONS_PATH, predictions_mtime, selected_city_code, city_select),
         file_name=f"aqi_forecast_{city_select.lower()}.png",
         mime="image/png"
     )
 
     # Show table
-    display_df = city_df.copy()
-    display_df = display_df.round(1)
-    display_df["AQI Level"] = display_df["predicted_us_aqi"].apply(get_aqi_color)
-    cols_to_drop = ["city", "month", "hour", "dayofweek"]
-    cols_to_show_first = ["time", "predicted_us_aqi", "AQI Level"]
-    display_df = display_df.drop(columns=[col for col in cols_to_drop if col in display_df.columns])
-    other_cols = [col for col in display_df.columns if col not in cols_to_show_first]
-    display_df = display_df[cols_to_show_first + other_cols]
-    styled_df = display_df.style.format(precision=1).map(
-        highlight_aqi, subset=["predicted_us_aqi"]
+    display_df = prediction_table(PREDICTIONS_PATH, predictions_mtime, selected_city_code)
+    styled_df = display_df.style.format(precision=1).apply(
+        aqi_style, subset=["predicted_us_aqi"]
     )
     st.markdown("<div style='height: 100px;'></div>", unsafe_allow_html=True)
     st.markdown("<br>", unsafe_allow_html=True)
@@ -115,79 +273,91 @@ with tab1:
 
 # --- SHAP Tab ---
 with tab2:
-    st.subheader(f"SHAP Summary Plot - {city_select}")
-    import os
-    shap_img_path = f"data/shap_summary_{city_select.lower()}.png"
-    if os.path.exists(shap_img_path):
-        st.image(shap_img_path, caption=f"Feature impact on AQI prediction for {city_select}", use_container_width=True)
-        with open(shap_img_path, "rb") as img_file:
-            st.download_button(
-                label="Download SHAP Summary Plot",
-                data=img_file,
-                file_name=f"shap_summary_{city_select.lower()}.png",
-                mime="image/png"
+    shap_view = st.radio("SHAP view", ["Interactive", "Summary image"], horizontal=True, key="shap_view")
+    if shap_view == "Interactive":
+        import plotly.express as px
+
+        st.subheader(f"🧠 Feature Impact - {city_select}")
+        if os.path.exists(SHAP_VALUES_PATH):
+            shap_mtime = os.path.getmtime(SHAP_VALUES_PATH)
+            importance = shap_importance(SHAP_VALUES_PATH, shap_mtime, selected_city_code)
+            fig = px.bar(
+                importance, x="mean_abs_shap", y="feature", orientation="h",
+                title="Mean |SHAP value| (average impact on predicted AQI)",
+            )
+            fig.update_layout(yaxis={"categoryorder": "total ascending"}, height=450,
+                              xaxis_title="mean(|SHAP value|)", yaxis_title="")
+            st.plotly_chart(fig, use_container_width=True)
+
+            swarm = shap_beeswarm(SHAP_VALUES_PATH, shap_mtime, PREDICTIONS_PATH, selected_city_code)
+            order = importance["feature"].tolist()[::-1]
+            fig = px.scatter(
+                swarm, x="shap_value", y=swarm["feature"].map({f: i for i, f in enumerate(order)}) + swarm["jitter"],
+                color="feature_value_scaled", color_continuous_scale="RdBu_r",
+                hover_data={"feature": True, "time": True, "feature_value": True, "feature_value_scaled": False},
+                title="SHAP beeswarm (color = feature value, low → high)",
             )
+            fig.update_layout(height=550, xaxis_title="SHAP value (impact on predicted AQI)", yaxis_title="",
+                              yaxis={"tickmode": "array", "tickvals": list(range(len(order))), "ticktext": order},
+                              coloraxis_colorbar={"title": "Feature value"})
+            fig.add_vline(x=0, line_color="gray", line_width=1)
+            st.plotly_chart(fig, use_container_width=True)
+
+            st.subheader("🔎 Drill Down by Hour")
+            hours = sorted(swarm["time"].unique())
+            hour = st.select_slider("Forecast hour", options=hours, value=hours[0],
+                                    format_func=lambda t: pd.Timestamp(t).strftime("%b %d %H:%M"), key="shap_hour")
+            hour_df = swarm[swarm["time"] == hour].sort_values("shap_value", key=abs)
+            fig = px.bar(hour_df, x="shap_value", y="feature", orientation="h", color="shap_value",
+                         color_continuous_scale="RdBu_r", color_continuous_midpoint=0,
+                         title=f"Contributions at {pd.Timestamp(hour):%b %d %H:%M}")
+            fig.update_layout(height=450, xaxis_title="SHAP value", yaxis_title="", coloraxis_showscale=False)
+            st.plotly_chart(fig, use_container_width=True)
+            st.caption(f"Base value {hour_df['base_value'].iloc[0]:.1f} + contributions "
+                       f"{hour_df['shap_value'].sum():+.1f} = predicted AQI "
+                       f"{hour_df['base_value'].iloc[0] + hour_df['shap_value'].sum():.1f}")
+        else:
+            st.info("SHAP values not available yet. Please run the prediction script first.")
     else:
-        st.info("SHAP plot not available yet. Please run the prediction script first.")
+        st.subheader(f"SHAP Summary Plot - {city_select}")
+        # Thumbnail rendered by predict.py (any format); the download is drawn at full resolution on demand
+        shap_img_path = next((path for path in (render.shap_summary_path(city_select, fmt) for fmt in ("png", "webp", "jpg"))
+                              if os.path.exists(path)), None)
+        if shap_img_path:
+            st.image(shap_img_path, caption=f"Feature impact on AQI prediction for {city_select}", use_container_width=True)
+            if os.path.exists(SHAP_VALUES_PATH):
+                shap_mtime = os.path.getmtime(SHAP_VALUES_PATH)
+                st.download_button(
+                    label=f"Download SHAP Summary Plot ({render.HIRES_DPI} dpi)",
+                    data=lambda: shap_summary_hires(SHAP_VALUES_PATH, shap_mtime, predictions_mtime,
+                                                    selected_city_code, city_select),
+                    file_name=f"shap_summary_{city_select.lower()}.png",
+                    mime="image/png"
+                )
+        else:
+            st.info("SHAP plot not available yet. Run `python predict.py --shap-png` to render it.")
 
 # --- EDA Tab ---
 with tab3:
     st.subheader("📊 Correlation Heatmap")
-    exclude_cols = ["time", "timestamp", "city", "month", "AQI Level"]
-    numeric_cols = city_df.select_dtypes(include="number").columns.difference(exclude_cols)
-    corr = city_df[numeric_cols].corr()
-    mask = np.triu(np.ones_like(corr, dtype=bool))
-    fig, ax = plt.subplots(figsize=(10, 8))
-    sns.heatmap(
-        corr,
-        mask=mask,
-        cmap="viridis",
-        vmin=-1,
-        vmax=1,
-        annot=True,
-        fmt=".2f",
-        linewidths=0.5,
-        square=True,
-        cbar_kws={"shrink": 0.75},
-        ax=ax
-    )
+    st.image(correlation_png(AGGREGATES_PATH, aggregates_mtime, selected_city_code), use_container_width=True)
 
     # Download button for correlation heatmap
-    buf_corr = BytesIO()
-    fig.savefig(buf_corr, format="png", bbox_inches="tight")
-    st.pyplot(fig)
     st.download_button(
         label="Download Correlation Heatmap as PNG",
-        data=buf_corr.getvalue(),
+        data=lambda: correlation_png(AGGREGATES_PATH, aggregates_mtime, selected_city_code),
         file_name=f"correlation_heatmap_{city_select.lower()}.png",
         mime="image/png"
     )
 
     st.subheader("📉 Feature Distribution")
-    feature_cols = city_df.columns.drop(["time", "AQI Level", "predicted_us_aqi", "city"], errors="ignore")
+    feature_cols = list(city_stats["histograms"])
     dist_feat = st.selectbox("Select feature for distribution plot", feature_cols, key="dist_feat")
     if dist_feat:
-        fig, ax = plt.subplots(figsize=(8, 4))
-        n, bins, patches = ax.hist(
-            city_df[dist_feat].dropna(),
-            bins=30,
-            edgecolor="white",
-            alpha=0.85
-        )
-        for patch, color in zip(patches, plt.cm.plasma(np.linspace(0.2, 0.8, len(patches)))):
-            patch.set_facecolor(color)
-        ax.set_title(f"Distribution of {dist_feat}", fontsize=15, color="#333333")
-        ax.set_xlabel(dist_feat, fontsize=12)
-        ax.set_ylabel("Frequency", fontsize=12)
-        ax.grid(axis="y", linestyle="--", alpha=0.7)
-        ax.spines["top"].set_visible(False)
-        ax.spines["right"].set_visible(False)
-        buf_dist = BytesIO()
-        fig.savefig(buf_dist, format="png", bbox_inches="tight")
-        st.pyplot(fig)
+        st.image(distribution_png(AGGREGATES_PATH, aggregates_mtime, selected_city_code, dist_feat))
         st.download_button(
             label=f"Download Distribution Plot as PNG",
-            data=buf_dist.getvalue(),
+            data=lambda: distribution_png(AGGREGATES_PATH, aggregates_mtime, selected_city_code, dist_feat),
             file_name=f"distribution_{dist_feat}_{city_select.lower()}.png",
             mime="image/png"
         )
@@ -196,20 +366,16 @@ with tab3:
     ts_cols = city_df.columns.drop(["AQI Level","time"], errors="ignore")
     ts_feat = st.selectbox("Select feature for time-series trend", ts_cols, key="ts_feat")
     if ts_feat:
-        fig = px.line(city_df, x="time", y=ts_feat, title=f"Trend of {ts_feat} over Time", markers=True)
-        fig.update_traces(line_color="green")
-        fig.update_layout(xaxis_title="Time", yaxis_title=ts_feat, height=400)
-        st.plotly_chart(fig, use_container_width=True)
-        # Download button for plotly figure
-        try:
-            img_bytes = fig.to_image(format="png")
+        st.plotly_chart(trend_figure(city_df, ts_feat), use_container_width=True)
+        # Download button for plotly figure (exported only when clicked)
+        if importlib.util.find_spec("kaleido"):
             st.download_button(
                 label=f"Download Time-Series Trend as PNG",
-                data=img_bytes,
+                data=lambda: trend_png(PREDICTIONS_PATH, predictions_mtime, selected_city_code, ts_feat),
                 file_name=f"timeseries_{ts_feat}_{city_select.lower()}.png",
                 mime="image/png"
             )
-        except Exception:
+        else:
             st.info("Plotly image export requires kaleido. Install with: pip install -U kaleido")
 
     # st.subheader("📆 Time-Series Feature Trend")
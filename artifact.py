@@ -0,0 +1,116 @@
+import hashlib
+import sys
+
+import numpy as np
+
+# Minimal inference artifacts: plain NumPy arrays in an .npz, loadable and scorable
+# without importing sklearn or unpickling estimators.
+#   linear:   coef, intercept
+#   forest:   flattened nodes of every tree, prediction = mean over trees
+#   boosting: flattened nodes of every stage, prediction = init + learning_rate * sum
+
+
+def schema_hash(features):
+    return hashlib.sha1(",".join(features).encode()).hexdigest()[:16]
+
+
+def _flatten_trees(trees):
+    # Concatenate sklearn tree_ arrays into global node arrays; child ids are offset
+    # so every tree indexes into the same arrays, and leaves point to themselves
+    left, right, feature, threshold, value, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for tree in trees:
+        t = tree.tree_
+        ids = np.arange(t.node_count)
+        is_leaf = t.children_left == -1
+        left.append(np.where(is_leaf, ids, t.children_left) + offset)
+        right.append(np.where(is_leaf, ids, t.children_right) + offset)
+        feature.append(np.where(is_leaf, 0, t.feature))
+        threshold.append(t.threshold)
+        value.append(t.value[:, 0, 0])
+        roots.append(offset)
+        offset += t.node_count
+        max_depth = max(max_depth, t.max_depth)
+    return {
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold),
+        "value": np.concatenate(value),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "max_depth": max_depth,
+    }
+
+
+def export_model(model, path, features=None):
+    """Write `model` (LinearRegression/Ridge/RandomForest/GradientBoosting) as an .npz artifact."""
+    features = list(features if features is not None else model.feature_names_in_)
+    arrays = {"features": np.asarray(features), "schema_hash": schema_hash(features)}
+    if hasattr(model, "coef_"):
+        arrays.update(kind="linear", coef=np.ravel(model.coef_), intercept=float(np.ravel(model.intercept_)[0]))
+    elif hasattr(model, "init_"):
+        init = model.init_.predict(np.zeros((1, len(features))))
+        arrays.update(
+            kind="boosting",
+            init=float(np.ravel(init)[0]),
+            learning_rate=float(model.learning_rate),
+            **_flatten_trees(model.estimators_[:, 0]),
+        )
+    elif hasattr(model, "estimators_"):
+        arrays.update(kind="forest", **_flatten_trees(model.estimators_))
+    else:
+        raise ValueError(f"Unsupported model type: {type(model).__name__}")
+    np.savez(path, **arrays)
+    return path
+
+
+class Artifact:
+    # Loaded inference artifact; predict() mirrors the sklearn estimator it came from
+
+    def __init__(self, arrays):
+        self.kind = str(arrays["kind"])
+        self.features = [str(f) for f in arrays["features"]]
+        self.schema_hash = str(arrays["schema_hash"])
+        self.arrays = {k: arrays[k] for k in arrays.files}
+
+    def check_schema(self, X):
+        # Column order must match training exactly, like sklearn's feature-name check
+        columns = list(getattr(X, "columns", self.features))
+        if columns != self.features:
+            raise ValueError(f"Feature mismatch: expected {self.features}, got {columns}")
+
+    def predict(self, X):
+        self.check_schema(X)
+        a = self.arrays
+        if self.kind == "linear":
+            return np.asarray(X, dtype=np.float64) @ a["coef"] + float(a["intercept"])
+        leaves = self._leaf_values(np.asarray(X, dtype=np.float32))
+        if self.kind == "forest":
+            return leaves.mean(axis=1)
+        return float(a["init"]) + float(a["learning_rate"]) * leaves.sum(axis=1)
+
+    def _leaf_values(self, X):
+        # Walk every (row, tree) pair down one level per step; leaves are fixed points
+        a = self.arrays
+        nodes = np.broadcast_to(a["roots"], (len(X), len(a["roots"]))).copy()
+        rows = np.arange(len(X))[:, None]
+        for _ in range(int(a["max_depth"])):
+            go_left = X[rows, a["feature"][nodes]] <= a["threshold"][nodes]
+            nodes = np.where(go_left, a["left"][nodes], a["right"][nodes])
+        return a["value"][nodes]
+
+
+def load_artifact(path):
+    with np.load(path) as arrays:
+        return Artifact(arrays)
+
+
+if __name__ == "__main__":
+    # Export existing pickled models: python artifact.py model/RidgeRegression.joblib ...
+    import joblib
+
+    for path in sys.argv[1:]:
+        out = path.rsplit(".", 1)[0] + ".npz"
+        export_model(joblib.load(path), out)
+        print(f"✅ Exported {path} -> {out}")
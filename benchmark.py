@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import mock_openmeteo
+
+# Offline, reproducible benchmark of the data and model pipeline. A local
+# mock_openmeteo server stands in for the APIs (optionally with latency and
+# injected errors), synthetic store history stands in for the feature store, and
+# every stage is timed on a grid of city counts x history lengths:
+#   fetch (cold / cached) -> merge -> store append -> upsert -> read
+#   -> train model.py's four models -> score each exported artifact
+# Results go to benchmarks/results/<commit>.json; `--compare` diffs two runs.
+
+# --- Config ---
+RESULTS_DIR = "benchmarks/results"
+CITY_COUNTS = [3, 30, 300]
+HISTORY_DAYS = [90, 365, 1825]     # 3 months, 1 year, 5 years
+FETCH_DAYS = 2                     # window fetched per run, like the hourly backfill
+HORIZON = 72                       # hours scored per city
+MAX_ROWS = 3_000_000               # larger scenarios are recorded as skipped (--max-rows to raise)
+MAX_TRAIN_ROWS = 200_000           # newest rows used for the model fits
+HISTORY_END = pd.Timestamp("2025-01-01")   # fixed so runs are comparable across commits
+
+
+def synthetic_cities(n):
+    # Spread over a lat/lon grid so every city gets its own synthetic series
+    side = int(np.ceil(np.sqrt(n)))
+    return [
+        {"city_code": i, "name": f"City{i}", "lat": round(10 + 0.5 * (i // side), 2),
+         "lon": round(60 + 0.5 * (i % side), 2), "tz": "GMT"}
+        for i in range(n)
+    ]
+
+
+def synthetic_history(cities, days, end=HISTORY_END):
+    """Store-schema rows for `cities` over the `days` before `end`, same generator as the mock."""
+    import feature_store
+
+    times = pd.date_range(end - pd.Timedelta(days=days), end, freq="h", inclusive="left")
+    hours = times.asi8 // 3_600_000_000_000
+    frames = []
+    for city in cities:
+        df = pd.DataFrame({"time": times})
+        for column in list(feature_store.COLUMNS)[1:13]:
+            df[column] = mock_openmeteo.synthetic_series(city["lat"], city["lon"], column, hours)
+        df["dayofweek"], df["hour"], df["month"] = times.dayofweek, times.hour, times.month
+        df["city"] = city["city_code"]
+        frames.append(df)
+    return feature_store.compact(pd.concat(frames, ignore_index=True))
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import sklearn
+
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+class Recorder:
+    # Collects one result row per (scenario, stage)
+
+    def __init__(self):
+        self.rows = []
+
+    def time(self, scenario, stage, fn, rows=None, **extra):
+        start = time.perf_counter()
+        out = fn()
+        seconds = time.perf_counter() - start
+        n = rows(out) if callable(rows) else rows
+        self.add(scenario, stage, seconds, n, **extra)
+        return out
+
+    def add(self, scenario, stage, seconds, rows=None, **extra):
+        row = {**scenario, "stage": stage, "seconds": round(seconds, 6), "rows": rows,
+               "rows_per_s": round(rows / seconds) if rows and seconds else None,
+               "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1), **extra}
+        self.rows.append(row)
+        rate = f", {row['rows_per_s']:,} rows/s" if row["rows_per_s"] else ""
+        print(f"⏱️ {scenario['cities']:>4} cities x {scenario['history_days']:>4}d  {stage:<28} {seconds:9.3f} s{rate}")
+
+
+def run_scenario(recorder, n_cities, days, args, workdir):
+    from fetch import fetch_city_frames, merge_city_frames
+    from http_client import get_session
+    import feature_store
+    from artifact import export_model, load_artifact
+    from model import build_models
+    from predict import score
+    from training import FEATURES, TARGET, train_parallel
+
+    scenario = {"cities": n_cities, "history_days": days}
+    rows = n_cities * days * 24
+    if rows > args.max_rows:
+        print(f"⚠️ Skipping {n_cities} cities x {days}d ({rows:,} rows > --max-rows {args.max_rows:,})")
+        recorder.add(scenario, "skipped", 0.0, rows)
+        return
+
+    cities = synthetic_cities(n_cities)
+    params = {
+        "start_date": (HISTORY_END - pd.Timedelta(days=args.fetch_days)).date().isoformat(),
+        "end_date": (HISTORY_END - pd.Timedelta(days=1)).date().isoformat(),
+    }
+    fetch = lambda: fetch_city_frames(cities, params, weather_format=args.weather_format)
+    count = lambda frames: sum(len(aq) for _, aq, _ in frames)
+    get_session().cache.clear()
+    frames = recorder.time(scenario, "fetch_cold", fetch, count)
+    recorder.time(scenario, "fetch_cached", fetch, count)
+    merged = recorder.time(
+        scenario, "merge",
+        lambda: pd.concat([merge_city_frames(aq, weather, city["city_code"]) for city, aq, weather in frames]),
+        len,
+    )
+
+    history = recorder.time(scenario, "synthesize_history", lambda: synthetic_history(cities, days), len)
+    root = os.path.join(workdir, f"store_{n_cities}_{days}")
+    stats = recorder.time(scenario, "store_append", lambda: feature_store.append(history, root=root), len(history))
+    recorder.rows[-1]["partitions"] = stats["partitions"]
+    # The fetched window overlaps the newest stored hours, so this is a dedup/upsert
+    recorder.time(scenario, "store_upsert", lambda: feature_store.append(merged, root=root), len(merged))
+    df = recorder.time(scenario, "store_read", lambda: feature_store.read(root=root), len)
+
+    train_df = df.sort_values("time", kind="stable").tail(args.max_train_rows)
+    split = int(len(train_df) * 0.8)
+    X_train, y_train = train_df[FEATURES].iloc[:split], train_df[TARGET].iloc[:split]
+    X_test, y_test = train_df[FEATURES].iloc[split:], train_df[TARGET].iloc[split:]
+    fitted = recorder.time(
+        scenario, "train_all",
+        lambda: train_parallel(build_models(), X_train, y_train, X_test, y_test, n_jobs=args.n_jobs),
+        len(X_train),
+    )
+    for name, (model, _, row) in fitted.items():
+        recorder.add(scenario, f"fit:{name}", row["fit_s"], len(X_train), mae=round(row["MAE"], 3))
+
+    # Score HORIZON hours per city with each model's NumPy artifact, like predict.py
+    features = df.groupby("city", sort=False).tail(HORIZON).set_index("time")
+    for name, (model, _, _) in fitted.items():
+        path = export_model(model, os.path.join(workdir, f"{name}.npz"), FEATURES)
+        artifact = load_artifact(path)
+        recorder.time(scenario, f"score:{name}", lambda: score(features, artifact), len(features))
+
+
+def run(args):
+    """Run the benchmark grid against an in-process mock server; returns the result record."""
+    server = mock_openmeteo.start_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                         error_rate=args.error_rate, recordings_dir=args.recordings)
+    workdir = tempfile.mkdtemp(prefix="aqi_bench_")
+    # Must be set before fetch/http_client are imported
+    os.environ["AQI_AIR_QUALITY_URL"] = f"{server.url}/v1/air-quality"
+    os.environ["AQI_WEATHER_URL"] = f"{server.url}/v1/forecast"
+    os.environ["AQI_HTTP_CACHE"] = os.path.join(workdir, "http_cache")
+
+    recorder = Recorder()
+    try:
+        for n_cities in args.cities:
+            for days in args.days:
+                run_scenario(recorder, n_cities, days, args, workdir)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "environment": environment(),
+        "config": {
+            "cities": args.cities, "history_days": args.days, "fetch_days": args.fetch_days,
+            "weather_format": args.weather_format, "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms, "error_rate": args.error_rate, "max_rows": args.max_rows,
+            "max_train_rows": args.max_train_rows, "n_jobs": args.n_jobs,
+            "mock_requests": server.requests, "mock_errors": server.errors,
+        },
+        "results": recorder.rows,
+    }
+
+
+def compare(base_path, new_path):
+    # Per-stage wall-time ratio new/base for the scenarios both runs have
+    frames = []
+    for path in (base_path, new_path):
+        with open(path) as f:
+            frames.append(pd.DataFrame(json.load(f)["results"]).set_index(["cities", "history_days", "stage"])["seconds"])
+    table = pd.concat(frames, axis=1, keys=["base_s", "new_s"], join="inner")
+    table = table[table["base_s"] > 0]
+    table["ratio"] = table["new_s"] / table["base_s"]
+    print(table.round(3).to_string())
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark against a mock Open-Meteo server")
+    parser.add_argument("--cities", type=int, nargs="+", default=CITY_COUNTS)
+    parser.add_argument("--days", type=int, nargs="+", default=HISTORY_DAYS, help="synthetic history lengths")
+    parser.add_argument("--fetch-days", type=int, default=FETCH_DAYS)
+    parser.add_argument("--weather-format", choices=["flatbuffers", "json"], default="flatbuffers")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--recordings", default=mock_openmeteo.RECORDINGS_DIR)
+    parser.add_argument("--max-rows", type=int, default=MAX_ROWS)
+    parser.add_argument("--max-train-rows", type=int, default=MAX_TRAIN_ROWS)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--out", help=f"result file (default {RESULTS_DIR}/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    record = run(args)
+    out = args.out or os.path.join(RESULTS_DIR, f"{record['environment']['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(record, f, indent=2)
+    print(f"✅ {len(record['results'])} results -> {out}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+# --- Config ---
+# One config file lists every location; override with AQI_CITIES=path/to/cities.json
+CONFIG_PATH = os.environ.get("AQI_CITIES", "cities.json")
+DEFAULT_BATCH_SIZE = 50
+MAX_CITY_CODE = np.iinfo(np.int16).max   # city codes are stored as int16 in the feature store
+
+
+class CityRegistry:
+    """Cities from the config file, held as parallel arrays in code order.
+
+    Codes are stable integers (they are what the feature store, the models and the
+    prediction files use); a dense code -> position table makes lookups O(1) per
+    city and vectorizable over whole columns of codes.
+    """
+
+    def __init__(self, cities, batch_size=DEFAULT_BATCH_SIZE):
+        cities = sorted(cities, key=lambda c: c["city_code"])
+        codes = np.array([c["city_code"] for c in cities], dtype=np.int64)
+        if len(codes) == 0:
+            raise ValueError("City registry is empty")
+        if codes.min() < 0 or codes.max() > MAX_CITY_CODE:
+            raise ValueError(f"City codes must be in [0, {MAX_CITY_CODE}]")
+        if len(np.unique(codes)) != len(codes):
+            raise ValueError("Duplicate city codes in registry")
+
+        self.codes = codes
+        self.names = np.array([c["name"] for c in cities], dtype=object)
+        self.lat = np.array([c["lat"] for c in cities], dtype=np.float64)
+        self.lon = np.array([c["lon"] for c in cities], dtype=np.float64)
+        self.tz = np.array([c["tz"] for c in cities], dtype=object)
+        self.batch_size = int(batch_size)
+
+        self._position = np.full(codes.max() + 1, -1, dtype=np.int64)
+        self._position[codes] = np.arange(len(codes))
+        self._by_name = {name.lower(): code for name, code in zip(self.names, codes)}
+        if len(self._by_name) != len(codes):
+            raise ValueError("Duplicate city names in registry")
+
+    def __len__(self):
+        return len(self.codes)
+
+    def position(self, codes):
+        # Row of each code in the registry arrays; unknown codes raise KeyError
+        codes = np.asarray(codes, dtype=np.int64)
+        inside = (codes >= 0) & (codes < len(self._position))
+        positions = np.where(inside, self._position[np.where(inside, codes, 0)], -1)
+        if (positions < 0).any():
+            raise KeyError(f"Unknown city codes: {np.unique(codes[positions < 0]).tolist()}")
+        return positions
+
+    def name(self, code):
+        return self.names[self.position(code)]
+
+    def code(self, name):
+        return int(self._by_name[name.lower()])
+
+    def records(self, codes=None):
+        # Per-city dicts in the shape fetch.fetch_city_frames expects
+        rows = np.arange(len(self)) if codes is None else self.position(codes)
+        return [
+            {"name": self.names[i], "lat": float(self.lat[i]), "lon": float(self.lon[i]),
+             "tz": self.tz[i], "city_code": int(self.codes[i])}
+            for i in np.atleast_1d(rows)
+        ]
+
+    def slices(self, city_column):
+        """(start, stop) row bounds of every registry city in a column sorted by city.
+
+        One searchsorted pass over all codes; afterwards each city's rows are
+        `frame.iloc[start[i]:stop[i]]` with `i = position(code)`.
+        """
+        city_column = np.asarray(city_column)
+        return (np.searchsorted(city_column, self.codes, side="left"),
+                np.searchsorted(city_column, self.codes, side="right"))
+
+
+@lru_cache(maxsize=None)
+def load_registry(path=CONFIG_PATH):
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    return CityRegistry(config["cities"], batch_size=config.get("batch_size", DEFAULT_BATCH_SIZE))
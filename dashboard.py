@@ -0,0 +1,120 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from intervals import LOWER_COLUMN, UPPER_COLUMN
+
+# --- Config ---
+AGGREGATES_PATH = "data/dashboard_aggregates.json"
+PREDICTIONS_PATH = "data/predicted_aqi_72hr.csv"
+HIST_BINS = 30
+
+# US AQI bands: value <= edge[i] falls in band i, anything above the last edge is Hazardous
+AQI_BAND_EDGES = np.array([50, 100, 150, 200, 300])
+AQI_BAND_LABELS = np.array([
+    "🟢 Good", "🟡 Moderate", "🟠 Unhealthy (Sensitive)", "🔴 Unhealthy", "🟣 Very Unhealthy", "⚫ Hazardous",
+])
+AQI_BAND_STYLES = np.array([
+    "background-color: #c6f7d0; color: black",   # Green
+    "background-color: #fffacc; color: black",   # Yellow
+    "background-color: #ffd3a3; color: black",   # Orange
+    "background-color: #ff9999; color: black",   # Red
+    "background-color: #d6a5ff; color: white",   # Purple
+    "background-color: #3a3a3a; color: white",   # Black
+])
+ALERT_AQI = 150
+
+# Columns left out of the correlation matrix and the distribution plots
+CORR_EXCLUDE = ["time", "timestamp", "city", "month", "AQI Level", LOWER_COLUMN, UPPER_COLUMN]
+HIST_EXCLUDE = ["time", "AQI Level", "predicted_us_aqi", "city", LOWER_COLUMN, UPPER_COLUMN]
+
+
+def aqi_band(values):
+    # Band index per value in one vectorized pass (NaN lands in the last band)
+    return np.digitize(np.asarray(values, dtype=np.float64), AQI_BAND_EDGES, right=True)
+
+
+def aqi_label(values):
+    return AQI_BAND_LABELS[aqi_band(values)]
+
+
+def aqi_style(values):
+    return AQI_BAND_STYLES[aqi_band(values)]
+
+
+def _city_aggregates(city_df):
+    aqi = city_df["predicted_us_aqi"].to_numpy(dtype=np.float64)
+    bands = aqi_band(aqi)
+
+    numeric_cols = city_df.select_dtypes(include="number").columns.difference(CORR_EXCLUDE)
+    corr = city_df[numeric_cols].corr()
+
+    histograms = {}
+    for col in city_df.columns.drop(HIST_EXCLUDE, errors="ignore"):
+        values = city_df[col].dropna().to_numpy(dtype=np.float64)
+        counts, edges = np.histogram(values, bins=HIST_BINS)
+        histograms[col] = {"counts": counts.tolist(), "edges": edges.tolist()}
+
+    peak = int(np.argmax(aqi))
+    summary = {
+        "hours": len(aqi),
+        "latest_aqi": float(aqi[-1]),
+        "latest_band": AQI_BAND_LABELS[bands[-1]],
+        "mean_aqi": float(aqi.mean()),
+        "max_aqi": float(aqi[peak]),
+        "max_time": city_df["time"].iloc[peak].isoformat(),
+        "hours_above_alert": int((aqi > ALERT_AQI).sum()),
+        "band_hours": np.bincount(bands, minlength=len(AQI_BAND_LABELS)).tolist(),
+    }
+    if UPPER_COLUMN in city_df:
+        # Alerts also look at the interval's upper bound: hours that could exceed the threshold
+        upper = city_df[UPPER_COLUMN].to_numpy(dtype=np.float64)
+        first = int(np.argmax(upper > ALERT_AQI))
+        summary.update({
+            "latest_lower": float(city_df[LOWER_COLUMN].iloc[-1]),
+            "latest_upper": float(upper[-1]),
+            "max_upper": float(upper.max()),
+            "hours_upper_above_alert": int((upper > ALERT_AQI).sum()),
+            "first_upper_alert_time": city_df["time"].iloc[first].isoformat() if upper[first] > ALERT_AQI else None,
+        })
+    return {
+        "summary": summary,
+        "bands": bands.astype(int).tolist(),
+        "corr": {"columns": corr.columns.tolist(), "values": corr.round(4).to_numpy().tolist()},
+        "histograms": histograms,
+    }
+
+
+def build_aggregates(results):
+    """Per-city summary metrics, AQI band per forecast hour, correlation matrix and
+    histogram bin counts for the dashboard, computed once per forecast run."""
+    results = results.reset_index() if "time" not in results.columns else results
+    return {
+        "generated_at": pd.Timestamp.now(tz="UTC").isoformat(),
+        "band_labels": AQI_BAND_LABELS.tolist(),
+        "cities": {
+            str(city_code): _city_aggregates(city_df.sort_values("time"))
+            for city_code, city_df in results.groupby("city", sort=True)
+        },
+    }
+
+
+def write_aggregates(results, path=AGGREGATES_PATH):
+    aggregates = build_aggregates(results)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(aggregates, f, ensure_ascii=False, separators=(",", ":"))
+    return aggregates
+
+
+def load_aggregates(path=AGGREGATES_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    # Rebuild the aggregates from the saved predictions: python dashboard.py
+    write_aggregates(pd.read_csv(PREDICTIONS_PATH, parse_dates=["time"]))
+    print(f"✅ Saved dashboard aggregates to {AGGREGATES_PATH}")
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+# --- Config ---
+BACKGROUND_PATH = "model/shap_background.npz"
+CACHE_DIR = "data/shap_cache"
+BACKGROUND_SIZE = 100
+
+_background_lock = threading.Lock()   # per-city explain threads share one background file
+
+
+def _hash(*arrays):
+    digest = hashlib.sha1()
+    for a in arrays:
+        digest.update(np.ascontiguousarray(a).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def sample_background(features, n=BACKGROUND_SIZE, seed=42, path=BACKGROUND_PATH):
+    # Fixed background: a seeded sample of training history, saved so every
+    # forecast run explains against the same reference rows
+    import feature_store
+    import lag_features
+
+    lagged = [f for f in features if f in lag_features.FEATURES]
+    if lagged:
+        # Lag features are not stored; derive them from the AQI history
+        stored = [f for f in features if f not in lagged]
+        history = feature_store.read(columns=list(dict.fromkeys(stored + ["time", "city", lag_features.SOURCE])))
+        history = lag_features.add_lag_features(history).dropna(subset=lagged)[features]
+    else:
+        history = feature_store.read(columns=features)
+    sample = history.sample(min(n, len(history)), random_state=seed)
+    values = sample.to_numpy(dtype=np.float32)
+    # Written to a temporary file and swapped in, so readers never see a partial file
+    with open(f"{path}.tmp", "wb") as f:
+        np.savez(f, features=np.asarray(features), values=values)
+    os.replace(f"{path}.tmp", path)
+    return values
+
+
+def _read_background(features, path):
+    if os.path.exists(path):
+        with np.load(path) as data:
+            if [str(f) for f in data["features"]] == list(features):
+                return data["values"]
+    return None
+
+
+def load_background(features, path=BACKGROUND_PATH):
+    values = _read_background(features, path)
+    if values is not None:
+        return values
+    # Missing or stale: sample it once; threads that waited read the new file
+    with _background_lock:
+        values = _read_background(features, path)
+        return values if values is not None else sample_background(features, path=path)
+
+
+class Explainer:
+    """Per-row, per-feature attributions for a model artifact.
+
+    Linear artifacts use the exact closed form coef * (x - background mean);
+    tree models go through shap.TreeExplainer on the pickled estimator. Results
+    are cached per (model hash, input hash).
+    """
+
+    def __init__(self, model, model_path, background=None):
+        self.model = model
+        self.model_path = model_path
+        self.background = background if background is not None else load_background(model.features)
+        self.model_hash = _hash(*(model.arrays[k] for k in sorted(model.arrays)), self.background)
+
+    def compute(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self.model.kind == "linear":
+            coef = self.model.arrays["coef"]
+            mean = self.background.mean(axis=0, dtype=np.float64)
+            base_value = float(mean @ coef + self.model.arrays["intercept"])
+            return coef * (X - mean), base_value
+
+        import joblib
+        import shap
+
+        estimator = joblib.load(self.model_path.rsplit(".", 1)[0] + ".joblib")
+        explainer = shap.TreeExplainer(estimator, data=self.background)
+        values = explainer.shap_values(X.astype(np.float32), check_additivity=False)
+        return np.asarray(values), float(np.ravel(explainer.expected_value)[0])
+
+    def explain(self, X, cache_key):
+        """Return (values, base_value, changed) for X, reusing the cache for `cache_key`.
+
+        `changed` is False when the attributions equal the ones cached last time,
+        so callers can skip re-rendering plots.
+        """
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = os.path.join(CACHE_DIR, f"{cache_key}.npz")
+        key = f"{self.model_hash}:{_hash(np.asarray(X, dtype=np.float64))}"
+        cached = None
+        if os.path.exists(path):
+            with np.load(path) as data:
+                cached = dict(data)
+
+        if cached is not None and str(cached["key"]) == key:
+            return cached["values"], float(cached["base_value"]), False
+
+        values, base_value = self.compute(X)
+        attribution_hash = _hash(np.round(values, 6))
+        changed = cached is None or str(cached["attribution_hash"]) != attribution_hash
+        np.savez(path, key=key, values=values, base_value=base_value, attribution_hash=attribution_hash)
+        return values, base_value, changed
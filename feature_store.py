@@ -0,0 +1,220 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import upsert
+
+# --- Config ---
+STORE_PATH = "data/feature_store"
+LEGACY_CSV_PATHS = ["data/historical_combined_cities.csv"]
+PARTITION_FILE = "data.parquet"
+# Backfills store the whole current day, so the store also holds provisional values
+# (Open-Meteo revises them) for hours that have not happened yet. An hour counts as
+# observed once it is this many hours behind the city's current local hour.
+OBSERVED_LAG_HOURS = 1
+
+# Column order matches the training/prediction feature order
+COLUMNS = {
+    "time": "datetime64[ns]",
+    "us_aqi": "float32",
+    "pm10": "float32",
+    "pm2_5": "float32",
+    "ozone": "float32",
+    "carbon_monoxide": "float32",
+    "nitrogen_dioxide": "float32",
+    "sulphur_dioxide": "float32",
+    "temperature_2m": "float32",
+    "relative_humidity_2m": "float32",
+    "wind_speed_10m": "float32",
+    "cloud_cover": "float32",
+    "precipitation": "float32",
+    "dayofweek": "int8",
+    "hour": "int8",
+    "month": "int8",
+    "city": "int16",
+}
+
+# Hive-style layout: <root>/city=<code>/period=<YYYY-MM>/data.parquet
+PARTITIONING = ds.partitioning(
+    pa.schema([("city", pa.int16()), ("period", pa.string())]), flavor="hive"
+)
+
+
+def compact(df):
+    # Downcast to the store schema; `time` may come in as the index
+    if "time" not in df.columns:
+        df = df.reset_index()
+    return df[list(COLUMNS)].astype(COLUMNS)
+
+
+def _period(times):
+    return pd.DatetimeIndex(times).strftime("%Y-%m")
+
+
+def _partition_path(root, city, period):
+    return os.path.join(root, f"city={city}", f"period={period}", PARTITION_FILE)
+
+
+def _read_partition(path):
+    return pq.read_table(path, partitioning=None).to_pandas()
+
+
+def _timestamp(value):
+    return pa.scalar(pd.Timestamp(value).as_unit("ns").value, pa.timestamp("ns"))
+
+
+def _write_partition(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df.drop(columns=["city"]), preserve_index=False)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+def _merge_partition(existing, incoming):
+    # Sorted-key upsert of one partition; both frames are in store schema
+    existing_keys = upsert.row_keys(existing["time"], existing["city"])
+    incoming_keys = upsert.row_keys(incoming["time"], incoming["city"])
+    keys, source, stats = upsert.upsert(existing_keys, incoming_keys)
+    merged = pd.DataFrame({
+        col: upsert.take(existing[col].to_numpy(), incoming[col].to_numpy(), source)
+        for col in COLUMNS
+    }).astype(COLUMNS)
+    return merged, stats
+
+
+def append(df, root=STORE_PATH):
+    """Upsert rows into the store, rewriting only the (city, month) partitions they fall in.
+
+    Rows already stored for the same (time, city) are replaced by the incoming ones
+    (last write wins). Returns counts of partitions written and rows inserted/updated.
+    """
+    df = compact(df)
+    totals = {"partitions": 0, "inserted": 0, "updated": 0}
+    for (city, period), part in df.groupby([df["city"], _period(df["time"])], sort=False):
+        path = _partition_path(root, city, period)
+        if os.path.exists(path):
+            existing = _read_partition(path)
+            existing["city"] = np.int16(city)
+            existing = compact(existing)
+        else:
+            existing = compact(pd.DataFrame(columns=list(COLUMNS)))
+        merged, stats = _merge_partition(existing, part.reset_index(drop=True))
+        _write_partition(merged, path)
+        totals["partitions"] += 1
+        totals["inserted"] += stats["inserted"]
+        totals["updated"] += stats["updated"]
+    return totals
+
+
+def _dataset(root):
+    return ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+
+
+def _scan_filter(start, end, cities):
+    filters = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        filters.append(ds.field("period") >= start.strftime("%Y-%m"))
+        filters.append(ds.field("time") >= _timestamp(start))
+    if end is not None:
+        end = pd.Timestamp(end)
+        filters.append(ds.field("period") <= end.strftime("%Y-%m"))
+        filters.append(ds.field("time") <= _timestamp(end))
+    if cities is not None:
+        filters.append(ds.field("city").isin([int(c) for c in cities]))
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+    return expression
+
+
+def _empty(columns):
+    return pd.DataFrame(columns=columns).astype({c: COLUMNS[c] for c in columns})
+
+
+def read(start=None, end=None, cities=None, columns=None, root=STORE_PATH):
+    """Read history as one frame sorted by (city, time).
+
+    `start`/`end` (inclusive) and `cities` are pushed down to the Parquet scan:
+    partitions outside the requested months/cities are never opened.
+    """
+    columns = list(columns) if columns is not None else list(COLUMNS)
+    if not os.path.exists(root):
+        return _empty(columns)
+
+    scan_columns = list(dict.fromkeys(columns + ["city", "time"]))
+    table = _dataset(root).to_table(columns=scan_columns, filter=_scan_filter(start, end, cities))
+    df = table.to_pandas()
+    df = df.astype({c: COLUMNS[c] for c in scan_columns})
+    df = df.sort_values(["city", "time"], kind="stable", ignore_index=True)
+    return df[columns]
+
+
+def iter_batches(batch_rows=65_536, start=None, end=None, cities=None, columns=None, root=STORE_PATH):
+    """Stream the store as compact-dtype DataFrames of at most `batch_rows` rows.
+
+    Uses the same predicate pushdown as `read()`, but never materialises more
+    than a few record batches at once. Batches are not globally sorted.
+    """
+    columns = list(columns) if columns is not None else list(COLUMNS)
+    if not os.path.exists(root):
+        return
+    batches = _dataset(root).to_batches(
+        columns=columns,
+        filter=_scan_filter(start, end, cities),
+        batch_size=batch_rows,
+        batch_readahead=2,
+        fragment_readahead=1,
+    )
+    for batch in batches:
+        if batch.num_rows:
+            yield batch.to_pandas().astype({c: COLUMNS[c] for c in columns})
+
+
+def observed_until(codes, now=None, cities=None):
+    """Newest observed hour for each city code, as naive local time like the stored `time`.
+
+    Codes missing from the registry (cities since removed) fall back to UTC.
+    """
+    if cities is None:
+        from cities import load_registry
+        cities = load_registry()
+    now = pd.Timestamp.now(tz="UTC") if now is None else pd.Timestamp(now)
+    if now.tz is None:
+        now = now.tz_localize("UTC")
+    codes = np.asarray(codes, dtype=np.int64)
+    known = np.isin(codes, cities.codes)
+    zones = np.full(len(codes), "UTC", dtype=object)
+    zones[known] = cities.tz[cities.position(codes[known])]
+    out = np.empty(len(codes), dtype="datetime64[ns]")
+    for zone in np.unique(zones):
+        local = now.tz_convert(zone).floor("h").tz_localize(None) - pd.Timedelta(hours=OBSERVED_LAG_HOURS)
+        out[zones == zone] = local.to_datetime64()
+    return out
+
+
+def observed(df, now=None, cities=None):
+    # Mask of rows whose hour is observed (not provisional) on the city's local clock
+    codes, inverse = np.unique(df["city"].to_numpy(dtype=np.int64), return_inverse=True)
+    return df["time"].to_numpy(dtype="datetime64[ns]") <= observed_until(codes, now, cities)[inverse]
+
+
+def migrate_csv(paths=LEGACY_CSV_PATHS, root=STORE_PATH):
+    # One-time import of the legacy CSV history into the store
+    for path in paths:
+        df = pd.read_csv(path, parse_dates=["time"])
+        stats = append(df, root=root)
+        print(f"✅ Migrated {len(df)} rows from {path} into {stats['partitions']} partitions under {root}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        migrate_csv(sys.argv[2:] or LEGACY_CSV_PATHS)
+    else:
+        print("Usage: python feature_store.py migrate [csv_path ...]")
@@ -0,0 +1,186 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import pandas as pd
+
+import telemetry
+from http_client import get_session, get_openmeteo_client, cache_stats
+
+# --- Endpoints & variables shared by backfill_data.py, combined_backfill.py and predict.py ---
+# (overridable, e.g. to point at the local stand-in in mock_openmeteo.py for benchmarks)
+AIR_QUALITY_URL = os.environ.get("AQI_AIR_QUALITY_URL", "https://air-quality-api.open-meteo.com/v1/air-quality")
+WEATHER_URL = os.environ.get("AQI_WEATHER_URL", "https://api.open-meteo.com/v1/forecast")
+AIR_QUALITY_VARIABLES = [
+    "us_aqi", "pm10", "pm2_5", "ozone", "carbon_monoxide",
+    "nitrogen_dioxide", "sulphur_dioxide"
+]
+WEATHER_VARIABLES = [
+    "temperature_2m", "relative_humidity_2m", "wind_speed_10m",
+    "cloud_cover", "precipitation"
+]
+
+# --- Concurrency limits ---
+MAX_WORKERS = 16      # total requests in flight
+PER_HOST_LIMIT = 4    # requests in flight per API host (be polite to Open-Meteo)
+BATCH_SIZE = 50       # locations per request, keeps URLs well under Open-Meteo's limits
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def _host_slot(url):
+    # One bounded semaphore per host, shared by every fetch in the process
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+        return _host_slots[host]
+
+
+def _chunks(cities, batch_size):
+    batch_size = max(1, batch_size or 1)
+    return [cities[i:i + batch_size] for i in range(0, len(cities), batch_size)]
+
+
+def _batch_params(batch, params, hourly):
+    # Open-Meteo takes comma-separated coordinate/timezone lists and answers
+    # with one result per location, in the same order
+    return {
+        "latitude": ",".join(str(city["lat"]) for city in batch),
+        "longitude": ",".join(str(city["lon"]) for city in batch),
+        **params,
+        "hourly": hourly,
+        "timezone": ",".join(city["tz"] for city in batch),
+    }
+
+
+def _hourly_json_frame(payload):
+    df = pd.DataFrame(payload["hourly"])
+    df["time"] = pd.to_datetime(df["time"])
+    df["time"] = df["time"].dt.tz_localize(None)
+    df.set_index("time", inplace=True)
+    df.sort_index(inplace=True)
+    return df
+
+
+def _hourly_sdk_frame(response, variables):
+    hourly = response.Hourly()
+    data = {
+        "time": pd.date_range(
+            start=pd.to_datetime(hourly.Time(), unit="s", utc=True),
+            end=pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True),
+            freq=pd.Timedelta(seconds=hourly.Interval()),
+            inclusive="left"
+        )
+    }
+    for i, name in enumerate(variables):
+        data[name] = hourly.Variables(i).ValuesAsNumpy()
+    df = pd.DataFrame(data)
+    df["time"] = df["time"].dt.tz_localize(None)
+    df.set_index("time", inplace=True)
+    df.sort_index(inplace=True)
+    return df
+
+
+def _get_json(session, url, params):
+    with _host_slot(url):
+        response = session.get(url, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def _get_flatbuffers(client, url, params):
+    with _host_slot(url):
+        return client.weather_api(url, params=params)
+
+
+def _split(results, batch):
+    if len(results) != len(batch):
+        raise ValueError(f"expected {len(batch)} locations in response, got {len(results)}")
+    return results
+
+
+def _fetch_air_quality(session, batch, params):
+    params = _batch_params(batch, params, AIR_QUALITY_VARIABLES)
+    payload = _get_json(session, AIR_QUALITY_URL, params)
+    payloads = _split(payload if isinstance(payload, list) else [payload], batch)
+    return [_hourly_json_frame(p) for p in payloads]
+
+
+def _fetch_weather(session, client, batch, params, weather_format):
+    params = _batch_params(batch, params, WEATHER_VARIABLES)
+    if weather_format == "json":
+        payload = _get_json(session, WEATHER_URL, params)
+        payloads = _split(payload if isinstance(payload, list) else [payload], batch)
+        return [_hourly_json_frame(p) for p in payloads]
+    responses = _split(_get_flatbuffers(client, WEATHER_URL, params), batch)
+    return [_hourly_sdk_frame(r, WEATHER_VARIABLES) for r in responses]
+
+
+def fetch_city_frames(cities, params, weather_format="flatbuffers",
+                      batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
+    """Fetch air-quality and weather frames for all cities concurrently.
+
+    `params` holds the date-range keys shared by both endpoints (e.g. `past_days`,
+    `forecast_days` or `start_date`/`end_date`). Cities are grouped into batches
+    of `batch_size` locations, so each endpoint gets one request per batch
+    (`batch_size=1` sends one request per city). Weather is decoded from the
+    openmeteo_requests FlatBuffers client by default, or from plain JSON with
+    `weather_format="json"`. All requests go through the process-wide pooled,
+    cached session from http_client. Returns `(city, aq_df, weather_df)` tuples in
+    `cities` order; cities in a failed request are reported and skipped.
+    """
+    session = get_session()
+    client = get_openmeteo_client()
+    before = cache_stats()
+
+    with telemetry.span("fetch") as span, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        jobs = [
+            (
+                batch,
+                pool.submit(_fetch_air_quality, session, batch, params),
+                pool.submit(_fetch_weather, session, client, batch, params, weather_format),
+            )
+            for batch in _chunks(cities, batch_size)
+        ]
+        frames = []
+        for batch, aq_job, weather_job in jobs:
+            names = ", ".join(city["name"] for city in batch)
+            try:
+                aq_dfs = aq_job.result()
+            except Exception as e:
+                print(f"❌ Failed to fetch air quality for {names}: {e}")
+                continue
+            try:
+                weather_dfs = weather_job.result()
+            except Exception as e:
+                print(f"❌ Failed to fetch weather for {names}: {e}")
+                continue
+            frames.extend(zip(batch, aq_dfs, weather_dfs))
+
+        stats = cache_stats()
+        span.set(
+            rows=sum(len(aq_df) for _, aq_df, _ in frames),
+            requests=stats["hits"] + stats["misses"] - before["hits"] - before["misses"],
+            bytes=stats["bytes_fetched"] - before["bytes_fetched"],
+            cities=len(frames),
+        )
+    print(f"🗄️ HTTP cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} served locally)")
+    return frames
+
+
+def add_time_features(df, city_code):
+    df["dayofweek"] = df.index.dayofweek
+    df["hour"] = df.index.hour
+    df["month"] = df.index.month
+    df["city"] = city_code
+    return df
+
+
+def merge_city_frames(aq_df, weather_df, city_code):
+    # Inner join on hour, drop incomplete rows, add calendar + city features
+    merged = pd.merge(aq_df, weather_df, left_index=True, right_index=True, how="inner")
+    merged.dropna(inplace=True)
+    return add_time_features(merged, city_code)
@@ -0,0 +1,230 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import feature_store
+import upsert
+from intervals import LOWER_COLUMN, UPPER_COLUMN
+
+# Every published forecast is kept here, so accuracy can be measured against what
+# actually happened and broken down by lead time. Rows are keyed by
+# (mode, issue_time, valid_time, city), mode being predict.py's --mode (which model
+# made the forecast); each run only adds files, one per issue date:
+#   <root>/issue_date=<YYYY-MM-DD>/part-<mode>-<run hour UTC>.parquet
+# `evaluate()` joins forecasts that have matured since its last run with the observed
+# AQI from the feature store and folds them into running MAE sums per (mode, city,
+# horizon), so old partitions are never read again.
+
+# --- Config ---
+ARCHIVE_PATH = "data/forecast_archive"
+EVAL_DIR = "data/forecast_eval"
+EVAL_STATE_PATH = os.path.join(EVAL_DIR, "state.json")   # watermarks + running sums
+MAE_PATH = os.path.join(EVAL_DIR, "mae_by_horizon.csv")
+MAX_HORIZON_HOURS = 7 * 24   # longer lead times are not archived; bounds the partitions evaluate() reads
+MATURITY_HOURS = 1           # an hour counts as observed this long after it ends
+
+COLUMNS = {
+    "mode": "object",          # "direct" or "recursive"
+    "issue_time": "datetime64[ns]",
+    "valid_time": "datetime64[ns]",
+    "city": "int16",
+    "horizon": "int16",        # whole hours from issue_time to valid_time
+    "predicted": "float32",
+    "lower": "float32",
+    "upper": "float32",
+}
+STATS_COLUMNS = ["mode", "city", "horizon", "n", "abs_error_sum", "covered"]
+STATS_TYPES = {"mode": "object", "city": "int64", "horizon": "int64", "n": "int64", "covered": "int64"}
+
+PARTITIONING = ds.partitioning(pa.schema([("issue_date", pa.string())]), flavor="hive")
+
+
+def issue_times(codes, cities, issued_at):
+    # The run time floored to the hour on each city's local clock, which is the clock
+    # forecast and observed times are on (naive local times from the API)
+    positions = cities.position(codes)
+    out = np.empty(len(positions), dtype="datetime64[ns]")
+    for tz in np.unique(cities.tz):
+        local = issued_at.tz_convert(tz).floor("h").tz_localize(None)
+        out[cities.tz[positions] == tz] = local.to_datetime64()
+    return out
+
+
+def _part_path(root, issue_date, mode, issued_at):
+    return os.path.join(root, f"issue_date={issue_date}", f"part-{mode}-{issued_at:%Y%m%dT%H}.parquet")
+
+
+def append(results, cities, mode="direct", issued_at=None, root=ARCHIVE_PATH):
+    """Archive one forecast run (the frame predict.py writes); returns the number of rows archived.
+
+    Hours that are already past at issue time are nowcasts, not forecasts, and are
+    left out. Re-archiving the same mode within the same hour replaces that run's files.
+    """
+    issued_at = pd.Timestamp.now(tz="UTC") if issued_at is None else pd.Timestamp(issued_at)
+    if issued_at.tz is None:
+        issued_at = issued_at.tz_localize("UTC")
+    if "time" not in results.columns:
+        results = results.reset_index()
+
+    df = pd.DataFrame({
+        "mode": mode,
+        "issue_time": issue_times(results["city"].to_numpy(), cities, issued_at),
+        "valid_time": results["time"].to_numpy(dtype="datetime64[ns]"),
+        "city": results["city"].to_numpy(),
+        "predicted": results["predicted_us_aqi"].to_numpy(),
+        "lower": results[LOWER_COLUMN].to_numpy() if LOWER_COLUMN in results else np.nan,
+        "upper": results[UPPER_COLUMN].to_numpy() if UPPER_COLUMN in results else np.nan,
+    })
+    df["horizon"] = (df["valid_time"] - df["issue_time"]) // pd.Timedelta(hours=1)
+    df = df[(df["horizon"] >= 0) & (df["horizon"] <= MAX_HORIZON_HOURS)]
+    df = df[list(COLUMNS)].astype(COLUMNS).sort_values(["city", "issue_time", "valid_time"], ignore_index=True)
+
+    for issue_date, part in df.groupby(df["issue_time"].dt.strftime("%Y-%m-%d"), sort=False):
+        path = _part_path(root, issue_date, mode, issued_at)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(pa.Table.from_pandas(part, preserve_index=False), f"{path}.tmp", compression="zstd")
+        os.replace(f"{path}.tmp", path)
+    return len(df)
+
+
+def read(issued_from=None, cities=None, root=ARCHIVE_PATH):
+    """Archived forecasts issued on or after `issued_from`, sorted by (mode, city, issue_time, valid_time).
+
+    The issue-date bound and `cities` are pushed down to the Parquet scan, so
+    older partitions are never opened.
+    """
+    if not os.path.exists(root):
+        return pd.DataFrame(columns=list(COLUMNS)).astype(COLUMNS)
+    expression = None
+    if issued_from is not None:
+        issued_from = pd.Timestamp(issued_from)
+        expression = (ds.field("issue_date") >= issued_from.strftime("%Y-%m-%d")) & (
+            ds.field("issue_time") >= feature_store._timestamp(issued_from))
+    if cities is not None:
+        in_cities = ds.field("city").isin([int(c) for c in cities])
+        expression = in_cities if expression is None else expression & in_cities
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+    df = dataset.to_table(columns=list(COLUMNS), filter=expression).to_pandas().astype(COLUMNS)
+    return df.sort_values(["mode", "city", "issue_time", "valid_time"], kind="stable", ignore_index=True)
+
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return {}, pd.DataFrame(columns=STATS_COLUMNS).astype(STATS_TYPES)
+    with open(path) as f:
+        state = json.load(f)
+    watermarks = {int(city): pd.Timestamp(t) for city, t in state["watermarks"].items()}
+    return watermarks, pd.DataFrame(state["stats"], columns=STATS_COLUMNS).astype(STATS_TYPES)
+
+
+def _save_state(path, watermarks, stats):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    state = {
+        "watermarks": {str(city): t.isoformat() for city, t in sorted(watermarks.items())},
+        "stats": {col: stats[col].tolist() for col in STATS_COLUMNS},
+    }
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def mae_table(stats, cities=None):
+    # Running sums -> MAE and interval coverage per (mode, city, horizon)
+    table = stats.sort_values(["mode", "city", "horizon"], ignore_index=True)
+    table["mae"] = table["abs_error_sum"] / table["n"]
+    table["coverage"] = table["covered"] / table["n"]
+    if cities is not None:
+        table.insert(2, "city_name", cities.name(table["city"].to_numpy()))
+    return table.drop(columns=["abs_error_sum", "covered"])
+
+
+def _save(watermarks, stats, cities, state_path, out_path):
+    # Written on every run, even with nothing new to score, so the outputs always exist
+    _save_state(state_path, watermarks, stats)
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    mae_table(stats, cities).to_csv(out_path, index=False, float_format="%.3f")
+
+
+def _per_city(city_column, times):
+    # {city: time} (dict or Series) looked up for every row; NaT for cities without one
+    times = pd.Series(times, dtype="datetime64[ns]")
+    return times.reindex(np.asarray(city_column, dtype=np.int64)).to_numpy()
+
+
+def evaluate(cities, now=None, root=ARCHIVE_PATH, store_root=feature_store.STORE_PATH,
+             state_path=EVAL_STATE_PATH, out_path=MAE_PATH):
+    """Score forecasts that matured since the last run; returns counts of rows matured and pending.
+
+    A forecast matures once its valid hour is MATURITY_HOURS in the past (the store
+    also holds provisional values for the rest of today) and the store has the
+    observed AQI for it. Each city keeps a watermark, the newest hour already scored;
+    only forecasts beyond it are read, joined with the actuals through the sorted
+    (city, hour) key index, and added to the running sums per (mode, city, horizon).
+    """
+    now = pd.Timestamp.now(tz="UTC") if now is None else pd.Timestamp(now)
+    if now.tz is None:
+        now = now.tz_localize("UTC")
+    watermarks, stats = _load_state(state_path)
+    # Forecasts past every watermark were issued at most MAX_HORIZON_HOURS before it
+    issued_from = None
+    if all(int(c) in watermarks for c in cities.codes):
+        issued_from = min(watermarks.values()) - pd.Timedelta(hours=MAX_HORIZON_HOURS)
+    forecasts = read(issued_from, cities.codes, root)
+    forecasts = forecasts[~(forecasts["valid_time"].to_numpy() <= _per_city(forecasts["city"], watermarks))]
+
+    cutoff = pd.Series(issue_times(cities.codes, cities, now) - np.timedelta64(MATURITY_HOURS, "h"), index=cities.codes)
+    due = forecasts[forecasts["valid_time"].to_numpy() <= _per_city(forecasts["city"], cutoff)]
+    if due.empty:
+        _save(watermarks, stats, cities, state_path, out_path)
+        print(f"✅ No matured forecasts to evaluate ({len(forecasts)} pending)")
+        return {"matured": 0, "pending": len(forecasts)}
+
+    actuals = feature_store.read(start=due["valid_time"].min(), end=due["valid_time"].max(),
+                                 cities=due["city"].unique(), columns=["time", "city", "us_aqi"], root=store_root)
+    actuals = actuals[actuals["us_aqi"].notna()]
+    # Only score up to the newest observed hour, so a late backfill is waited for
+    ready_until = np.minimum(actuals.groupby("city")["time"].max(), cutoff.reindex(actuals["city"].unique()))
+    ready = due[due["valid_time"].to_numpy() <= _per_city(due["city"], ready_until)]
+
+    # Store rows come sorted by (city, time), so their keys are already a sorted index
+    actual_keys = upsert.row_keys(actuals["time"], actuals["city"])
+    keys = upsert.row_keys(ready["valid_time"], ready["city"])
+    pos = np.minimum(np.searchsorted(actual_keys, keys), max(len(actual_keys) - 1, 0))
+    matched = actual_keys[pos] == keys if len(actual_keys) else np.zeros(len(keys), dtype=bool)
+
+    matured = ready[matched].copy()
+    actual = actuals["us_aqi"].to_numpy(dtype=np.float64)[pos[matched]]
+    matured["abs_error"] = np.abs(matured["predicted"].to_numpy(dtype=np.float64) - actual)
+    matured["covered"] = ((actual >= matured["lower"]) & (actual <= matured["upper"])).astype("int64")
+    new_stats = matured.groupby(["mode", "city", "horizon"]).agg(
+        n=("abs_error", "size"), abs_error_sum=("abs_error", "sum"), covered=("covered", "sum")).reset_index()
+    stats = pd.concat([stats, new_stats]).astype(STATS_TYPES)
+    stats = stats.groupby(["mode", "city", "horizon"], as_index=False)[["n", "abs_error_sum", "covered"]].sum()
+
+    for city, until in ready_until.items():
+        watermarks[int(city)] = max(until, watermarks.get(int(city), until))
+    _save(watermarks, stats, cities, state_path, out_path)
+
+    pending = len(forecasts) - len(ready)
+    by_day = stats.groupby([stats["mode"], stats["horizon"] // 24])[["abs_error_sum", "n"]].sum()
+    summary = "; ".join(
+        f"{mode} " + ", ".join(f"{24 * d}-{24 * d + 23}h {row.abs_error_sum / row.n:.1f}" for (_, d), row in days.iterrows())
+        for mode, days in by_day.groupby(level=0))
+    print(f"✅ Evaluated {len(matured)} newly matured forecasts "
+          f"({len(ready) - len(matured)} without observations, {pending} pending); MAE by lead time: {summary}")
+    print(f"✅ Saved MAE by city and horizon to {out_path}")
+    return {"matured": len(matured), "pending": pending}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "evaluate":
+        from cities import load_registry
+        evaluate(load_registry())
+    else:
+        print("Usage: python forecast_archive.py evaluate")
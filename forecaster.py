@@ -0,0 +1,170 @@
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import lag_features
+from artifact import load_artifact
+
+# --- Config ---
+MODEL_PATH = "model/RecursiveRidge.npz"
+BACKGROUND_PATH = "model/shap_background_recursive.npz"
+HORIZON = 72
+FORECAST_DAYS = 4   # today's hours up to now are history, so fetch a day extra to cover 72h ahead
+
+# Inputs known ahead of time for every hour (fetch.WEATHER_VARIABLES + calendar + city,
+# spelled out so scoring never imports the HTTP stack) plus AQI lags that the rollout
+# fills in from its own predictions. Upstream pollutant and us_aqi forecasts are not used.
+EXOGENOUS = [
+    "temperature_2m", "relative_humidity_2m", "wind_speed_10m", "cloud_cover", "precipitation",
+    "dayofweek", "hour", "month", "city",
+]
+FEATURES = EXOGENOUS + lag_features.FEATURES
+
+
+def training_frame(df):
+    # Store rows (sorted by city, time) with batch-computed lag features; the first
+    # hours of each city lack a full history and are dropped
+    return lag_features.add_lag_features(df).dropna(subset=lag_features.FEATURES)
+
+
+@lru_cache(maxsize=4)
+def _load_model(path, mtime):
+    return load_artifact(path)
+
+
+def load_model(path=MODEL_PATH):
+    # Cached per file version, so repeated forecasts in one process load it once
+    return _load_model(path, os.path.getmtime(path))
+
+
+def _hour(h):
+    return pd.Timestamp(int(h) * 3600, unit="s")
+
+
+def gaps(codes, hours, step, state):
+    # Rows whose hour is not `step` hours after the city's last observed one: the lags
+    # would be rolled onto unrelated inputs (stale lag state, or hours missing in between)
+    return hours != state.last_hour[codes] + 1 + step
+
+
+class RecursiveForecaster:
+    """Roll every city forward hour by hour over a batched lag-state array.
+
+    Each step gathers the lag features of all cities from the ring buffers, scores
+    them in one call and pushes the predictions back as the newest AQI values. For
+    linear artifacts the exogenous part of every (city, hour) row is computed up
+    front in one matrix product, so a step is only an (N x lags) product.
+    """
+
+    def __init__(self, model, state):
+        missing = [f for f in model.features if f not in FEATURES]
+        if missing:
+            raise ValueError(f"Model needs features the recursive forecaster cannot build: {missing}")
+        self.model = model
+        self.state = state
+        self.lag_idx = np.array([model.features.index(f) for f in lag_features.FEATURES])
+        self.exo_idx = np.array([i for i, f in enumerate(model.features) if f not in lag_features.FEATURES])
+        self.inference_s = None
+
+    def forecast(self, features, horizon=HORIZON):
+        """Predict the first `horizon` hours after each city's last observed hour.
+
+        `features` holds the exogenous columns with a `time` index (as built by
+        predict.py) and must cover every hour from the one after the lag state's
+        last observation on; a gap raises ValueError. Returns the model's feature
+        columns (lags included) plus `predicted_us_aqi`, indexed by time in
+        (city, time) order.
+        """
+        start = time.perf_counter()
+        df = features.reset_index().sort_values(["city", "time"], kind="stable", ignore_index=True)
+        state = self.state.copy()
+        codes = df["city"].to_numpy(dtype=np.int64)
+        hours = lag_features.epoch_hours(df["time"])
+        state._ensure(codes)
+        no_history = np.unique(codes[state.count[codes] == 0])
+        if len(no_history):
+            raise ValueError(f"No AQI history for cities {no_history.tolist()}; run `python lag_features.py sync`")
+
+        # Hours at or before the last observation are history, not forecast
+        df = df[hours > state.last_hour[codes]].reset_index(drop=True)
+        if df.empty:
+            raise ValueError("Forecast inputs end before the latest observed hour; nothing to roll forward")
+        step = df.groupby("city", sort=False).cumcount().to_numpy()
+        df, step = df[step < horizon].reset_index(drop=True), step[step < horizon]
+        codes = df["city"].to_numpy(dtype=np.int64)
+        hours = lag_features.epoch_hours(df["time"])
+        gapped = gaps(codes, hours, step, state)
+        if gapped.any():
+            row = np.flatnonzero(gapped)[0]
+            raise ValueError(
+                f"Forecast inputs for cities {np.unique(codes[gapped]).tolist()} do not continue from the lag "
+                f"state (city {codes[row]}: expected {_hour(state.last_hour[codes[row]] + 1 + step[row])}, "
+                f"got {_hour(hours[row])}); run `python lag_features.py sync` or refetch the forecast"
+            )
+
+        X = np.zeros((len(df), len(self.model.features)))
+        X[:, self.exo_idx] = df[[self.model.features[i] for i in self.exo_idx]].to_numpy(dtype=np.float64)
+        linear = self.model.kind == "linear"
+        if linear:
+            coef = self.model.arrays["coef"]
+            base = X[:, self.exo_idx] @ coef[self.exo_idx] + float(self.model.arrays["intercept"])
+            coef_lag = coef[self.lag_idx]
+
+        predictions = np.empty(len(df))
+        order = np.argsort(step, kind="stable")
+        bounds = np.searchsorted(step[order], np.arange(step.max(initial=-1) + 2))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            rows = order[lo:hi]
+            lags = state.features(codes[rows])
+            X[np.ix_(rows, self.lag_idx)] = lags
+            if linear:
+                y = base[rows] + lags @ coef_lag
+            else:
+                y = self.model.predict(pd.DataFrame(X[rows], columns=self.model.features))
+            state.push(codes[rows], y, hours[rows])
+            predictions[rows] = y
+        self.inference_s = time.perf_counter() - start
+
+        results = pd.DataFrame(X, columns=self.model.features, index=pd.DatetimeIndex(df["time"], name="time"))
+        results = results.astype({c: df[c].dtype for c in EXOGENOUS if c in results})
+        results["predicted_us_aqi"] = predictions
+        return results
+
+
+def backtest_residuals(model, df, cutoff, every=12, horizon=HORIZON):
+    """Absolute errors of rollouts started every `every` hours from `cutoff` on.
+
+    `df` is store history sorted by (city, time); observed weather stands in for
+    the forecast. The lag state only folds in the hours between consecutive origins,
+    found by binary search on a time-sorted copy. Returns a (rollouts x horizon)
+    matrix, one row per (origin, city) with a full horizon; (0, horizon) when the
+    history is too short or gappy for any.
+    """
+    by_time = df.sort_values("time", kind="stable", ignore_index=True)
+    times = by_time["time"].to_numpy()
+    state = lag_features.LagState()
+    last = df["time"].max() - pd.Timedelta(hours=horizon)
+    errors = []
+    folded = 0
+    for origin in pd.date_range(cutoff, last, freq=f"{every}h"):
+        start, stop = np.searchsorted(times, [origin.to_datetime64(), (origin + pd.Timedelta(hours=horizon)).to_datetime64()])
+        state.update(by_time.iloc[folded:start])
+        folded = start
+        ahead = by_time.iloc[start:stop].sort_values(["city", "time"], kind="stable")
+        # Cities with hours missing around this origin (the store drops incomplete rows) are skipped
+        codes = ahead["city"].to_numpy(dtype=np.int64)
+        state._ensure(codes)
+        step = ahead.groupby("city", sort=False).cumcount().to_numpy()
+        gapped = gaps(codes, lag_features.epoch_hours(ahead["time"]), step, state)
+        ahead = ahead[~np.isin(codes, codes[gapped])]
+        if ahead.empty:
+            continue
+        rollout = RecursiveForecaster(model, state).forecast(ahead.set_index("time"), horizon)
+        rollout = rollout.reset_index().merge(ahead[["time", "city", lag_features.SOURCE]], on=["time", "city"])
+        for _, city_rollout in rollout.groupby("city", sort=False):
+            if len(city_rollout) == horizon:
+                errors.append(np.abs(city_rollout["predicted_us_aqi"] - city_rollout[lag_features.SOURCE]))
+    return np.vstack(errors) if errors else np.empty((0, horizon))
@@ -0,0 +1,105 @@
+import os
+import threading
+from datetime import date
+
+import openmeteo_requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+
+# --- Config ---
+# SQLite cache shared by every script; requests_cache appends ".sqlite"
+CACHE_NAME = os.environ.get("AQI_HTTP_CACHE", ".cache")
+POOL_SIZE = 32            # keep-alive connections kept open per host
+RETRIES = 3
+BACKOFF_FACTOR = 0.3
+STATUS_TO_RETRY = (429, 500, 502, 503, 504)
+
+# Endpoint-aware expiry (seconds)
+FORECAST_EXPIRE = 15 * 60            # forecasts are refreshed upstream several times a day
+RECENT_EXPIRE = 60 * 60              # ranges touching today may still be filled in
+ARCHIVE_EXPIRE = 30 * 24 * 60 * 60   # past days no longer change
+
+
+def expire_after_for(params):
+    end_date = params.get("end_date")
+    if end_date and str(end_date) < date.today().isoformat():
+        return ARCHIVE_EXPIRE
+    if params.get("forecast_days"):
+        return FORECAST_EXPIRE
+    return RECENT_EXPIRE
+
+
+class PooledCachedSession(requests_cache.CachedSession):
+    # CachedSession that picks an expiry per request and counts cache hits/misses
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hits = 0
+        self.misses = 0
+        self.bytes_fetched = 0
+        self._stats_lock = threading.Lock()
+
+    def request(self, method, url, *args, params=None, expire_after=None, **kwargs):
+        if expire_after is None and params is not None:
+            expire_after = expire_after_for(params)
+        response = super().request(method, url, *args, params=params, expire_after=expire_after, **kwargs)
+        with self._stats_lock:
+            if getattr(response, "from_cache", False):
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.bytes_fetched += len(response.content)
+        return response
+
+    def cache_stats(self):
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "bytes_fetched": self.bytes_fetched,
+            }
+
+
+_lock = threading.Lock()
+_session = None
+_openmeteo_client = None
+
+
+def get_session():
+    # One pooled, retrying, SQLite-cached session per process
+    global _session
+    with _lock:
+        if _session is None:
+            session = PooledCachedSession(CACHE_NAME, backend="sqlite", expire_after=RECENT_EXPIRE)
+            adapter = HTTPAdapter(
+                pool_connections=POOL_SIZE,
+                pool_maxsize=POOL_SIZE,
+                max_retries=Retry(
+                    total=RETRIES,
+                    read=RETRIES,
+                    connect=RETRIES,
+                    backoff_factor=BACKOFF_FACTOR,
+                    status_forcelist=STATUS_TO_RETRY,
+                    allowed_methods=None,
+                ),
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def get_openmeteo_client():
+    global _openmeteo_client
+    session = get_session()
+    with _lock:
+        if _openmeteo_client is None:
+            _openmeteo_client = openmeteo_requests.Client(session=session)
+        return _openmeteo_client
+
+
+def cache_stats():
+    return get_session().cache_stats()
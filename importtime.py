@@ -0,0 +1,80 @@
+import argparse
+import ast
+import json
+import re
+import subprocess
+import sys
+import time
+
+# Startup cost of each entry point: its module-level imports are run in a fresh
+# interpreter under `python -X importtime` and summarized per top-level package.
+ENTRY_POINTS = ["app.py", "predict.py", "model.py", "backfill_data.py", "pipeline.py"]
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_block(path):
+    # Only the top-level import statements: what a cold start pays before any work
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def measure(path):
+    """Run the import block of `path` under -X importtime; return a summary dict."""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", import_block(path)],
+        capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {path} failed:\n{proc.stderr[-2000:]}")
+
+    packages = {}
+    modules = 0
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        modules += 1
+        self_us, cumulative_us, indent, name = match.groups()
+        root = name.split(".")[0]
+        entry = packages.setdefault(root, {"self_ms": 0.0, "cumulative_ms": 0.0})
+        entry["self_ms"] += int(self_us) / 1000
+        # Nested imports are already inside their parent's cumulative time
+        if len(indent) == 1:
+            entry["cumulative_ms"] += int(cumulative_us) / 1000
+
+    return {
+        "entry_point": path,
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(sum(p["self_ms"] for p in packages.values()), 1),
+        "modules": modules,
+        "packages": {
+            name: {k: round(v, 1) for k, v in p.items()}
+            for name, p in sorted(packages.items(), key=lambda kv: -kv[1]["cumulative_ms"])
+        },
+    }
+
+
+def print_report(report, top):
+    print(f"\n⏱️  {report['entry_point']}: {report['import_ms']:.0f} ms in imports "
+          f"({report['modules']} modules), {report['wall_ms']:.0f} ms wall incl. interpreter start")
+    for name, p in list(report["packages"].items())[:top]:
+        print(f"   {p['cumulative_ms']:9.1f} ms  cumulative  {p['self_ms']:9.1f} ms  self  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time report for the project entry points")
+    parser.add_argument("paths", nargs="*", default=ENTRY_POINTS, help="entry-point scripts to measure")
+    parser.add_argument("--top", type=int, default=10, help="packages listed per entry point")
+    parser.add_argument("--json", help="also write the full report to this path")
+    args = parser.parse_args()
+
+    reports = [measure(path) for path in args.paths]
+    for report in reports:
+        print_report(report, args.top)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n✅ Saved import-time report to {args.json}")
@@ -0,0 +1,68 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+
+# --- Config ---
+COVERAGE = 0.9   # nominal coverage of the [lower, upper] band
+LOWER_COLUMN = "predicted_us_aqi_lower"
+UPPER_COLUMN = "predicted_us_aqi_upper"
+
+# Split-conformal intervals: absolute errors of a model on data it was not fitted on
+# are cached next to its artifact (model/<name>_residuals.npz) at training time, as a
+# (samples x horizons) matrix. One column means the error does not depend on the
+# horizon (direct models); recursive rollouts keep one column per hour ahead.
+
+
+def residuals_path(model_path):
+    return model_path.rsplit(".", 1)[0] + "_residuals.npz"
+
+
+def save_residuals(model_path, residuals):
+    residuals = np.abs(np.asarray(residuals, dtype=np.float64))
+    if residuals.ndim == 1:
+        residuals = residuals[:, None]
+    path = residuals_path(model_path)
+    np.savez(path, residuals=residuals)
+    return path
+
+
+def conformal_quantiles(residuals, coverage=COVERAGE):
+    # Finite-sample corrected quantile per horizon: the ceil((n+1) * coverage)-th
+    # smallest absolute error, computed for all horizons at once
+    n = len(residuals)
+    k = min(n, int(np.ceil(round((n + 1) * coverage, 9))))
+    return np.partition(residuals, k - 1, axis=0)[k - 1]
+
+
+@lru_cache(maxsize=8)
+def _load_quantiles(path, mtime, coverage):
+    with np.load(path) as data:
+        return conformal_quantiles(data["residuals"], coverage)
+
+
+def load_quantiles(model_path, coverage=COVERAGE):
+    path = residuals_path(model_path)
+    if not os.path.exists(path):
+        return None
+    return _load_quantiles(path, os.path.getmtime(path), coverage)
+
+
+def add_intervals(results, model_path, coverage=COVERAGE):
+    """Add lower/upper bound columns to `results` in one vectorized pass.
+
+    The hour-ahead index of each row is its position within its city (rows are in
+    time order per city); horizons past the calibrated ones reuse the last width.
+    Returns `results` unchanged when no residuals were cached for the model.
+    """
+    widths = load_quantiles(model_path, coverage)
+    if widths is None:
+        print(f"⚠️ No cached residuals for {model_path}, skipping prediction intervals")
+        return results
+    step = results.groupby("city", sort=False).cumcount().to_numpy()
+    width = widths[np.minimum(step, len(widths) - 1)]
+    predicted = results["predicted_us_aqi"].to_numpy()
+    # AQI is non-negative; clip both bounds so lower <= upper still holds
+    results[LOWER_COLUMN] = np.maximum(predicted - width, 0.0)
+    results[UPPER_COLUMN] = np.maximum(predicted + width, 0.0)
+    return results
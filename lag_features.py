@@ -0,0 +1,244 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# --- Config ---
+STATE_PATH = "data/lag_state.npz"
+SOURCE = "us_aqi"
+LAGS = (1, 2, 3, 6, 12, 24)    # value k hours back
+WINDOWS = (6, 24)              # rolling mean / max over the previous N hours
+EWM_SPANS = (6, 24)            # exponentially weighted mean, alpha = 2 / (span + 1)
+HISTORY = max(LAGS + WINDOWS)  # values kept per city in the ring buffer
+
+# Every feature for hour t is built from values up to t-1 only, so it is known
+# before y_t is observed and can be fed back from predictions when rolling forward.
+# Windows count rows (one per stored hour), exactly like groupby().rolling(n).
+# The store drops incomplete rows, so the source column is assumed NaN-free.
+
+
+def feature_names(source=SOURCE):
+    return (
+        [f"{source}_lag{k}" for k in LAGS]
+        + [f"{source}_mean{w}h" for w in WINDOWS]
+        + [f"{source}_max{w}h" for w in WINDOWS]
+        + [f"{source}_ewm{s}" for s in EWM_SPANS]
+    )
+
+
+FEATURES = feature_names()
+
+
+def epoch_hours(times):
+    return pd.DatetimeIndex(times).as_unit("ns").asi8 // 3_600_000_000_000
+
+
+def batch_features(df, source=SOURCE):
+    """Recompute all lag/rolling/EWM features from scratch with pandas groupby.
+
+    `df` needs `time`, `city` and `source` columns and must be in time order within
+    each city (feature_store.read() returns (city, time) order). Used for training
+    and as the reference the incremental LagState reproduces.
+    """
+    values = df[source].astype("float64")
+    city = df["city"]
+    past = values.groupby(city, sort=False).shift(1)
+    by_city = past.groupby(city, sort=False)
+
+    columns = {}
+    for k in LAGS:
+        columns[f"{source}_lag{k}"] = values.groupby(city, sort=False).shift(k)
+    for w in WINDOWS:
+        columns[f"{source}_mean{w}h"] = by_city.rolling(w, min_periods=w).mean().droplevel(0)
+    for w in WINDOWS:
+        columns[f"{source}_max{w}h"] = by_city.rolling(w, min_periods=w).max().droplevel(0)
+    for s in EWM_SPANS:
+        columns[f"{source}_ewm{s}"] = by_city.ewm(span=s, adjust=False).mean().droplevel(0)
+    return pd.DataFrame(columns, index=df.index)[feature_names(source)]
+
+
+def add_lag_features(df, source=SOURCE):
+    return df.join(batch_features(df, source))
+
+
+class LagState:
+    """Per-city ring buffers of the last HISTORY values plus running EWM levels.
+
+    Arrays are indexed directly by city code (grown on demand), so one step for
+    every city is a single vectorized gather/scatter. `features(codes)` gives the
+    next hour's features, `push(codes, values)` folds one new value per city in.
+    """
+
+    def __init__(self, n_codes=0):
+        self.values = np.full((n_codes, HISTORY), np.nan)
+        self.hours = np.full((n_codes, HISTORY), -1, dtype=np.int64)
+        self.ewm = np.full((n_codes, len(EWM_SPANS)), np.nan)
+        self.count = np.zeros(n_codes, dtype=np.int64)
+
+    def _ensure(self, codes):
+        n = int(np.max(codes, initial=-1)) + 1
+        grow = n - len(self.count)
+        if grow > 0:
+            self.values = np.vstack([self.values, np.full((grow, HISTORY), np.nan)])
+            self.hours = np.vstack([self.hours, np.full((grow, HISTORY), -1, dtype=np.int64)])
+            self.ewm = np.vstack([self.ewm, np.full((grow, len(EWM_SPANS)), np.nan)])
+            self.count = np.concatenate([self.count, np.zeros(grow, dtype=np.int64)])
+
+    def copy(self):
+        state = LagState()
+        state.values, state.hours = self.values.copy(), self.hours.copy()
+        state.ewm, state.count = self.ewm.copy(), self.count.copy()
+        return state
+
+    @property
+    def last_hour(self):
+        # Newest folded hour per city code (-1 for codes never seen)
+        return np.where(self.count > 0, self.hours[np.arange(len(self.count)), (self.count - 1) % HISTORY], -1)
+
+    def _recent(self, codes):
+        # recent[:, j] = value j+1 rows back, NaN before the city has that much history
+        newest = (self.count[codes] - 1)[:, None]
+        idx = (newest - np.arange(HISTORY)) % HISTORY
+        recent = np.take_along_axis(self.values[codes], idx, axis=1)
+        return np.where(np.arange(HISTORY) < self.count[codes][:, None], recent, np.nan)
+
+    def features(self, codes):
+        codes = np.asarray(codes, dtype=np.int64)
+        self._ensure(codes)
+        recent = self._recent(codes)
+        columns = [recent[:, k - 1] for k in LAGS]
+        columns += [recent[:, :w].mean(axis=1) for w in WINDOWS]
+        columns += [recent[:, :w].max(axis=1) for w in WINDOWS]
+        columns += [self.ewm[codes, i] for i in range(len(EWM_SPANS))]
+        return np.column_stack(columns)
+
+    def push(self, codes, values, hours=None):
+        # One value per city; `codes` must not repeat within a call
+        codes = np.asarray(codes, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        self._ensure(codes)
+        slot = self.count[codes] % HISTORY
+        self.values[codes, slot] = values
+        if hours is None:
+            hours = self.last_hour[codes] + 1
+        self.hours[codes, slot] = hours
+        alpha = 2.0 / (np.asarray(EWM_SPANS, dtype=np.float64) + 1.0)
+        started = (self.count[codes] > 0)[:, None]
+        self.ewm[codes] = np.where(started, alpha * values[:, None] + (1 - alpha) * self.ewm[codes], values[:, None])
+        self.count[codes] += 1
+
+    def update(self, df, source=SOURCE):
+        """Fold new rows into the state and return their features (same index as `df`).
+
+        Rows at or before a city's newest folded hour are skipped. Cities advance in
+        lockstep: step r handles every city's r-th new row in one vectorized call.
+        """
+        df = df.sort_values(["city", "time"], kind="stable")
+        codes = df["city"].to_numpy(dtype=np.int64)
+        self._ensure(codes)
+        hours = epoch_hours(df["time"])
+        new = hours > self.last_hour[codes]
+        df, codes, hours = df[new], codes[new], hours[new]
+        values = df[source].to_numpy(dtype=np.float64)
+
+        out = np.empty((len(df), len(FEATURES)))
+        rank = df.groupby("city", sort=False).cumcount().to_numpy()
+        order = np.argsort(rank, kind="stable")
+        bounds = np.searchsorted(rank[order], np.arange(rank.max(initial=-1) + 2))
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            rows = order[start:stop]
+            out[rows] = self.features(codes[rows])
+            self.push(codes[rows], values[rows], hours[rows])
+        return pd.DataFrame(out, index=df.index, columns=FEATURES)
+
+    def revised(self, df, source=SOURCE, atol=1e-3):
+        # True when `df` changes a value still held in a ring buffer (or one that
+        # has already scrolled out), which the incremental path cannot undo
+        codes = df["city"].to_numpy(dtype=np.int64)
+        self._ensure(codes)
+        hours = epoch_hours(df["time"])
+        folded = hours <= self.last_hour[codes]
+        if not folded.any():
+            return False
+        codes, hours = codes[folded], hours[folded]
+        values = df[source].to_numpy(dtype=np.float64)[folded]
+        match = self.hours[codes] == hours[:, None]
+        held = match.any(axis=1)
+        if not held.all():
+            return True
+        stored = self.values[codes][match]
+        return not np.allclose(stored, values, atol=atol)
+
+    def save(self, path=STATE_PATH):
+        np.savez(path, values=self.values, hours=self.hours, ewm=self.ewm, count=self.count,
+                 features=np.asarray(FEATURES))
+        return path
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        with np.load(path) as data:
+            if [str(f) for f in data["features"]] != FEATURES:
+                raise ValueError(f"{path} was built for a different feature config")
+            state = cls()
+            state.values, state.hours = data["values"], data["hours"]
+            state.ewm, state.count = data["ewm"], data["count"]
+        return state
+
+    @classmethod
+    def from_history(cls, df, source=SOURCE):
+        state = cls()
+        state.update(df, source)
+        return state
+
+
+def sync(path=STATE_PATH, now=None):
+    """Bring the saved lag state up to date with the feature store.
+
+    Only observed hours are folded in: the store also holds provisional values
+    for the rest of today, which Open-Meteo keeps revising, so they would force
+    a rebuild on nearly every run. Only rows from the oldest hour held in the
+    ring buffers onwards are read; the state is rebuilt from the full history when it is
+    missing, built for another config, misses a city, or observed values inside
+    the ring buffers were revised.
+    """
+    import feature_store
+
+    columns = ["time", "city", SOURCE]
+    state = None
+    if os.path.exists(path):
+        try:
+            state = LagState.load(path)
+        except ValueError as e:
+            print(f"⚠️ {e}, rebuilding...")
+
+    action = "rebuilt"
+    if state is not None:
+        # From the oldest hour still in a ring buffer, so revisions of held values are seen
+        held = state.hours[state.hours >= 0]
+        since = pd.Timestamp(int(held.min()) * 3600, unit="s") if len(held) else None
+        recent = feature_store.read(start=since, columns=columns)
+        recent = recent[feature_store.observed(recent, now)]
+        known = np.isin(recent["city"].to_numpy(), np.flatnonzero(state.count > 0))
+        if not known.all() or state.revised(recent):
+            state = None
+        else:
+            rows = len(state.update(recent))
+            action = f"updated with {rows} new rows"
+    if state is None:
+        history = feature_store.read(columns=columns)
+        state = LagState.from_history(history[feature_store.observed(history, now)])
+    state.save(path)
+    print(f"✅ Lag state {action}: {len(FEATURES)} features for {int((state.count > 0).sum())} cities -> {path}")
+    return state
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "rebuild":
+        if os.path.exists(STATE_PATH):
+            os.remove(STATE_PATH)
+        sync()
+    elif len(sys.argv) == 1 or sys.argv[1] == "sync":
+        sync()
+    else:
+        print("Usage: python lag_features.py [sync|rebuild]")
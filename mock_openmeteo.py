@@ -0,0 +1,281 @@
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import flatbuffers
+import numpy as np
+import pandas as pd
+
+# Local stand-in for the Open-Meteo air-quality and forecast APIs, for offline and
+# reproducible benchmarks. Point fetch.py at it with
+#   AQI_AIR_QUALITY_URL=http://127.0.0.1:8765/v1/air-quality
+#   AQI_WEATHER_URL=http://127.0.0.1:8765/v1/forecast
+# It answers batched (comma-separated) locations as JSON or, with format=flatbuffers,
+# as size-prefixed WeatherApiResponse messages like the real API. Series come from a
+# recorded response for the location when one exists, otherwise from a deterministic
+# synthetic generator, so overlapping requests always agree.
+
+# --- Config ---
+RECORDINGS_DIR = "benchmarks/recordings"
+DEFAULT_PORT = 8765
+LIVE_URLS = {
+    "air-quality": "https://air-quality-api.open-meteo.com/v1/air-quality",
+    "forecast": "https://api.open-meteo.com/v1/forecast",
+}
+DEFAULT_FORECAST_DAYS = {"air-quality": 5, "forecast": 7}
+
+# Synthetic value range (low, high) per variable; a daily cycle plus hash noise
+VALUE_RANGES = {
+    "us_aqi": (20, 250),
+    "pm10": (10, 300),
+    "pm2_5": (5, 150),
+    "ozone": (10, 180),
+    "carbon_monoxide": (100, 1500),
+    "nitrogen_dioxide": (2, 80),
+    "sulphur_dioxide": (1, 40),
+    "temperature_2m": (5, 45),
+    "relative_humidity_2m": (10, 100),
+    "wind_speed_10m": (0, 40),
+    "cloud_cover": (0, 100),
+    "precipitation": (0, 5),
+}
+
+
+def _hash_noise(hours, seed):
+    # Deterministic pseudo-random numbers in [0, 1) per absolute hour
+    x = np.sin(hours * 12.9898 + seed * 78.233) * 43758.5453
+    return x - np.floor(x)
+
+
+def _seed(lat, lon, variable):
+    return (round(lat * 1000) * 31 + round(lon * 1000) * 17 + sum(map(ord, variable))) % 10_007
+
+
+def synthetic_series(lat, lon, variable, hours):
+    """Values of `variable` at a location for absolute epoch `hours` (vectorized)."""
+    low, high = VALUE_RANGES.get(variable, (0, 100))
+    seed = _seed(lat, lon, variable)
+    phase = (seed % 24) / 24 * 2 * np.pi
+    daily = 0.5 + 0.3 * np.sin(2 * np.pi * (hours % 24) / 24 + phase)
+    seasonal = 0.1 * np.sin(2 * np.pi * hours / (24 * 365.25) + phase)
+    level = np.clip(daily + seasonal + 0.2 * (_hash_noise(hours, seed) - 0.5), 0, 1)
+    values = low + (high - low) * level
+    if variable == "precipitation":
+        values = np.where(_hash_noise(hours, seed + 1) > 0.85, values, 0.0)
+    return np.round(values, 1).astype(np.float32)
+
+
+def load_recordings(directory=RECORDINGS_DIR):
+    # {(endpoint, lat, lon): {"start": first epoch hour, variable: np.array}} from files
+    # written by `record`; times are the naive local times the API returned
+    recordings = {}
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        with open(path) as f:
+            payload = json.load(f)
+        endpoint = os.path.basename(path).split("_")[0]
+        for location in payload if isinstance(payload, list) else [payload]:
+            key = (endpoint, round(location["latitude"], 2), round(location["longitude"], 2))
+            hourly = location["hourly"]
+            recordings[key] = {
+                k: np.asarray(v, dtype=np.float32) for k, v in hourly.items() if k != "time"
+            }
+            recordings[key]["start"] = pd.Timestamp(hourly["time"][0]).value // 3_600_000_000_000
+    return recordings
+
+
+def _time_range(params, endpoint):
+    # Hourly grid (epoch hours) the real API would return for these parameters
+    if "start_date" in params:
+        start = pd.Timestamp(params["start_date"])
+        end = pd.Timestamp(params.get("end_date", params["start_date"])) + pd.Timedelta(hours=23)
+    else:
+        today = pd.Timestamp(date.today())
+        start = today - pd.Timedelta(days=int(params.get("past_days", 0)))
+        days = int(params.get("forecast_days", DEFAULT_FORECAST_DAYS[endpoint]))
+        end = today + pd.Timedelta(days=days) - pd.Timedelta(hours=1)
+    return np.arange(start.value // 3_600_000_000_000, end.value // 3_600_000_000_000 + 1)
+
+
+def replay(recorded, start, hours):
+    """Recorded values at absolute epoch `hours`; the recording begins at epoch hour `start`.
+
+    Hours the recording covers get exactly what was recorded for them. Hours outside
+    it wrap around by whole weeks (whole days for shorter recordings), so the daily
+    and weekly cycles stay in phase with the requested times.
+    """
+    offset = np.asarray(hours, dtype=np.int64) - start
+    period = len(recorded) // 168 * 168 or len(recorded) // 24 * 24 or len(recorded)
+    outside = (offset < 0) | (offset >= len(recorded))
+    return recorded[np.where(outside, offset % period, offset)]
+
+
+def _series(recordings, endpoint, lat, lon, variable, hours):
+    recording = recordings.get((endpoint, round(lat, 2), round(lon, 2)), {})
+    recorded = recording.get(variable)
+    if recorded is not None and len(recorded):
+        return replay(recorded, recording["start"], hours)
+    return synthetic_series(lat, lon, variable, hours)
+
+
+def _json_location(lat, lon, timezone, hours, columns):
+    times = pd.to_datetime(hours * 3600, unit="s").strftime("%Y-%m-%dT%H:%M")
+    hourly = {"time": list(times)}
+    hourly.update({name: np.asarray(values, dtype=np.float64).round(1).tolist() for name, values in columns.items()})
+    return {"latitude": lat, "longitude": lon, "timezone": timezone, "utc_offset_seconds": 0, "hourly": hourly}
+
+
+def _flatbuffers_location(lat, lon, hours, columns):
+    # WeatherApiResponse with only the hourly block; slots follow openmeteo_sdk's schema
+    builder = flatbuffers.Builder(1024 + 8 * len(hours) * len(columns))
+    variables = []
+    for values in columns.values():
+        vector = builder.CreateNumpyVector(np.asarray(values, dtype=np.float32))
+        builder.StartObject(13)
+        builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+        variables.append(builder.EndObject())
+    builder.StartVector(4, len(variables), 4)
+    for offset in reversed(variables):
+        builder.PrependUOffsetTRelative(offset)
+    variable_vector = builder.EndVector()
+
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, int(hours[0]) * 3600, 0)
+    builder.PrependInt64Slot(1, (int(hours[-1]) + 1) * 3600, 0)
+    builder.PrependInt32Slot(2, 3600, 0)
+    builder.PrependUOffsetTRelativeSlot(3, variable_vector, 0)
+    hourly = builder.EndObject()
+
+    builder.StartObject(15)
+    builder.PrependFloat32Slot(0, lat, 0.0)
+    builder.PrependFloat32Slot(1, lon, 0.0)
+    builder.PrependUOffsetTRelativeSlot(11, hourly, 0)
+    builder.FinishSizePrefixed(builder.EndObject())
+    return bytes(builder.Output())
+
+
+class MockOpenMeteoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=0,
+                 recordings_dir=RECORDINGS_DIR):
+        super().__init__(address, MockOpenMeteoHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.recordings = load_recordings(recordings_dir)
+        self.rng = np.random.default_rng(seed)
+        self.rng_lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+class MockOpenMeteoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.rng_lock:
+            server.requests += 1
+            delay = max(0.0, server.latency_ms + server.jitter_ms * server.rng.standard_normal()) / 1000
+            fail = server.rng.random() < server.error_rate
+            if fail:
+                server.errors += 1
+        time.sleep(delay)
+        if fail:
+            return self._send(503, b'{"error": true, "reason": "injected failure"}', "application/json")
+
+        url = urlparse(self.path)
+        endpoint = "air-quality" if "air-quality" in url.path else "forecast"
+        query = parse_qs(url.query)
+        params = {k: v[0] for k, v in query.items()}
+        lats = [float(x) for x in params["latitude"].split(",")]
+        lons = [float(x) for x in params["longitude"].split(",")]
+        timezones = params.get("timezone", "GMT").split(",")
+        variables = query.get("hourly", [])
+        if len(variables) == 1:
+            variables = variables[0].split(",")
+        hours = _time_range(params, endpoint)
+
+        locations = []
+        for i, (lat, lon) in enumerate(zip(lats, lons)):
+            columns = {v: _series(server.recordings, endpoint, lat, lon, v, hours) for v in variables}
+            locations.append((lat, lon, timezones[min(i, len(timezones) - 1)], columns))
+
+        if params.get("format") == "flatbuffers":
+            body = b"".join(_flatbuffers_location(lat, lon, hours, columns) for lat, lon, _, columns in locations)
+            return self._send(200, body, "application/octet-stream")
+        payload = [_json_location(lat, lon, tz, hours, columns) for lat, lon, tz, columns in locations]
+        body = json.dumps(payload if len(payload) > 1 else payload[0]).encode()
+        return self._send(200, body, "application/json")
+
+
+def start_server(port=0, host="127.0.0.1", **config):
+    """Start a mock server in a background thread; returns it (see `.url`, `.shutdown()`)."""
+    server = MockOpenMeteoServer((host, port), **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def record(out_dir=RECORDINGS_DIR, past_days=92):
+    # Save live JSON responses for the registry cities, replayed later by the server
+    import requests
+    from cities import load_registry
+    from fetch import AIR_QUALITY_VARIABLES, WEATHER_VARIABLES
+
+    os.makedirs(out_dir, exist_ok=True)
+    for city in load_registry().records():
+        for endpoint, variables in (("air-quality", AIR_QUALITY_VARIABLES), ("forecast", WEATHER_VARIABLES)):
+            params = {"latitude": city["lat"], "longitude": city["lon"], "hourly": ",".join(variables),
+                      "past_days": past_days, "timezone": city["tz"]}
+            response = requests.get(LIVE_URLS[endpoint], params=params, timeout=60)
+            response.raise_for_status()
+            path = os.path.join(out_dir, f"{endpoint}_{city['name'].lower()}.json")
+            with open(path, "w") as f:
+                json.dump(response.json(), f)
+            print(f"✅ Recorded {endpoint} for {city['name']} -> {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Open-Meteo stand-in for offline benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="serve recorded/synthetic responses")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--latency-ms", type=float, default=0.0, help="mean added latency per request")
+    serve.add_argument("--jitter-ms", type=float, default=0.0, help="std-dev of the added latency")
+    serve.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with HTTP 503")
+    serve.add_argument("--recordings", default=RECORDINGS_DIR)
+    rec = sub.add_parser("record", help="record live responses for the registry cities")
+    rec.add_argument("--out", default=RECORDINGS_DIR)
+    rec.add_argument("--past-days", type=int, default=92)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.out, args.past_days)
+    else:
+        server = MockOpenMeteoServer(("127.0.0.1", args.port), latency_ms=args.latency_ms,
+                                     jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                                     recordings_dir=args.recordings)
+        print(f"🛰️ Mock Open-Meteo on {server.url} "
+              f"({len(server.recordings)} recorded locations, latency {args.latency_ms} ms, "
+              f"error rate {args.error_rate:.1%})")
+        server.serve_forever()
@@ -1,6 +1,5 @@
 # from sklearn.ensemble import RandomForestRegressor
-# from sklearn.metrics import mean_absolute_error, root_mean_squared_error, r2_score
-# import joblib
+# # import joblib
 # import pandas as pd
 # import os
 
@@ -32,92 +31,396 @@
 # joblib.dump(model, "model/aqi_rf_model.joblib")
 # os.makedirs("model", exist_ok=True)
 
+import argparse
+import json
+import numpy as np
 import pandas as pd
 import os
+import joblib
 from sklearn.linear_model import LinearRegression, Ridge
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.metrics import mean_absolute_error, root_mean_squared_error, r2_score
+from sklearn.metrics import mean_absolute_error
 import matplotlib.pyplot as plt
+import feature_store
+import tuning
+import forecaster
+import telemetry
+from artifact import export_model
+from intervals import residuals_path, save_residuals
+from explain import sample_background
+from cities import load_registry
+from training import (
+    TARGET, FEATURES, LinearStats, StreamingMetrics, iter_training_batches, per_city_split, time_cutoff,
+    train_parallel,
+)
 
-# Load feature data
-df = pd.read_csv("data/historical_combined_cities.csv", parse_dates=["time"])
-df.set_index("time", inplace=True)
-
-# Split chronologically
-split_idx = int(len(df) * 0.8)
-train = df.iloc[:split_idx]
-test = df.iloc[split_idx:]
-# print len of train and test sets
-print(f"Training set size: {len(train)}, Test set size: {len(test)}")
-
-X_train = train.drop(columns=["us_aqi"])
-y_train = train["us_aqi"]
-X_test = test.drop(columns=["us_aqi"])
-y_test = test["us_aqi"]
-
-# Define models to compare
-models = {
-    "LinearRegression": LinearRegression(),
-    "RidgeRegression": Ridge(alpha=1.0),
-    "RandomForest": RandomForestRegressor(
-        n_estimators=100,      # 100-200 trees is reasonable for 2000 samples
-        max_depth=10,          # limit depth to prevent overfitting
-        min_samples_split=10,  # require at least 10 samples to split a node
-        random_state=42
-    ),
-    "GradientBoosting": GradientBoostingRegressor(
-        n_estimators=100,      # 100 boosting stages
-        learning_rate=0.1,     # default, can tune lower for more trees
-        max_depth=5,           # shallower trees for boosting
-        subsample=0.8,         # use 80% of data for each tree to reduce overfitting
-        random_state=42
-    )
-}
-
-# Ensure model directory exists
-os.makedirs("model", exist_ok=True)
-
-# Results
-results = []
-
-predictions = {}
-for name, model in models.items():
-    print(f"Training {name}...")
-    model.fit(X_train, y_train)
-    y_pred = model.predict(X_test)
-    predictions[name] = y_pred
-
-    # Evaluate
-    mae = mean_absolute_error(y_test, y_pred)
-    rmse = root_mean_squared_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
-    
-
-    results.append({
-        "Model": name,
-        "MAE": mae,
-        "RMSE": rmse,
-        "R2": r2
-    })
-
-    # Save model
-    import joblib
-    joblib.dump(model, f"model/{name}.joblib")
-
-# Visualize all predictions together
-plt.figure(figsize=(12, 6))
-plt.plot(y_test.values, label="Actual", color="black", linewidth=2)
-colors = ["tab:blue", "tab:orange", "tab:green", "tab:red", "tab:purple", "tab:brown", "tab:pink", "tab:gray", "tab:olive", "tab:cyan"]
-for idx, (name, y_pred) in enumerate(predictions.items()):
-    plt.plot(y_pred, label=name, color=colors[idx % len(colors)])
-plt.legend()
-plt.title("AQI Prediction Comparison Across Models")
-plt.xlabel("Sample Index")
-plt.ylabel("US AQI")
-plt.tight_layout()
-plt.show()
-
-# Show results
-results_df = pd.DataFrame(results)
-print("\nModel Comparison:")
-print(results_df.sort_values(by="RMSE"))
+MODEL_DIR = "model"
+BEST_PARAMS_PATH = f"{MODEL_DIR}/best_params.json"
+STATE_PATH = f"{MODEL_DIR}/train_state.json"
+LINEAR_STATS_PATH = f"{MODEL_DIR}/linear_stats.npz"
+
+# --- Incremental retraining ---
+DRIFT_TOLERANCE = 0.25        # full refit once MAE on new rows exceeds the full-fit test MAE by 25%
+WARM_START_ESTIMATORS = 10    # trees / boosting stages added per incremental run
+MAX_ESTIMATOR_GROWTH = 2.0    # full refit once an ensemble reaches 2x its configured size
+
+
+def save_model(name, model):
+    # Pickle for retraining, plus a NumPy-only inference artifact for predict.py
+    joblib.dump(model, f"{MODEL_DIR}/{name}.joblib")
+    export_model(model, f"{MODEL_DIR}/{name}.npz", FEATURES)
+
+
+def build_models():
+    # Define models to compare
+    models = {
+        "LinearRegression": LinearRegression(),
+        "RidgeRegression": Ridge(alpha=1.0),
+        "RandomForest": RandomForestRegressor(
+            n_estimators=100,      # 100-200 trees is reasonable for 2000 samples
+            max_depth=10,          # limit depth to prevent overfitting
+            min_samples_split=10,  # require at least 10 samples to split a node
+            n_jobs=-1,             # trees are independent; use spare cores
+            random_state=42
+        ),
+        "GradientBoosting": GradientBoostingRegressor(
+            n_estimators=100,      # 100 boosting stages
+            learning_rate=0.1,     # default, can tune lower for more trees
+            max_depth=5,           # shallower trees for boosting
+            subsample=0.8,         # use 80% of data for each tree to reduce overfitting
+            random_state=42
+        )
+    }
+    # Apply hyperparameters picked by `python model.py --cv`, if any
+    if os.path.exists(BEST_PARAMS_PATH):
+        with open(BEST_PARAMS_PATH) as f:
+            for name, params in json.load(f).items():
+                if name in models:
+                    models[name].set_params(**params)
+    return models
+
+
+def train_in_memory(n_jobs=-1):
+    # Load feature data (Parquet feature store, compact dtypes, sorted by city then time);
+    # provisional hours (rest of today) are left for a later run, once observed
+    with telemetry.span("read") as span:
+        df = feature_store.read()
+        df = df[feature_store.observed(df)]
+        df.set_index("time", inplace=True)
+        span.set(rows=len(df))
+
+    # Split chronologically per city: the last 20% of every city's hours are held out
+    # (a row split of the city-sorted store would hold out only the last cities)
+    is_test = per_city_split(df)
+    train = df[~is_test]
+    test = df[is_test]
+    # print len of train and test sets
+    print(f"Training set size: {len(train)}, Test set size: {len(test)}")
+
+    X_train = train[FEATURES]
+    y_train = train[TARGET]
+    X_test = test[FEATURES]
+    y_test = test[TARGET]
+
+    # Ensure model directory exists
+    os.makedirs(MODEL_DIR, exist_ok=True)
+
+    # Fit all candidates concurrently, timing fit/predict and peak RSS per model; the
+    # tracemalloc peak costs a second traced fit, so it is only taken when profiling
+    # (AQI_PROFILE=...)
+    print(f"Training {', '.join(build_models())} in parallel...")
+    with telemetry.span("train", rows=len(X_train)):
+        fitted = train_parallel(build_models(), X_train, y_train, X_test, y_test, n_jobs=n_jobs,
+                                measure_memory=bool(telemetry.PROFILE))
+
+    results = []
+    predictions = {}
+    with telemetry.span("write"):
+        for name, (model, y_pred, row) in fitted.items():
+            predictions[name] = y_pred
+            results.append(row)
+            # Save model, plus its held-out errors for conformal prediction intervals
+            save_model(name, model)
+            save_residuals(f"{MODEL_DIR}/{name}.npz", y_test.to_numpy() - y_pred)
+
+        # Persist what --incremental builds on: X^T X / X^T y of every row the
+        # watermarks cover (test rows included), the newest hour per city and the test
+        # MAE each model is held to; refresh the fixed SHAP background sample along with it
+        LinearStats(len(FEATURES)).update(df[FEATURES], df[TARGET]).save(LINEAR_STATS_PATH)
+        sample_background(FEATURES)
+        save_state({
+            "watermarks": city_watermarks(df.reset_index()),
+            "baseline_mae": {row["Model"]: row["MAE"] for row in results},
+            "base_estimators": {
+                name: model.n_estimators for name, (model, _, _) in fitted.items() if hasattr(model, "n_estimators")
+            },
+        })
+
+    # Visualize all predictions together
+    plt.figure(figsize=(12, 6))
+    plt.plot(y_test.values, label="Actual", color="black", linewidth=2)
+    colors = ["tab:blue", "tab:orange", "tab:green", "tab:red", "tab:purple", "tab:brown", "tab:pink", "tab:gray", "tab:olive", "tab:cyan"]
+    for idx, (name, y_pred) in enumerate(predictions.items()):
+        plt.plot(y_pred, label=name, color=colors[idx % len(colors)])
+    plt.legend()
+    plt.title("AQI Prediction Comparison Across Models")
+    plt.xlabel("Sample Index")
+    plt.ylabel("US AQI")
+    plt.tight_layout()
+    plt.show()
+
+    return pd.DataFrame(results)
+
+
+def save_state(state):
+    with open(STATE_PATH, "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def load_state():
+    if not (os.path.exists(STATE_PATH) and os.path.exists(LINEAR_STATS_PATH)):
+        return None
+    with open(STATE_PATH) as f:
+        state = json.load(f)
+    # Older states kept one store-wide watermark; they are replaced by a full refit
+    return state if "watermarks" in state else None
+
+
+def city_watermarks(df, watermarks=None):
+    # Newest hour per city in `df`, merged into `watermarks` ({code: ISO time})
+    watermarks = dict(watermarks or {})
+    for city, newest in df.groupby("city")["time"].max().items():
+        watermarks[str(city)] = max(newest, pd.Timestamp(watermarks.get(str(city), newest))).isoformat()
+    return watermarks
+
+
+def retrain_incremental(n_jobs=-1):
+    # Update the saved models with rows newer than the last run instead of refitting:
+    # linear models re-solve from accumulated X^T X / X^T y, tree ensembles grow a few
+    # warm-started estimators on the new rows. Falls back to a full refit on drift.
+    state = load_state()
+    if state is None:
+        print("No training state found, running a full refit...")
+        return train_in_memory(n_jobs)
+
+    # Each city continues after its own newest folded hour, and only observed hours
+    # are folded: provisional values are still revised, and a folded row cannot be
+    # taken back out of the sums. Cities without a watermark are read in full.
+    watermarks = pd.Series({int(c): pd.Timestamp(t) for c, t in state["watermarks"].items()}, dtype="datetime64[ns]")
+    with telemetry.span("read") as span:
+        new_city = not np.isin(load_registry().codes, watermarks.index).all()
+        start = None if new_city or watermarks.empty else watermarks.min() + pd.Timedelta(hours=1)
+        new = feature_store.read(start=start)
+        newest = watermarks.reindex(new["city"].to_numpy(dtype="int64")).to_numpy()
+        new = new[~(new["time"].to_numpy() <= newest) & feature_store.observed(new)]
+        span.set(rows=len(new))
+    if new.empty:
+        print(f"No new observed rows since {watermarks.max()}, models unchanged.")
+        return pd.DataFrame(columns=["Model", "MAE_new", "baseline_MAE"])
+    X_new, y_new = new[FEATURES], new[TARGET]
+    print(f"Incremental retrain on {len(new)} new rows for {new['city'].nunique()} cities...")
+
+    # A --stream fit only refits the linear models; the stale tree models need a full refit
+    unfitted = [name for name in build_models() if name not in state["baseline_mae"]]
+    if unfitted:
+        print(f"Full refit triggered: {', '.join(unfitted)} not fitted with the current state (--stream run)")
+        return train_in_memory(n_jobs)
+
+    models = {name: joblib.load(f"{MODEL_DIR}/{name}.joblib") for name in build_models()}
+    results = []
+    refit_reasons = []
+    for name, model in models.items():
+        mae = mean_absolute_error(y_new, model.predict(X_new))
+        baseline = state["baseline_mae"][name]
+        results.append({"Model": name, "MAE_new": mae, "baseline_MAE": baseline})
+        if mae > baseline * (1 + DRIFT_TOLERANCE):
+            refit_reasons.append(f"{name} MAE {mae:.1f} > {baseline:.1f} (+{DRIFT_TOLERANCE:.0%})")
+        base = state["base_estimators"].get(name)
+        if base and model.n_estimators + WARM_START_ESTIMATORS > base * MAX_ESTIMATOR_GROWTH:
+            refit_reasons.append(f"{name} reached {model.n_estimators} estimators")
+    if refit_reasons:
+        print(f"Full refit triggered: {'; '.join(refit_reasons)}")
+        return train_in_memory(n_jobs)
+
+    with telemetry.span("train", rows=len(new)):
+        stats = LinearStats.load(LINEAR_STATS_PATH).update(X_new, y_new)
+        for name, model in models.items():
+            if isinstance(model, (LinearRegression, Ridge)):
+                stats.fit_estimator(model, FEATURES)
+            else:
+                model.set_params(warm_start=True, n_estimators=model.n_estimators + WARM_START_ESTIMATORS)
+                model.fit(X_new, y_new)
+
+    with telemetry.span("write"):
+        for name, model in models.items():
+            save_model(name, model)
+        stats.save(LINEAR_STATS_PATH)
+        state["watermarks"] = city_watermarks(new, state["watermarks"])
+        save_state(state)
+    return pd.DataFrame(results)
+
+
+def train_streaming(batch_rows):
+    # Bounded-memory training: the feature store is streamed in compact-dtype chunks
+    # and only X^T X / X^T y sums are kept, so memory does not grow with history.
+    # Tree ensembles need the full matrix and are left to the in-memory path.
+    # Like train_in_memory, only observed hours are used, and the held-out errors,
+    # the sums over every row and the training state are saved with the models.
+    linear_models = {
+        name: model for name, model in build_models().items()
+        if isinstance(model, (LinearRegression, Ridge))
+    }
+    cutoff = time_cutoff(test_size=0.2)
+    print(f"Streaming training data in chunks of {batch_rows} rows (test from {cutoff})...")
+
+    def observed_batches(**bounds):
+        for times, X, y in iter_training_batches(batch_rows, **bounds):
+            rows = feature_store.observed(pd.DataFrame({"time": times, "city": X["city"].to_numpy()}))
+            yield times[rows], X[rows], y[rows]
+
+    watermarks = {}
+    with telemetry.span("train") as span:
+        # Reading and accumulating are interleaved chunk by chunk, so they share a span
+        stats = LinearStats(len(FEATURES))
+        for times, X, y in observed_batches(end=cutoff):
+            train_rows = times < cutoff
+            stats.update(X[train_rows], y[train_rows])
+            watermarks = city_watermarks(pd.DataFrame({"time": times, "city": X["city"]}), watermarks)
+        span.set(rows=stats.n)
+    print(f"Training set size: {stats.n}")
+
+    for name, model in linear_models.items():
+        stats.fit_estimator(model, FEATURES)
+
+    with telemetry.span("evaluate") as span:
+        metrics = {name: StreamingMetrics() for name in linear_models}
+        residuals = {name: [] for name in linear_models}
+        test_stats = LinearStats(len(FEATURES))
+        for times, X, y in observed_batches(start=cutoff):
+            test_rows = times >= cutoff
+            times, X, y = times[test_rows], X[test_rows], y[test_rows]
+            for name, model in linear_models.items():
+                y_pred = model.predict(X)
+                metrics[name].update(y, y_pred)
+                residuals[name].append(y - y_pred)
+            test_stats.update(X, y)
+            watermarks = city_watermarks(pd.DataFrame({"time": times, "city": X["city"]}), watermarks)
+        span.set(rows=test_stats.n)
+    results = pd.DataFrame([{"Model": name, **m.result()} for name, m in metrics.items()])
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    with telemetry.span("write"):
+        for name, model in linear_models.items():
+            save_model(name, model)
+            if residuals[name]:
+                save_residuals(f"{MODEL_DIR}/{name}.npz", np.concatenate(residuals[name]))
+            elif os.path.exists(residuals_path(f"{MODEL_DIR}/{name}.npz")):
+                os.remove(residuals_path(f"{MODEL_DIR}/{name}.npz"))   # no held-out rows to calibrate on
+        # What --incremental builds on, as train_in_memory writes it; the tree models
+        # were not refitted, so they get no baseline and the next --incremental refits all
+        stats.merge(test_stats).save(LINEAR_STATS_PATH)
+        save_state({
+            "watermarks": watermarks,
+            "baseline_mae": {row["Model"]: row["MAE"] for _, row in results.iterrows()},
+            "base_estimators": {},
+        })
+    return results
+
+
+def train_recursive():
+    # Model for predict.py --mode recursive: weather/calendar inputs plus AQI lags,
+    # no upstream pollutant forecasts. Scored one step ahead on the last 20% of hours;
+    # the forecaster feeds its own predictions back in as lags at inference time.
+    with telemetry.span("read") as span:
+        df = feature_store.read()
+        span.set(rows=len(df))
+    with telemetry.span("features") as span:
+        df = forecaster.training_frame(df)
+        span.set(rows=len(df))
+    cutoff = df["time"].quantile(0.8)
+    train, test = df[df["time"] < cutoff], df[df["time"] >= cutoff]
+    print(f"Training set size: {len(train)}, Test set size: {len(test)}")
+
+    model = build_models()["RidgeRegression"]
+    with telemetry.span("train", rows=len(train)):
+        model.fit(train[forecaster.FEATURES], train[TARGET])
+    with telemetry.span("predict", rows=len(test)):
+        y_pred = model.predict(test[forecaster.FEATURES])
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    with telemetry.span("write"):
+        joblib.dump(model, forecaster.MODEL_PATH.rsplit(".", 1)[0] + ".joblib")
+        export_model(model, forecaster.MODEL_PATH, forecaster.FEATURES)
+        sample_background(forecaster.FEATURES, path=forecaster.BACKGROUND_PATH)
+    print(f"✅ Saved recursive model to {forecaster.MODEL_PATH}")
+
+    # Interval widths grow with the horizon, so calibrate on full rollouts over the
+    # test period rather than on one-step errors
+    with telemetry.span("backtest") as span:
+        residuals = forecaster.backtest_residuals(forecaster.load_model(), df, cutoff)
+        span.set(rows=residuals.size)
+        if len(residuals):
+            save_residuals(forecaster.MODEL_PATH, residuals)
+            print(f"✅ Saved {len(residuals)} backtest rollouts for prediction intervals")
+        else:
+            # Residuals of an older model would give this one the wrong intervals
+            if os.path.exists(residuals_path(forecaster.MODEL_PATH)):
+                os.remove(residuals_path(forecaster.MODEL_PATH))
+            print(f"⚠️ No full {forecaster.HORIZON}h backtest rollout after {cutoff} "
+                  f"(history too short or gappy); forecasts will have no prediction intervals")
+    return pd.DataFrame([{
+        "Model": "RecursiveRidge",
+        "MAE_1h": mean_absolute_error(test[TARGET], y_pred),
+        "MAE_24h": residuals[:, 23].mean() if len(residuals) else np.nan,
+        "MAE_72h": residuals[:, -1].mean() if len(residuals) else np.nan,
+    }])
+
+
+def cross_validate(n_jobs=-1):
+    # Walk-forward CV (per city, then by time) with successive-halving search;
+    # the winners are written to BEST_PARAMS_PATH for later retrains
+    with telemetry.span("read") as span:
+        df = feature_store.read()
+        span.set(rows=len(df))
+    with telemetry.span("train", rows=len(df)):
+        results = tuning.search(df, build_models(), n_jobs=n_jobs)
+    best = tuning.best_params(results)
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    results.to_csv(f"{MODEL_DIR}/cv_results.csv", index=False)
+    with open(BEST_PARAMS_PATH, "w") as f:
+        json.dump(best, f, indent=2)
+    print(f"✅ Saved CV results to {MODEL_DIR}/cv_results.csv and best params to {BEST_PARAMS_PATH}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train and compare AQI models")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream the feature store in chunks and fit the linear models from sufficient statistics")
+    parser.add_argument("--batch-rows", type=int, default=65_536, help="rows per chunk in --stream mode")
+    parser.add_argument("--cv", action="store_true",
+                        help="walk-forward cross-validation + hyperparameter search instead of a single split")
+    parser.add_argument("--incremental", action="store_true",
+                        help="update the saved models with rows added since the last run; full refit on drift")
+    parser.add_argument("--recursive", action="store_true",
+                        help="train the lag-feature model used by predict.py --mode recursive")
+    parser.add_argument("--jobs", type=int, default=-1, help="worker processes for model comparison (-1 = all cores)")
+    args = parser.parse_args()
+
+    with telemetry.run("model"):
+        if args.cv:
+            results_df = cross_validate(args.jobs)
+        elif args.recursive:
+            results_df = train_recursive()
+        elif args.incremental:
+            results_df = retrain_incremental(args.jobs)
+        elif args.stream:
+            results_df = train_streaming(args.batch_rows)
+        else:
+            results_df = train_in_memory(args.jobs)
+
+        # Show results
+        print("\nModel Comparison:")
+        with pd.option_context("display.max_columns", None, "display.width", None):
+            print(results_df if args.cv or args.incremental or args.recursive else results_df.sort_values(by="RMSE"))
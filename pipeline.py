@@ -0,0 +1,382 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+import forecaster
+import predict
+import render
+import telemetry
+from cities import load_registry
+from intervals import add_intervals, residuals_path
+
+# Dependency-aware runner for the whole pipeline, one entry point for the workflows:
+#
+#   observe ──> train / train_recursive ──┐
+#      │                                  v
+#      └─(lag state)─────────────> predict:<city> ──> explain:<city> ──> publish
+#   forecast ──> features:<city> ─────────┘
+#
+# train updates the direct models, train_recursive the lag-based one; predict nodes
+# depend only on the one their --mode scores with.
+#
+# Every node declares the files it reads and writes. Its fingerprint hashes the
+# content of its inputs, the source files of its code and its parameters; a node
+# whose fingerprint and outputs match its last recorded run is skipped. Nodes that
+# read the outside world (observe, forecast) always run, but when they produce
+# byte-identical files everything downstream is skipped. Per-city nodes are
+# independent and run in parallel on a thread pool.
+
+# --- Config ---
+PIPELINE_DIR = "data/pipeline"
+STATE_DIR = os.path.join(PIPELINE_DIR, "state")    # one record per node, so workflows never touch the same file
+STAGES = ["observe", "train", "forecast", "features", "predict", "explain", "publish", "evaluate"]
+MAX_WORKERS = 8
+MODEL_DIR = "model"
+STORE_PATH = "data/feature_store"    # feature_store.STORE_PATH, without importing pyarrow at startup
+LAG_STATE_PATH = "data/lag_state.npz"
+EVAL_DIR = "data/forecast_eval"      # forecast_archive.EVAL_DIR
+DIRECT_MODELS = ["LinearRegression", "RidgeRegression", "RandomForest", "GradientBoosting"]   # model.build_models()
+
+
+def _hash_file(path, cache):
+    # Content hash, memoized per (size, mtime) within one process
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in cache:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        cache[key] = digest.hexdigest()
+    return cache[key]
+
+
+def content_hash(paths, cache):
+    """One hash over the contents of files and directory trees; missing paths hash as missing."""
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(d, f) for d, _, names in os.walk(path) for f in names if not f.endswith(".tmp"))
+        elif os.path.exists(path):
+            files = [path]
+        else:
+            digest.update(f"{path}:missing;".encode())
+            continue
+        for f in files:
+            digest.update(f"{f}:{_hash_file(f, cache)};".encode())
+    return digest.hexdigest()
+
+
+class Node:
+    def __init__(self, name, stage, run, deps=(), inputs=(), outputs=(), code=(), params=None, volatile=False):
+        self.name = name
+        self.stage = stage
+        self.run = run
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.code = list(code)
+        self.params = params or {}
+        self.volatile = volatile
+
+
+class Pipeline:
+    """A DAG of nodes with content-hashed skip-if-unchanged execution."""
+
+    def __init__(self, nodes, state_dir=STATE_DIR):
+        self.nodes = {node.name: node for node in nodes}
+        self.state_dir = state_dir
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def _state_path(self, node):
+        return os.path.join(self.state_dir, node.name.replace(":", "__") + ".json")
+
+    def _load_state(self, node):
+        path = self._state_path(node)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_state(self, node, record):
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = self._state_path(node)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(record, f, indent=2, sort_keys=True)
+        os.replace(f"{path}.tmp", path)
+
+    def fingerprint(self, node):
+        return hashlib.sha1(json.dumps({
+            "inputs": content_hash(node.inputs, self._hashes),
+            "code": content_hash(node.code, self._hashes),
+            "params": node.params,
+        }, sort_keys=True).encode()).hexdigest()
+
+    def decide(self, node, force=False):
+        # (run?, reason, fingerprint)
+        fingerprint = self.fingerprint(node)
+        if node.volatile:
+            return True, "reads external data", fingerprint
+        if force:
+            return True, "forced", fingerprint
+        state = self._load_state(node)
+        if state is None:
+            return True, "never ran", fingerprint
+        if state["fingerprint"] != fingerprint:
+            return True, "inputs changed", fingerprint
+        for path in node.outputs:
+            if state["outputs"].get(path) != content_hash([path], self._hashes):
+                return True, f"{path} changed", fingerprint
+        return False, "unchanged", fingerprint
+
+    def _matches(self, node, names):
+        return node.name in names or node.stage in names
+
+    def select(self, targets):
+        # Targets plus everything upstream of them, in topological (insertion) order
+        selected = set()
+        stack = [name for name, node in self.nodes.items() if self._matches(node, targets)]
+        while stack:
+            name = stack.pop()
+            if name not in selected:
+                selected.add(name)
+                stack.extend(self.nodes[name].deps)
+        return [name for name in self.nodes if name in selected]
+
+    def _execute(self, node, force):
+        with telemetry.span(node.name) as span:
+            run, reason, fingerprint = self.decide(node, force)
+            span.set(skipped=not run)
+            if not run:
+                return "skipped", reason
+            node.run()
+            outputs = {path: content_hash([path], self._hashes) for path in node.outputs}
+            with self._lock:
+                self._save_state(node, {"fingerprint": fingerprint, "outputs": outputs})
+            return "ran", reason
+
+    def run(self, targets, exclude=(), force=(), workers=MAX_WORKERS, dry_run=False):
+        """Run `targets` (stage or node names) and their upstream nodes; returns {node: status}."""
+        order = self.select(targets)
+        if dry_run:
+            for name in order:
+                node = self.nodes[name]
+                run, reason, _ = (False, "excluded", None) if self._matches(node, exclude) else \
+                    self.decide(node, self._matches(node, force))
+                print(f"{'▶️' if run else '⏭️'} {name:<28} {reason}")
+            return {}
+
+        status = {}
+        pending = list(order)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            running = {}
+            while pending or running:
+                for name in list(pending):
+                    node = self.nodes[name]
+                    deps = [d for d in node.deps if d in order]
+                    if any(status.get(d) in ("failed", "blocked") for d in deps):
+                        status[name] = "blocked"
+                        print(f"⛔ {name:<28} blocked by a failed dependency")
+                    elif self._matches(node, exclude):
+                        status[name] = "excluded"
+                    elif all(d in status for d in deps):
+                        running[pool.submit(self._execute, node, self._matches(node, force))] = name
+                    else:
+                        continue
+                    pending.remove(name)
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        status[name], reason = future.result()
+                        print(f"{'✅' if status[name] == 'ran' else '⏭️'} {name:<28} {status[name]} ({reason})")
+                    except Exception as e:
+                        status[name] = "failed"
+                        print(f"❌ {name:<28} failed: {type(e).__name__}: {e}")
+
+        counts = pd.Series(status, dtype=object).value_counts().to_dict()
+        print("🧭 Pipeline: " + ", ".join(f"{n} {s}" for s, n in counts.items()))
+        return status
+
+
+def _city_path(kind, name):
+    return os.path.join(PIPELINE_DIR, kind, f"{name}.parquet")
+
+
+def _write(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_parquet(path)
+
+
+def _remove(*paths):
+    # A city missing from this run must not leave last run's files behind
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def build_nodes(cities, mode="direct", shap_png=False, shap_format=render.FORMAT, shap_dpi=render.DPI):
+    recursive = mode == "recursive"
+    model_path = forecaster.MODEL_PATH if recursive else predict.MODEL_PATH
+    background_path = forecaster.BACKGROUND_PATH if recursive else predict.BACKGROUND_PATH
+    joblib_path = model_path.rsplit(".", 1)[0] + ".joblib"   # read by SHAP for tree models
+    model_files = [model_path, residuals_path(model_path)]
+    names = {city["city_code"]: city["name"].lower() for city in cities.records()}
+
+    def observe():
+        from backfill_data import backfill
+        backfill(cities)
+
+    # The SHAP backgrounds are built here, once, rather than by each city's explain thread
+    def train():
+        import model
+        from explain import load_background
+        model.retrain_incremental()
+        load_background(model.FEATURES, path=predict.BACKGROUND_PATH)
+
+    def train_recursive():
+        import model
+        model.train_recursive()
+
+    def fetch():
+        fetched = set()
+        for city, aq_df, weather_df in predict.fetch_forecast(cities, forecaster.FORECAST_DAYS if recursive else 3):
+            name = names[city["city_code"]]
+            _write(aq_df, _city_path("air_quality", name))
+            _write(weather_df, _city_path("weather", name))
+            fetched.add(name)
+        for name in set(names.values()) - fetched:
+            _remove(_city_path("air_quality", name), _city_path("weather", name))
+
+    def features(code, name):
+        aq_path, weather_path, out = _city_path("air_quality", name), _city_path("weather", name), _city_path("features", name)
+        if not (os.path.exists(aq_path) and os.path.exists(weather_path)):
+            return _remove(out)
+        _write(predict.city_features(pd.read_parquet(aq_path), pd.read_parquet(weather_path), code), out)
+
+    def predict_city(name):
+        features_path, out = _city_path("features", name), _city_path("predictions", name)
+        if not os.path.exists(features_path):
+            return _remove(out)
+        features = pd.read_parquet(features_path)
+        model = forecaster.load_model(model_path)
+        if recursive:
+            from lag_features import LagState
+            results = forecaster.RecursiveForecaster(model, LagState.load(LAG_STATE_PATH)).forecast(features)
+        else:
+            results = predict.score(features, model)
+        _write(add_intervals(results, model_path), out)
+
+    def explain(name):
+        predictions_path, out = _city_path("predictions", name), _city_path("shap", name)
+        if not os.path.exists(predictions_path):
+            return _remove(out)
+        results = pd.read_parquet(predictions_path)
+        shap_df = predict.shap_frame(results, forecaster.load_model(model_path), cities, render_png=shap_png,
+                                     model_path=model_path, background_path=background_path,
+                                     fmt=shap_format, dpi=shap_dpi)
+        _write(shap_df, out)
+
+    def publish():
+        cities_done = [name for name in names.values() if os.path.exists(_city_path("shap", name))]
+        if not cities_done:
+            raise RuntimeError("no city has predictions to publish")
+        all_results = pd.concat([pd.read_parquet(_city_path("predictions", name)) for name in cities_done])
+        all_shap = pd.concat([pd.read_parquet(_city_path("shap", name)) for name in cities_done], ignore_index=True)
+        os.makedirs("data", exist_ok=True)
+        all_shap.to_parquet(predict.SHAP_VALUES_PATH, index=False)
+        print(f"✅ Saved SHAP attributions for {len(cities_done)} cities to {predict.SHAP_VALUES_PATH}")
+        predict.write_predictions(all_results, cities, mode)
+
+    def evaluate():
+        import forecast_archive
+        forecast_archive.evaluate(cities)
+
+    nodes = [
+        Node("observe", "observe", observe, outputs=[STORE_PATH, LAG_STATE_PATH], volatile=True),
+        Node("train", "train", train, deps=["observe"], inputs=[STORE_PATH, f"{MODEL_DIR}/best_params.json"],
+             outputs=[f"{MODEL_DIR}/{name}{suffix}" for name in DIRECT_MODELS
+                      for suffix in (".joblib", ".npz", "_residuals.npz")]
+             + [f"{MODEL_DIR}/linear_stats.npz", f"{MODEL_DIR}/train_state.json", predict.BACKGROUND_PATH],
+             code=["model.py", "training.py", "feature_store.py", "artifact.py", "intervals.py", "explain.py"]),
+        Node("train_recursive", "train", train_recursive, deps=["observe"],
+             inputs=[STORE_PATH, f"{MODEL_DIR}/best_params.json"],
+             outputs=[forecaster.MODEL_PATH, forecaster.MODEL_PATH.rsplit(".", 1)[0] + ".joblib",
+                      residuals_path(forecaster.MODEL_PATH), forecaster.BACKGROUND_PATH],
+             code=["model.py", "forecaster.py", "lag_features.py", "feature_store.py", "artifact.py", "intervals.py",
+                   "explain.py"]),
+        Node("forecast", "forecast", fetch, params={"mode": mode}, volatile=True,
+             outputs=[_city_path(kind, name) for name in names.values() for kind in ("air_quality", "weather")]),
+    ]
+    for code, name in names.items():
+        nodes.append(Node(
+            f"features:{name}", "features", lambda code=code, name=name: features(code, name), deps=["forecast"],
+            inputs=[_city_path("air_quality", name), _city_path("weather", name)],
+            outputs=[_city_path("features", name)], code=["predict.py", "fetch.py"], params={"city": code},
+        ))
+        nodes.append(Node(
+            f"predict:{name}", "predict", lambda name=name: predict_city(name),
+            deps=[f"features:{name}", "train_recursive" if recursive else "train"] + (["observe"] if recursive else []),
+            inputs=[_city_path("features", name)] + model_files + ([LAG_STATE_PATH] if recursive else []),
+            outputs=[_city_path("predictions", name)],
+            code=["predict.py", "forecaster.py", "intervals.py", "artifact.py", "lag_features.py"],
+            params={"mode": mode},
+        ))
+        nodes.append(Node(
+            f"explain:{name}", "explain", lambda name=name: explain(name), deps=[f"predict:{name}"],
+            inputs=[_city_path("predictions", name), model_path, joblib_path, background_path],
+            outputs=[_city_path("shap", name)] + ([render.shap_summary_path(name, shap_format)] if shap_png else []),
+            code=["predict.py", "explain.py", "render.py"],
+            params={"shap_png": shap_png, "shap_format": shap_format, "shap_dpi": shap_dpi},
+        ))
+    nodes.append(Node(
+        "publish", "publish", publish, deps=[f"explain:{name}" for name in names.values()],
+        inputs=[_city_path(kind, name) for name in names.values() for kind in ("predictions", "shap")],
+        outputs=[predict.PREDICTIONS_PATH, predict.SHAP_VALUES_PATH, predict.AGGREGATES_PATH],
+        code=["predict.py", "dashboard.py", "forecast_archive.py"], params={"mode": mode},
+    ))
+    # Incremental, so it simply runs after every observation
+    nodes.append(Node("evaluate", "evaluate", evaluate, deps=["observe"], outputs=[EVAL_DIR], volatile=True))
+    return nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the AQI pipeline, skipping stages whose inputs are unchanged")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="run targets and everything upstream of them")
+    run.add_argument("targets", nargs="*", default=["publish"], help=f"stages ({', '.join(STAGES)}) or nodes")
+    run.add_argument("--exclude", nargs="+", default=[], help="stages/nodes not to run; their current outputs are used")
+    run.add_argument("--force", nargs="+", default=[], help="stages/nodes to run even if unchanged")
+    run.add_argument("--mode", choices=["direct", "recursive"], default="direct")
+    run.add_argument("--shap-png", action="store_true", help="also render per-city SHAP summary images")
+    run.add_argument("--shap-format", choices=sorted(render.MIME_TYPES), default=render.FORMAT)
+    run.add_argument("--shap-dpi", type=int, default=render.DPI)
+    run.add_argument("--workers", type=int, default=MAX_WORKERS)
+    run.add_argument("--dry-run", action="store_true", help="print what would run and why")
+    graph = sub.add_parser("graph", help="print the nodes and their dependencies")
+    graph.add_argument("--mode", choices=["direct", "recursive"], default="direct")
+    args = parser.parse_args()
+
+    pipeline = Pipeline(build_nodes(load_registry(), args.mode, getattr(args, "shap_png", False),
+                                    getattr(args, "shap_format", render.FORMAT), getattr(args, "shap_dpi", render.DPI)))
+    if args.command == "graph":
+        for node in pipeline.nodes.values():
+            print(f"{node.name:<28} <- {', '.join(node.deps) or '-'}")
+        return 0
+
+    with telemetry.run("pipeline"):
+        status = pipeline.run(args.targets, args.exclude, args.force, args.workers, args.dry_run)
+    return 1 if any(s in ("failed", "blocked") for s in status.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
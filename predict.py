@@ -1,100 +1,190 @@
+import argparse
+import time
 import pandas as pd
-import requests
-import joblib
 from datetime import datetime
-import shap
-import matplotlib.pyplot as plt
+import os
 from os import makedirs
+import forecaster
+import render
+import telemetry
+from explain import BACKGROUND_PATH, Explainer, load_background
+from lag_features import LagState
+from intervals import COVERAGE, add_intervals
+from cities import load_registry
+from dashboard import AGGREGATES_PATH, write_aggregates
 
+MODEL_PATH = "model/RidgeRegression.npz"
+PREDICTIONS_PATH = "data/predicted_aqi_72hr.csv"
+SHAP_VALUES_PATH = "data/shap_values.parquet"
 
-# Load best model
-model = joblib.load("model/RidgeRegression.joblib")
-
-# City info: Karachi=0, Islamabad=1, Lahore=2
-city_info = [
-    {"name": "Karachi", "lat": 24.8607, "lon": 67.0011, "tz": "Asia/Karachi", "city_code": 0},
-    {"name": "Islamabad", "lat": 33.6844, "lon": 73.0479, "tz": "Asia/Karachi", "city_code": 1},
-    {"name": "Lahore", "lat": 31.5497, "lon": 74.3436, "tz": "Asia/Karachi", "city_code": 2},
-]
-
-
-# Collect predictions for all cities
-all_city_results = []
-for city in city_info:
-    print(f"Fetching forecast for {city['name']}...")
-    # Air Quality
-    aq_url = "https://air-quality-api.open-meteo.com/v1/air-quality"
-    aq_params = {
-        "latitude": city["lat"],
-        "longitude": city["lon"],
-        "hourly": [
-            "us_aqi", "pm10", "pm2_5", "ozone",
-            "carbon_monoxide", "nitrogen_dioxide", "sulphur_dioxide"
-        ],
-        "forecast_days": 3,
-        "timezone": city["tz"]
-    }
-    aq_response = requests.get(aq_url, params=aq_params)
-    if aq_response.status_code != 200:
-        print(f"❌ Failed to fetch air quality forecast for {city['name']}")
-        continue
-    aq_df = pd.DataFrame(aq_response.json()["hourly"])
-
-    # Weather
-    weather_url = "https://api.open-meteo.com/v1/forecast"
-    weather_params = {
-        "latitude": city["lat"],
-        "longitude": city["lon"],
-        "hourly": [
-            "temperature_2m", "relative_humidity_2m",
-            "wind_speed_10m", "cloud_cover", "precipitation"
-        ],
-        "forecast_days": 3,
-        "timezone": city["tz"]
-    }
-    weather_response = requests.get(weather_url, params=weather_params)
-    if weather_response.status_code != 200:
-        print(f"❌ Failed to fetch weather forecast for {city['name']}")
-        continue
-    weather_df = pd.DataFrame(weather_response.json()["hourly"])
+
+def fetch_forecast(cities, forecast_days=3):
+    # Forecast inputs as (city, aq_df, weather_df) per city
+    # (HTTP stack imported here so --features runs never load it)
+    from fetch import fetch_city_frames
+
+    print(f"Fetching forecast for {len(cities)} cities...")
+    return fetch_city_frames(cities.records(), {"forecast_days": forecast_days}, weather_format="json",
+                             batch_size=cities.batch_size)
+
+
+def city_features(aq_df, weather_df, city_code):
+    from fetch import add_time_features
 
     # Merge by time
-    df = pd.merge(aq_df, weather_df, on="time")
-    df["time"] = pd.to_datetime(df["time"])
-    df.set_index("time", inplace=True)
-    df.sort_index(inplace=True)
+    df = pd.merge(aq_df, weather_df, left_index=True, right_index=True, how="inner")
     # Drop us_aqi (target) if present
     if "us_aqi" in df.columns:
         df.drop(columns=["us_aqi"], inplace=True)
-    # Add time-based features
-    df["dayofweek"] = df.index.dayofweek
-    df["hour"] = df.index.hour
-    df["month"] = df.index.month
-    # Add city column
-    df["city"] = city["city_code"]
-    # Predict
-    predictions = model.predict(df)
-    df["predicted_us_aqi"] = predictions
-    all_city_results.append(df)
-
-# Combine all cities
-all_results = pd.concat(all_city_results)
-
-
-# SHAP analysis for each city
-for city, city_df in zip(city_info, all_city_results):
-    explainer = shap.Explainer(model, city_df.drop(columns=["predicted_us_aqi"]))
-    shap_values = explainer(city_df.drop(columns=["predicted_us_aqi"]))
-    plt.figure()
-    shap.summary_plot(shap_values, city_df.drop(columns=["predicted_us_aqi"]), show=False)
-    plt.tight_layout()
-    plt.savefig(f"data/shap_summary_{city['name'].lower()}.png", dpi=300)
-    plt.close()
-    
-makedirs("data", exist_ok=True)
-
-# Save results with all features and predictions
-all_results.reset_index(inplace=True)
-all_results.to_csv("data/predicted_aqi_72hr.csv", index=False)
-print("✅ Saved 72-hour AQI predictions for all cities to data/predicted_aqi_72hr.csv")
-print("SHAP summary plots saved for each city")
+    # Add time-based features + city column
+    return add_time_features(df, city_code)
+
+
+def build_features(cities, forecast_days=3):
+    # Fetch the 72h forecast inputs for every city and stack them into one feature frame
+    frames = fetch_forecast(cities, forecast_days)
+    with telemetry.span("merge") as span:
+        features = pd.concat([city_features(aq_df, weather_df, city["city_code"]) for city, aq_df, weather_df in frames])
+        span.set(rows=len(features))
+    return features
+
+
+def load_features(path):
+    # Precomputed feature matrix (Parquet or CSV) with a `time` column
+    df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path, parse_dates=["time"])
+    return df.set_index("time")
+
+
+def score(features, model):
+    # One vectorized call for all cities, columns in the model's training order
+    missing = [c for c in model.features if c not in features.columns]
+    if missing:
+        raise ValueError(f"Feature matrix is missing columns required by the model: {missing}")
+    results = features[model.features].copy()
+    results["predicted_us_aqi"] = model.predict(results[model.features])
+    return results
+
+
+def shap_frame(results, model, cities, render_png=False, model_path=MODEL_PATH, background_path=BACKGROUND_PATH,
+               fmt=render.FORMAT, dpi=render.DPI):
+    # SHAP analysis for each city: exact linear attributions against a fixed history
+    # background, cached per (model, inputs). Summary images are optional, drawn in
+    # parallel and only for cities whose attributions or render settings changed.
+    explainer = Explainer(model, model_path, background=load_background(model.features, path=background_path))
+    city_frames = []
+    jobs = []
+    for city_code, city_df in results.groupby("city", sort=False):
+        name = cities.name(city_code).lower()
+        X = city_df[model.features]
+        shap_values, base_value, changed = explainer.explain(X, cache_key=name)
+
+        shap_df = pd.DataFrame(
+            shap_values.astype("float32"), columns=[f"shap_{c}" for c in model.features], index=X.index
+        )
+        shap_df.insert(0, "base_value", base_value)
+        shap_df.insert(0, "city", city_code)
+        city_frames.append(shap_df)
+
+        if render_png:
+            jobs.append(render.shap_summary_job(name, shap_values, X, model.features, fmt, dpi))
+
+    if jobs:
+        with telemetry.span("render") as span:
+            rendered = render.render_all(jobs)
+            span.set(rows=len(rendered))
+        if rendered:
+            print(f"🖼️ Rendered {len(rendered)} of {len(jobs)} SHAP summaries ({fmt}, {dpi} dpi)")
+    return pd.concat(city_frames).reset_index()
+
+
+def explain(results, model, cities, render_png=False, model_path=MODEL_PATH, background_path=BACKGROUND_PATH,
+            fmt=render.FORMAT, dpi=render.DPI):
+    # Attributions for all cities, saved as data for the dashboard
+    all_shap = shap_frame(results, model, cities, render_png, model_path, background_path, fmt, dpi)
+    with telemetry.span("write_shap") as span:
+        all_shap.to_parquet(SHAP_VALUES_PATH, index=False)
+        span.set(rows=len(all_shap), bytes=os.path.getsize(SHAP_VALUES_PATH))
+    return all_shap
+
+
+def write_predictions(all_results, cities=None, mode="direct"):
+    # Save results with all features and predictions, plus what the dashboard shows
+    # (bands, correlations, histograms, summary). With `cities`, the run is also added
+    # to the forecast archive (under `mode`) for forecast_archive.py evaluate.
+    with telemetry.span("write") as span:
+        all_results = all_results.reset_index()
+        all_results.to_csv(PREDICTIONS_PATH, index=False)
+        print(f"✅ Saved 72-hour AQI predictions (with {COVERAGE:.0%} intervals) for all cities to {PREDICTIONS_PATH}")
+        write_aggregates(all_results)
+        print(f"✅ Saved dashboard aggregates to {AGGREGATES_PATH}")
+        span.set(rows=len(all_results),
+                 bytes=os.path.getsize(PREDICTIONS_PATH) + os.path.getsize(AGGREGATES_PATH))
+    if cities is not None:
+        import forecast_archive
+        with telemetry.span("archive") as span:
+            span.set(rows=forecast_archive.append(all_results, cities, mode))
+        print(f"✅ Archived forecast to {forecast_archive.ARCHIVE_PATH}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="72-hour AQI forecast for all cities")
+    parser.add_argument("--features", help="score a precomputed feature matrix (.parquet/.csv) instead of fetching")
+    parser.add_argument("--shap-png", action="store_true", help="also render per-city SHAP summary images")
+    parser.add_argument("--shap-format", choices=sorted(render.MIME_TYPES), default=render.FORMAT,
+                        help="image format of the SHAP summaries (e.g. webp for smaller files)")
+    parser.add_argument("--shap-dpi", type=int, default=render.DPI,
+                        help="resolution of the SHAP summaries; hi-res versions are drawn on demand by render.py")
+    parser.add_argument("--save-features", help="also write the assembled feature matrix to this .parquet path")
+    parser.add_argument("--mode", choices=["direct", "recursive"], default="direct",
+                        help="direct: score upstream pollutant forecasts; recursive: roll AQI lags forward "
+                             "from the latest observations (model.py --recursive)")
+    args = parser.parse_args()
+    with telemetry.run("predict"):
+        run_forecast(args)
+
+
+def run_forecast(args):
+    recursive = args.mode == "recursive"
+    model_path = forecaster.MODEL_PATH if recursive else MODEL_PATH
+
+    # Load model (NumPy inference artifact exported by model.py; no sklearn/pickle needed)
+    with telemetry.span("load_model"):
+        model = forecaster.load_model(model_path)
+
+    cities = load_registry()
+    with telemetry.span("features") as span:
+        if args.features:
+            features = load_features(args.features)
+        else:
+            features = build_features(cities, forecaster.FORECAST_DAYS if recursive else 3)
+        if args.save_features:
+            features.reset_index().to_parquet(args.save_features, index=False)
+        span.set(rows=len(features))
+
+    start = time.perf_counter()
+    with telemetry.span("predict", mode=args.mode) as span:
+        if recursive:
+            all_results = forecaster.RecursiveForecaster(model, LagState.load()).forecast(features)
+        else:
+            all_results = score(features, model)
+        all_results = add_intervals(all_results, model_path)
+        span.set(rows=len(all_results))
+    elapsed = time.perf_counter() - start
+    steps = all_results.groupby("city").size().max()
+    print(f"⏱️ Inference ({args.mode}): {steps}h x {all_results['city'].nunique()} cities "
+          f"= {len(all_results)} predictions in {elapsed * 1000:.1f} ms")
+
+    makedirs("data", exist_ok=True)
+    with telemetry.span("explain") as span:
+        shap_df = explain(all_results, model, cities, render_png=args.shap_png, model_path=model_path,
+                          background_path=forecaster.BACKGROUND_PATH if recursive else BACKGROUND_PATH,
+                          fmt=args.shap_format, dpi=args.shap_dpi)
+        span.set(rows=len(shap_df))
+
+    # Replayed feature files are not live forecasts, so they are not archived
+    write_predictions(all_results, None if args.features else cities, args.mode)
+    print(f"✅ Saved SHAP attributions for all cities to {SHAP_VALUES_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+
+# Static chart artifacts (SHAP summary beeswarms) drawn with matplotlib's
+# object-oriented Agg API: every figure is a standalone Figure + FigureCanvasAgg, no
+# pyplot state, so cities render independently in a process pool and rendering time
+# scales with cores. Files are only redrawn when their inputs or settings change (a
+# content stamp per file in STAMPS_PATH). The dashboard shows small thumbnails; hi-res
+# versions are drawn on demand from the saved SHAP values (`shap_summary_bytes`).
+
+# --- Config ---
+FORMAT = os.environ.get("AQI_RENDER_FORMAT", "png")      # png, webp, jpg, svg, pdf
+DPI = int(os.environ.get("AQI_RENDER_DPI", "100"))       # dashboard thumbnails
+HIRES_DPI = 300                                          # on-demand downloads
+WORKERS = os.cpu_count() or 1
+MAX_DISPLAY = 20                                         # features shown per summary
+STAMPS_PATH = "data/shap_cache/renders.json"
+MIME_TYPES = {"png": "image/png", "webp": "image/webp", "jpg": "image/jpeg", "svg": "image/svg+xml",
+              "pdf": "application/pdf"}
+
+_pool = None
+_pool_lock = threading.Lock()
+_stamps_lock = threading.Lock()
+
+
+def shap_summary_path(city_name, fmt=FORMAT):
+    return f"data/shap_summary_{city_name.lower()}.{fmt}"
+
+
+def _jitter(values, row_height=0.4, bins=100):
+    # Beeswarm offsets: points falling in the same x bin are stacked alternately
+    # above and below the row centre, like shap.summary_plot does
+    span = values.max() - values.min()
+    quantized = np.round(bins * (values - values.min()) / (span + 1e-8)).astype(np.int64)
+    order = np.lexsort((np.arange(len(values)), quantized))
+    sorted_bins = quantized[order]
+    first = np.searchsorted(sorted_bins, sorted_bins)
+    rank = np.arange(len(values)) - first
+    offsets = np.empty(len(values))
+    offsets[order] = np.ceil(rank / 2) * np.where(rank % 2 == 1, 1, -1)
+    peak = np.abs(offsets).max()
+    return offsets * (row_height / peak) if peak else offsets
+
+
+def draw_shap_summary(values, X, features, title=None, max_display=MAX_DISPLAY):
+    """SHAP beeswarm (rows = features by mean |SHAP|, colour = feature value) as a Figure."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    values, X = np.asarray(values, dtype=np.float64), np.asarray(X, dtype=np.float64)
+    order = np.argsort(np.abs(values).mean(axis=0))[-max_display:]
+    fig = Figure(figsize=(8, 0.4 * len(order) + 1.5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.axvline(0, color="#999999", linewidth=0.8, zorder=1)
+    for row, i in enumerate(order):
+        x = X[:, i]
+        low, high = np.nanpercentile(x, [5, 95]) if np.isfinite(x).any() else (0.0, 1.0)
+        colour = np.clip((x - low) / (high - low), 0, 1) if high > low else np.full(len(x), 0.5)
+        points = ax.scatter(values[:, i], row + _jitter(values[:, i]), c=colour, cmap="coolwarm",
+                            vmin=0, vmax=1, s=12, linewidths=0, alpha=0.85, rasterized=True, zorder=2)
+    ax.set_yticks(range(len(order)), [features[i] for i in order])
+    ax.set_ylim(-0.7, len(order) - 0.3)
+    ax.set_xlabel("SHAP value (impact on model output)")
+    for side in ("top", "right", "left"):
+        ax.spines[side].set_visible(False)
+    ax.tick_params(axis="y", length=0)
+    colorbar = fig.colorbar(points, ax=ax, ticks=[0, 1], aspect=40, pad=0.02)
+    colorbar.ax.set_yticklabels(["Low", "High"])
+    colorbar.set_label("Feature value", labelpad=-10)
+    colorbar.outline.set_visible(False)
+    if title:
+        ax.set_title(title)
+    fig.tight_layout()
+    return fig
+
+
+def figure_bytes(fig, fmt=FORMAT, dpi=DPI):
+    buf = BytesIO()
+    fig.savefig(buf, format=fmt, dpi=dpi)
+    return buf.getvalue()
+
+
+def _render(job):
+    # Runs in a pool worker: draw, encode and atomically replace the file
+    start = time.perf_counter()
+    fig = draw_shap_summary(job["values"], job["X"], job["features"], job.get("title"))
+    data = figure_bytes(fig, job["fmt"], job["dpi"])
+    tmp_path = f"{job['path']}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, job["path"])
+    return job["path"], time.perf_counter() - start
+
+
+def _stamp(job):
+    digest = hashlib.sha1()
+    for array in (job["values"], job["X"]):
+        digest.update(np.ascontiguousarray(array, dtype=np.float32).tobytes())
+    digest.update(json.dumps([list(job["features"]), job.get("title"), job["fmt"], job["dpi"]]).encode())
+    return digest.hexdigest()
+
+
+def _load_stamps():
+    if not os.path.exists(STAMPS_PATH):
+        return {}
+    with open(STAMPS_PATH) as f:
+        return json.load(f)
+
+
+def _save_stamps(stamps):
+    os.makedirs(os.path.dirname(STAMPS_PATH), exist_ok=True)
+    with open(f"{STAMPS_PATH}.tmp", "w") as f:
+        json.dump(stamps, f, indent=2, sort_keys=True)
+    os.replace(f"{STAMPS_PATH}.tmp", STAMPS_PATH)
+
+
+def _get_pool(workers):
+    # One pool per process, shared by concurrent callers (pipeline.py explains cities
+    # from threads). Workers are spawned, not forked, so threads in the parent are safe.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def shap_summary_job(city_name, values, X, features, fmt=FORMAT, dpi=DPI):
+    return {"path": shap_summary_path(city_name, fmt), "values": np.asarray(values, dtype=np.float32),
+            "X": np.asarray(X, dtype=np.float32), "features": list(features), "fmt": fmt, "dpi": dpi,
+            "title": city_name.title()}
+
+
+def render_all(jobs, workers=WORKERS, force=False):
+    """Render the jobs whose file is missing or whose inputs/settings changed.
+
+    Jobs are drawn in parallel in a process pool. Returns {path: seconds} for the files that were (re)drawn.
+    """
+    with _stamps_lock:
+        stamps = _load_stamps()
+    todo = [(job, _stamp(job)) for job in jobs]
+    todo = [(job, stamp) for job, stamp in todo
+            if force or stamps.get(job["path"]) != stamp or not os.path.exists(job["path"])]
+    if not todo:
+        return {}
+    for job, _ in todo:
+        os.makedirs(os.path.dirname(job["path"]) or ".", exist_ok=True)
+    # A lone job from the main thread is cheaper in-process than spawning workers
+    if workers <= 1 or (len(todo) == 1 and threading.current_thread() is threading.main_thread()):
+        results = [_render(job) for job, _ in todo]
+    else:
+        results = list(_get_pool(workers).map(_render, [job for job, _ in todo]))
+    with _stamps_lock:
+        stamps = _load_stamps()
+        stamps.update({job["path"]: stamp for job, stamp in todo})
+        _save_stamps(stamps)
+    return dict(results)
+
+
+def shap_summary_bytes(city_code, city_name, dpi=HIRES_DPI, fmt="png",
+                       shap_path="data/shap_values.parquet", predictions_path="data/predicted_aqi_72hr.csv"):
+    """Draw one city's summary on demand (e.g. a hi-res download) from the saved SHAP values."""
+    import pandas as pd
+
+    shap_df = pd.read_parquet(shap_path)
+    shap_df = shap_df[shap_df["city"] == city_code]
+    columns = [c for c in shap_df.columns if c.startswith("shap_")]
+    features = [c.removeprefix("shap_") for c in columns]
+    X = pd.read_csv(predictions_path, parse_dates=["time"])
+    X = X[X["city"] == city_code].set_index("time").reindex(pd.DatetimeIndex(shap_df["time"]))[features]
+    fig = draw_shap_summary(shap_df[columns].to_numpy(), X.to_numpy(), features, city_name.title())
+    return figure_bytes(fig, fmt, dpi)
+
+
+if __name__ == "__main__":
+    from cities import load_registry
+
+    parser = argparse.ArgumentParser(description="Render a city's SHAP summary from the saved SHAP values")
+    parser.add_argument("city", help="city name, e.g. Karachi")
+    parser.add_argument("--dpi", type=int, default=HIRES_DPI)
+    parser.add_argument("--format", default="png", choices=sorted(MIME_TYPES))
+    parser.add_argument("--out", help="output file (default data/shap_summary_<city>_<dpi>dpi.<format>)")
+    args = parser.parse_args()
+
+    registry = load_registry()
+    code = registry.code(args.city.title())
+    out = args.out or f"data/shap_summary_{args.city.lower()}_{args.dpi}dpi.{args.format}"
+    with open(out, "wb") as f:
+        f.write(shap_summary_bytes(code, args.city, args.dpi, args.format))
+    print(f"✅ Saved {args.dpi}-dpi SHAP summary for {args.city.title()} -> {out}")
@@ -0,0 +1,202 @@
+import functools
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:   # not available on Windows; RSS is then reported as None
+    resource = None
+
+# Lightweight run telemetry for the pipeline scripts. A script wraps its body in
+# `with telemetry.run("predict"):` and its stages in `with telemetry.span("fetch") as s:`;
+# each span records wall and CPU time, the process peak RSS and whatever counts the
+# stage reports (`s.set(rows=..., bytes=...)`). At the end of the run one JSON record
+# is written to RUNS_DIR and a per-stage summary is printed. Spans opened outside a
+# run are timed but not recorded, so library code can be instrumented freely.
+#
+# Profiling on demand: AQI_PROFILE=cprofile (or pyinstrument, if installed) dumps a
+# profile of the whole run next to its record.
+
+# --- Config ---
+RUNS_DIR = os.environ.get("AQI_TELEMETRY_DIR", "data/runs")
+RUNS_KEEP = 50        # newest run records kept per script
+PROFILE = os.environ.get("AQI_PROFILE", "").lower()   # "", "cprofile" or "pyinstrument"
+
+_active = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1)
+
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+        self.counts = {}
+
+    def set(self, **counts):
+        self.counts.update(counts)
+        return self
+
+
+@contextmanager
+def span(name, **counts):
+    """Time a pipeline stage; nested spans are recorded as "outer/inner"."""
+    current = _active
+    record = {"name": name}
+    if current is not None:
+        # Recorded in start order, so a parent precedes its children
+        record["name"] = name = "/".join(current.stack + [name])
+        current.stack.append(name.rsplit("/", 1)[-1])
+        current.spans.append(record)
+    s = Span(name).set(**counts)
+    rss_before = peak_rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    status = "ok"
+    try:
+        yield s
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record.update(
+            status=status,
+            wall_s=round(time.perf_counter() - wall, 6),
+            cpu_s=round(time.process_time() - cpu, 6),
+            peak_rss_mb=peak_rss_mb(),
+            **s.counts,
+        )
+        if rss_before is not None:
+            record["rss_growth_mb"] = round(record["peak_rss_mb"] - rss_before, 1)
+        if current is not None:
+            current.stack.pop()
+
+
+def traced(name=None):
+    # Decorator form of span()
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name or fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class _Profiler:
+    def __init__(self, kind):
+        self.kind = kind
+        if kind == "cprofile":
+            import cProfile
+            self.profiler = cProfile.Profile()
+        elif kind == "pyinstrument":
+            from pyinstrument import Profiler
+            self.profiler = Profiler()
+        else:
+            raise ValueError(f"Unknown AQI_PROFILE={kind!r}; use cprofile or pyinstrument")
+
+    def start(self):
+        if self.kind == "cprofile":
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def stop(self, base_path):
+        if self.kind == "cprofile":
+            import pstats
+            self.profiler.disable()
+            path = base_path + ".prof"
+            self.profiler.dump_stats(path)
+            pstats.Stats(path).sort_stats("cumulative").print_stats(15)
+        else:
+            self.profiler.stop()
+            path = base_path + ".html"
+            with open(path, "w") as f:
+                f.write(self.profiler.output_html())
+        return path
+
+
+class run:
+    """Context manager for one script run; writes RUNS_DIR/<script>-<UTC time>.json."""
+
+    def __init__(self, script, runs_dir=RUNS_DIR, profile=PROFILE):
+        self.script = script
+        self.runs_dir = runs_dir
+        self.profile = profile
+        self.spans = []
+        self._local = threading.local()
+
+    @property
+    def stack(self):
+        # Open span names of the calling thread, so spans from worker threads nest correctly
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def __enter__(self):
+        global _active
+        self.started = datetime.now(timezone.utc)
+        self.run_id = f"{self.script}-{self.started.strftime('%Y%m%dT%H%M%S%fZ')}"
+        self._profiler = None
+        if self.profile:
+            try:
+                self._profiler = _Profiler(self.profile)
+            except ImportError:
+                print(f"⚠️ {self.profile} is not installed, running without a profile")
+        self._prev, _active = _active, self
+        self._wall, self._cpu = time.perf_counter(), time.process_time()
+        if self._profiler:
+            self._profiler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        _active = self._prev
+        wall, cpu = time.perf_counter() - self._wall, time.process_time() - self._cpu
+        os.makedirs(self.runs_dir, exist_ok=True)
+        base_path = os.path.join(self.runs_dir, self.run_id)
+        record = {
+            "run_id": self.run_id,
+            "script": self.script,
+            "argv": sys.argv[1:],
+            "started": self.started.isoformat(timespec="seconds"),
+            # exit() / sys.exit(0) count as a normal finish
+            "status": "ok" if exc_type is None or (exc_type is SystemExit and not exc.code) else "error",
+            "error": None if exc is None or exc_type is SystemExit else f"{exc_type.__name__}: {exc}",
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "peak_rss_mb": peak_rss_mb(),
+            "spans": self.spans,
+        }
+        if self._profiler:
+            record["profile"] = self._profiler.stop(base_path)
+        with open(base_path + ".json", "w") as f:
+            json.dump(record, f, indent=2)
+        self._prune()
+        self.print_summary(record)
+        return False
+
+    def _prune(self):
+        records = sorted(glob.glob(os.path.join(self.runs_dir, f"{self.script}-*.json")))
+        for path in records[:-RUNS_KEEP]:
+            for stale in glob.glob(path[:-len(".json")] + ".*"):
+                os.remove(stale)
+
+    def print_summary(self, record):
+        print(f"⏱️ {self.script}: {record['wall_s']:.2f} s wall, {record['cpu_s']:.2f} s CPU, "
+              f"peak RSS {record['peak_rss_mb']} MB -> {os.path.join(self.runs_dir, self.run_id)}.json")
+        for s in record["spans"]:
+            counts = ", ".join(f"{k}={v:,}" for k, v in s.items() if k in ("rows", "bytes", "requests"))
+            indent = "  " * s["name"].count("/")
+            print(f"   {indent}{s['name'].rsplit('/', 1)[-1]:<{24 - len(indent)}} "
+                  f"{s['wall_s']:8.3f} s  cpu {s['cpu_s']:8.3f} s  {counts}")
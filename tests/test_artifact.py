@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression, Ridge
+
+from artifact import export_model, load_artifact
+
+FEATURES = ["a", "b", "c", "d"]
+
+
+def _data(seed, n=400):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, len(FEATURES))).astype(np.float32), columns=FEATURES)
+    y = np.sin(X["a"]) * 20 + X["b"] ** 2 - 3 * X["c"] + rng.normal(size=n)
+    return X, y
+
+
+@pytest.mark.parametrize("model", [
+    LinearRegression(),
+    Ridge(alpha=1.0),
+    RandomForestRegressor(n_estimators=15, max_depth=6, random_state=0),
+    GradientBoostingRegressor(n_estimators=20, max_depth=3, random_state=0),
+], ids=lambda m: type(m).__name__)
+def test_artifact_predicts_like_the_estimator(model, tmp_path):
+    X, y = _data(0)
+    model.fit(X, y)
+    artifact = load_artifact(export_model(model, tmp_path / "model.npz"))
+    X_new, _ = _data(1, 200)   # unseen rows, so the traversal takes both branches everywhere
+    np.testing.assert_allclose(artifact.predict(X_new), model.predict(X_new), rtol=1e-6, atol=1e-6)
+
+
+def test_artifact_rejects_reordered_columns(tmp_path):
+    X, y = _data(0)
+    artifact = load_artifact(export_model(Ridge().fit(X, y), tmp_path / "model.npz"))
+    with pytest.raises(ValueError, match="Feature mismatch"):
+        artifact.predict(X[FEATURES[::-1]])
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from cities import CityRegistry
+
+
+def _registry():
+    return CityRegistry([
+        {"name": "Lahore", "lat": 31.5, "lon": 74.3, "tz": "Asia/Karachi", "city_code": 7},
+        {"name": "Karachi", "lat": 24.9, "lon": 67.0, "tz": "Asia/Karachi", "city_code": 0},
+        {"name": "Islamabad", "lat": 33.7, "lon": 73.0, "tz": "Asia/Karachi", "city_code": 3},
+    ])
+
+
+def test_registry_is_in_code_order_with_vectorized_lookups():
+    cities = _registry()
+    np.testing.assert_array_equal(cities.codes, [0, 3, 7])
+    np.testing.assert_array_equal(cities.position([7, 0, 7, 3]), [2, 0, 2, 1])
+    np.testing.assert_array_equal(cities.name([3, 7]), ["Islamabad", "Lahore"])
+    assert cities.code("lahore") == 7
+    assert [r["name"] for r in cities.records([7, 0])] == ["Lahore", "Karachi"]
+
+
+def test_unknown_codes_raise():
+    with pytest.raises(KeyError, match=r"\[5, 99\]"):
+        _registry().position([0, 5, 99])
+
+
+@pytest.mark.parametrize("cities", [
+    [],
+    [{"name": "A", "lat": 0, "lon": 0, "tz": "UTC", "city_code": 1},
+     {"name": "B", "lat": 0, "lon": 0, "tz": "UTC", "city_code": 1}],
+    [{"name": "A", "lat": 0, "lon": 0, "tz": "UTC", "city_code": 1},
+     {"name": "a", "lat": 0, "lon": 0, "tz": "UTC", "city_code": 2}],
+    [{"name": "A", "lat": 0, "lon": 0, "tz": "UTC", "city_code": 40_000}],
+])
+def test_invalid_registries_are_rejected(cities):
+    with pytest.raises(ValueError):
+        CityRegistry(cities)
+
+
+def test_slices_bound_each_city_in_a_sorted_column():
+    cities = _registry()
+    column = np.array([0, 0, 0, 7, 7])   # Islamabad has no rows
+    start, stop = cities.slices(column)
+    np.testing.assert_array_equal(start, [0, 3, 3])
+    np.testing.assert_array_equal(stop, [3, 3, 5])
@@ -0,0 +1,43 @@
+import threading
+import time
+
+import numpy as np
+
+import explain
+
+FEATURES = ["a", "b"]
+
+
+def test_concurrent_cold_loads_sample_the_background_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "background.npz")
+    calls = []
+
+    def slow_sample(features, path):
+        calls.append(path)
+        time.sleep(0.05)   # long enough for every thread to find the file missing
+        values = np.arange(len(features) * 3, dtype=np.float32).reshape(3, len(features))
+        np.savez(path, features=np.asarray(features), values=values)
+        return values
+
+    monkeypatch.setattr(explain, "sample_background", slow_sample)
+    results = [None] * 8
+
+    def load(i):
+        results[i] = explain.load_background(FEATURES, path=path)
+
+    threads = [threading.Thread(target=load, args=(i,)) for i in range(len(results))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [path]
+    for values in results:
+        np.testing.assert_array_equal(values, results[0])
+
+
+def test_background_for_other_features_is_resampled(tmp_path, monkeypatch):
+    path = str(tmp_path / "background.npz")
+    np.savez(path, features=np.asarray(["x"]), values=np.zeros((3, 1), dtype=np.float32))
+    monkeypatch.setattr(explain, "sample_background", lambda features, path: np.ones((3, len(features))))
+    np.testing.assert_array_equal(explain.load_background(FEATURES, path=path), np.ones((3, 2)))
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import feature_store
+import forecast_archive
+from cities import CityRegistry
+from intervals import LOWER_COLUMN, UPPER_COLUMN
+
+START = pd.Timestamp("2025-06-01")
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {
+        "root": str(tmp_path / "archive"),
+        "store_root": str(tmp_path / "store"),
+        "state_path": str(tmp_path / "eval" / "state.json"),
+        "out_path": str(tmp_path / "eval" / "mae.csv"),
+    }
+
+
+@pytest.fixture
+def cities():
+    return CityRegistry([
+        {"name": "A", "lat": 0.0, "lon": 0.0, "tz": "UTC", "city_code": 0},
+        {"name": "B", "lat": 1.0, "lon": 1.0, "tz": "UTC", "city_code": 1},
+    ])
+
+
+def _observe(paths, hours, aqi=100.0):
+    # Store rows for both cities over the first `hours` hours
+    times = pd.date_range(START, periods=hours, freq="h")
+    df = pd.DataFrame({column: 0 for column in feature_store.COLUMNS}, index=range(2 * hours))
+    df["time"] = np.tile(times, 2)
+    df["city"] = np.repeat([0, 1], hours)
+    df["us_aqi"] = aqi
+    feature_store.append(df, root=paths["store_root"])
+
+
+def _issue(paths, cities, issued_at, hours=48, predicted=110.0, mode="direct"):
+    # One forecast run for both cities, covering the first `hours` hours after START
+    times = pd.date_range(START, periods=hours, freq="h")
+    results = pd.DataFrame({
+        "time": np.tile(times, 2), "city": np.repeat([0, 1], hours), "predicted_us_aqi": predicted,
+        LOWER_COLUMN: predicted - 20, UPPER_COLUMN: predicted - 15,   # actual 100 is never covered
+    })
+    return forecast_archive.append(results, cities, mode, issued_at, root=paths["root"])
+
+
+def _stats(paths):
+    return pd.read_csv(paths["out_path"])
+
+
+def test_nowcast_hours_are_not_archived(paths, cities):
+    assert _issue(paths, cities, START + pd.Timedelta(hours=5, minutes=30)) == 2 * 43
+    assert forecast_archive.read(root=paths["root"])["horizon"].min() == 0
+
+
+def test_each_forecast_is_scored_once(paths, cities):
+    _observe(paths, 48)
+    _issue(paths, cities, START + pd.Timedelta(minutes=30))
+
+    # 12:30 -> hours up to 11:00 have matured
+    first = forecast_archive.evaluate(cities, now=START + pd.Timedelta(hours=12, minutes=30), **paths)
+    assert first == {"matured": 2 * 12, "pending": 2 * 36}
+    assert forecast_archive.evaluate(cities, now=START + pd.Timedelta(hours=12, minutes=30), **paths)["matured"] == 0
+
+    # Re-archiving the same run replaces its file instead of adding rows
+    _issue(paths, cities, START + pd.Timedelta(minutes=50))
+    last = forecast_archive.evaluate(cities, now=START + pd.Timedelta(hours=48, minutes=30), **paths)
+    assert last == {"matured": 2 * 36, "pending": 0}
+
+    stats = _stats(paths)
+    assert len(stats) == 2 * 48 and (stats["n"] == 1).all()
+    np.testing.assert_allclose(stats["mae"], 10.0)
+    np.testing.assert_allclose(stats["coverage"], 0.0)
+
+
+def test_hours_without_observations_wait_for_the_backfill(paths, cities):
+    _observe(paths, 6)
+    _issue(paths, cities, START + pd.Timedelta(minutes=30))
+    now = START + pd.Timedelta(hours=12, minutes=30)
+    assert forecast_archive.evaluate(cities, now=now, **paths) == {"matured": 2 * 6, "pending": 2 * 42}
+
+    _observe(paths, 48)
+    assert forecast_archive.evaluate(cities, now=now, **paths) == {"matured": 2 * 6, "pending": 2 * 36}
+    assert _stats(paths)["n"].sum() == 2 * 12
+
+
+def test_outputs_are_written_when_nothing_matured(paths, cities):
+    # The hourly workflow commits the evaluation directory on every run
+    assert forecast_archive.evaluate(cities, now=START, **paths) == {"matured": 0, "pending": 0}
+    assert _stats(paths).empty
+    assert forecast_archive._load_state(paths["state_path"])[0] == {}
+
+
+def test_modes_are_archived_and_scored_separately(paths, cities):
+    _observe(paths, 48)
+    issued_at = START + pd.Timedelta(minutes=30)
+    _issue(paths, cities, issued_at, predicted=110.0)
+    _issue(paths, cities, issued_at, predicted=130.0, mode="recursive")   # same hour, must not overwrite
+    assert forecast_archive.read(root=paths["root"])["mode"].value_counts().to_dict() == {"direct": 96, "recursive": 96}
+
+    assert forecast_archive.evaluate(cities, now=START + pd.Timedelta(hours=48, minutes=30), **paths)["matured"] == 192
+    mae = _stats(paths).groupby("mode")["mae"].unique()
+    assert mae.to_dict() == {"direct": [10.0], "recursive": [30.0]}
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import Ridge
+
+import forecaster
+import lag_features
+from artifact import export_model, load_artifact
+from lag_features import LagState
+
+
+def _frame(start, hours, cities=(0, 1), seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for city in cities:
+        times = pd.date_range(start, periods=hours, freq="h")
+        df = pd.DataFrame({"time": times, "city": city}).assign(
+            temperature_2m=rng.uniform(10, 40, hours), relative_humidity_2m=rng.uniform(10, 100, hours),
+            wind_speed_10m=rng.uniform(0, 30, hours), cloud_cover=rng.uniform(0, 100, hours),
+            precipitation=rng.uniform(0, 2, hours), dayofweek=times.dayofweek, hour=times.hour, month=times.month,
+            us_aqi=(100 + 50 * np.sin(np.arange(hours) / 6) + rng.normal(0, 5, hours)).round(1),
+        )
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.fixture(scope="module")
+def setup(tmp_path_factory):
+    history = _frame("2025-05-01", 24 * 10)
+    train = forecaster.training_frame(history)
+    path = tmp_path_factory.mktemp("model") / "recursive.npz"
+    export_model(Ridge(alpha=1.0).fit(train[forecaster.FEATURES], train["us_aqi"]), path, forecaster.FEATURES)
+    future = _frame(history["time"].max() + pd.Timedelta(hours=1), 12, seed=1)
+    return load_artifact(path), history, future
+
+
+def _forecast(model, history, future, horizon=6):
+    state = LagState.from_history(history)
+    return forecaster.RecursiveForecaster(model, state).forecast(future.set_index("time")[forecaster.EXOGENOUS], horizon)
+
+
+def test_rollout_matches_step_by_step_batch_features(setup):
+    model, history, future = setup
+    results = _forecast(model, history, future)
+
+    # Reference: append one predicted hour at a time and recompute every lag from scratch
+    known = history.copy()
+    for step in range(6):
+        rows = future.groupby("city").nth(step)
+        frame = pd.concat([known, rows.assign(us_aqi=np.nan)]).sort_values(["city", "time"], ignore_index=True)
+        X = frame.join(lag_features.batch_features(frame)).loc[frame["us_aqi"].isna(), forecaster.FEATURES]
+        predicted = model.predict(X)
+        known = pd.concat([known, rows.assign(us_aqi=predicted)])
+        got = results[results.index == rows["time"].iloc[0]]["predicted_us_aqi"].to_numpy()
+        np.testing.assert_allclose(got, predicted, rtol=1e-9)
+
+
+def test_history_rows_are_skipped_and_the_horizon_trimmed(setup):
+    model, history, future = setup
+    overlap = pd.concat([history.groupby("city").tail(5), future]).sort_values(["city", "time"])
+    results = _forecast(model, history, overlap)
+    expected = _forecast(model, history, future)
+    assert len(results) == 2 * 6
+    pd.testing.assert_frame_equal(results, expected)
+
+
+def test_rejects_a_gap_in_the_inputs(setup):
+    model, history, future = setup
+    gapped = future.drop(future.index[(future["city"] == 1)][2])
+    with pytest.raises(ValueError, match=r"cities \[1\] do not continue"):
+        _forecast(model, history, gapped)
+
+
+def test_rejects_a_stale_lag_state(setup):
+    model, history, future = setup
+    stale = history[history["time"] < history["time"].max() - pd.Timedelta(hours=3)]
+    with pytest.raises(ValueError, match=r"cities \[0, 1\] do not continue"):
+        _forecast(model, stale, future)
+
+
+def test_backtest_matches_rollouts_rebuilt_at_every_origin(setup):
+    model, history, _ = setup
+    cutoff = history["time"].min() + pd.Timedelta(days=5)
+    residuals = forecaster.backtest_residuals(model, history, cutoff, every=24, horizon=24)
+
+    expected = []
+    for origin in pd.date_range(cutoff, history["time"].max() - pd.Timedelta(hours=24), freq="24h"):
+        ahead = history[(history["time"] >= origin) & (history["time"] < origin + pd.Timedelta(hours=24))]
+        results = _forecast(model, history[history["time"] < origin], ahead, horizon=24)
+        for city, rollout in results.groupby("city"):
+            actual = ahead.loc[ahead["city"] == city, "us_aqi"].to_numpy()
+            expected.append(np.abs(rollout["predicted_us_aqi"].to_numpy() - actual))
+    np.testing.assert_allclose(residuals, np.vstack(expected), rtol=1e-9)
+
+
+def test_backtest_skips_gaps_and_can_come_back_empty(setup):
+    model, history, _ = setup
+    cutoff = history["time"].max() - pd.Timedelta(hours=30)
+    assert forecaster.backtest_residuals(model, history, cutoff, horizon=24).shape == (2, 24)
+
+    # City 1 misses an hour inside the only window: its rollout is skipped
+    gap = history.index[(history["city"] == 1) & (history["time"] == cutoff + pd.Timedelta(hours=3))]
+    assert forecaster.backtest_residuals(model, history.drop(gap), cutoff, horizon=24).shape == (1, 24)
+
+    # Too little history after the cutoff for a full horizon
+    late = history["time"].max() - pd.Timedelta(hours=10)
+    assert forecaster.backtest_residuals(model, history, late, horizon=24).shape == (0, 24)
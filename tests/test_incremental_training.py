@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression, Ridge
+
+import feature_store
+from cities import CityRegistry
+from model import city_watermarks
+from training import LinearStats
+
+FEATURES = ["a", "b", "c"]
+
+
+def _data(rng, n):
+    X = pd.DataFrame(rng.normal(size=(n, len(FEATURES))), columns=FEATURES)
+    y = X @ np.array([1.5, -2.0, 0.5]) + 3.0 + rng.normal(scale=0.1, size=n)
+    return X, y
+
+
+def test_chunked_linear_stats_match_full_fit():
+    rng = np.random.default_rng(0)
+    X, y = _data(rng, 500)
+    stats = LinearStats(len(FEATURES))
+    for chunk in np.array_split(np.arange(len(y)), 7):
+        stats.update(X.iloc[chunk], y.iloc[chunk])
+
+    for estimator in (LinearRegression(), Ridge(alpha=1.0)):
+        expected = type(estimator)(**estimator.get_params()).fit(X, y)
+        fitted = stats.fit_estimator(estimator, FEATURES)
+        np.testing.assert_allclose(fitted.coef_, expected.coef_, rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose(fitted.intercept_, expected.intercept_, rtol=1e-8)
+        np.testing.assert_allclose(fitted.predict(X), expected.predict(X), rtol=1e-8)
+
+
+def test_merged_linear_stats_match_one_pass():
+    rng = np.random.default_rng(1)
+    X, y = _data(rng, 200)
+    old = LinearStats(len(FEATURES)).update(X[:150], y[:150])
+    new = LinearStats(len(FEATURES)).update(X[150:], y[150:])
+    full = LinearStats(len(FEATURES)).update(X, y)
+    merged = old.merge(new)
+    assert merged.n == full.n
+    np.testing.assert_allclose(merged.xtx, full.xtx)
+    np.testing.assert_allclose(merged.xty, full.xty)
+
+
+def test_city_watermarks_are_per_city_and_never_move_back():
+    df = pd.DataFrame({"city": [0, 0, 1], "time": pd.to_datetime(["2025-01-01 05:00", "2025-01-01 07:00",
+                                                                   "2025-01-01 02:00"])})
+    watermarks = city_watermarks(df, {"1": "2025-01-01T04:00:00", "2": "2025-01-01T09:00:00"})
+    assert watermarks == {"0": "2025-01-01T07:00:00", "1": "2025-01-01T04:00:00", "2": "2025-01-01T09:00:00"}
+
+
+def test_observed_excludes_provisional_hours_on_each_city_clock():
+    cities = CityRegistry([
+        {"name": "Karachi", "lat": 24.9, "lon": 67.0, "tz": "Asia/Karachi", "city_code": 0},
+        {"name": "London", "lat": 51.5, "lon": -0.1, "tz": "Europe/London", "city_code": 1},
+    ])
+    now = pd.Timestamp("2025-01-15 10:30", tz="UTC")   # 15:30 in Karachi, 10:30 in London
+    times = pd.to_datetime(["2025-01-15 14:00", "2025-01-15 15:00", "2025-01-15 09:00", "2025-01-15 10:00"])
+    df = pd.DataFrame({"time": times, "city": [0, 0, 1, 1]})
+    np.testing.assert_array_equal(feature_store.observed(df, now, cities), [True, False, True, False])
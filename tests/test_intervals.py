@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from intervals import LOWER_COLUMN, UPPER_COLUMN, add_intervals, conformal_quantiles, save_residuals
+
+
+def test_conformal_quantile_is_the_finite_sample_order_statistic():
+    rng = np.random.default_rng(0)
+    residuals = rng.permutation(np.arange(1.0, 20.0))   # n = 19 -> ceil(20 * 0.9) = 18th smallest
+    np.testing.assert_array_equal(conformal_quantiles(residuals[:, None]), [18.0])
+    # Too few samples for the coverage: the largest error
+    np.testing.assert_array_equal(conformal_quantiles(np.arange(1.0, 5.0)[:, None]), [4.0])
+
+
+def test_quantiles_are_per_horizon():
+    residuals = np.column_stack([np.arange(1.0, 20.0), 10 * np.arange(1.0, 20.0)])
+    np.testing.assert_array_equal(conformal_quantiles(residuals), [18.0, 180.0])
+
+
+def test_add_intervals_uses_each_rows_step_within_its_city(tmp_path):
+    model_path = str(tmp_path / "model.npz")
+    # Horizons 0, 1, 2 have widths 1, 2, 3 (every residual equal)
+    save_residuals(model_path, np.tile([1.0, 2.0, 3.0], (10, 1)))
+    results = pd.DataFrame({
+        "city": [0, 0, 0, 0, 5, 5],
+        "predicted_us_aqi": [50.0, 50.0, 50.0, 50.0, 1.5, 1.5],
+    })
+    out = add_intervals(results, model_path)
+    # Steps past the calibrated horizons reuse the last width; bounds are clipped at zero
+    np.testing.assert_array_equal(out[LOWER_COLUMN], [49, 48, 47, 47, 0.5, 0.0])
+    np.testing.assert_array_equal(out[UPPER_COLUMN], [51, 52, 53, 53, 2.5, 3.5])
+
+
+def test_add_intervals_without_residuals_leaves_results_alone(tmp_path):
+    results = pd.DataFrame({"city": [0], "predicted_us_aqi": [50.0]})
+    out = add_intervals(results, str(tmp_path / "missing.npz"))
+    assert LOWER_COLUMN not in out and UPPER_COLUMN not in out
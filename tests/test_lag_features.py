@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+import lag_features
+from lag_features import FEATURES, LagState, batch_features
+
+
+def _history(hours=120, cities=(0, 2, 5)):
+    rng = np.random.default_rng(0)
+    frames = []
+    for i, city in enumerate(cities):
+        n = hours - 10 * i   # cities start at different hours
+        times = pd.date_range("2025-03-01", periods=n, freq="h") + pd.Timedelta(hours=10 * i)
+        frames.append(pd.DataFrame({"time": times, "city": city, "us_aqi": rng.uniform(20, 250, n).round(1)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_incremental_state_matches_batch_features():
+    df = _history()
+    expected = batch_features(df)
+    state = LagState()
+    # Fold the history in uneven chunks of hours, the way repeated syncs would
+    bounds = pd.to_datetime(["2025-03-01 00:00", "2025-03-01 05:00", "2025-03-02 13:00", "2025-03-04 00:00", "2030-01-01 00:00"])
+    parts = [state.update(df[(df["time"] >= lo) & (df["time"] < hi)]) for lo, hi in zip(bounds[:-1], bounds[1:])]
+    got = pd.concat(parts).reindex(df.index)
+    np.testing.assert_allclose(got[FEATURES].to_numpy(), expected.to_numpy(), rtol=1e-9, equal_nan=True)
+
+
+def test_state_features_are_the_next_hour_of_batch_features(tmp_path):
+    df = _history()
+    state = LagState.load(LagState.from_history(df).save(tmp_path / "state.npz"))
+    # Append one placeholder hour per city; its batch features only use past values
+    last = df.groupby("city").tail(1).assign(time=lambda d: d["time"] + pd.Timedelta(hours=1), us_aqi=np.nan)
+    extended = pd.concat([df, last]).sort_values(["city", "time"], ignore_index=True)
+    expected = batch_features(extended).loc[extended["us_aqi"].isna()]
+    codes = extended.loc[expected.index, "city"].to_numpy()
+    np.testing.assert_allclose(state.features(codes), expected.to_numpy(), rtol=1e-9, equal_nan=True)
+    np.testing.assert_array_equal(state.last_hour[codes], lag_features.epoch_hours(last["time"]) - 1)
+
+
+def test_revised_only_flags_changed_held_values():
+    df = _history()
+    state = LagState.from_history(df)
+    recent = df[df["time"] >= df["time"].max() - pd.Timedelta(hours=5)]
+    assert not state.revised(recent)
+
+    changed = recent.copy()
+    changed.loc[changed.index[-2], "us_aqi"] += 10
+    assert state.revised(changed)
+
+    # Hours past the newest folded one are new rows, not revisions
+    ahead = recent.assign(time=recent["time"] + pd.Timedelta(hours=6), us_aqi=0.0)
+    assert not state.revised(ahead)
+
+    # A value that has scrolled out of the ring buffer cannot be checked, so it counts as revised
+    assert state.revised(df.head(1))
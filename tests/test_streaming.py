@@ -0,0 +1,22 @@
+import numpy as np
+from sklearn.metrics import mean_absolute_error, r2_score, root_mean_squared_error
+
+from training import StreamingMetrics
+
+
+def test_streaming_metrics_match_sklearn():
+    rng = np.random.default_rng(0)
+    y = rng.uniform(20, 250, 1000)
+    y_pred = y + rng.normal(0, 15, 1000)
+    metrics = StreamingMetrics()
+    for chunk in np.array_split(np.arange(len(y)), 9):
+        metrics.update(y[chunk], y_pred[chunk])
+    result = metrics.result()
+    np.testing.assert_allclose(result["MAE"], mean_absolute_error(y, y_pred))
+    np.testing.assert_allclose(result["RMSE"], root_mean_squared_error(y, y_pred))
+    np.testing.assert_allclose(result["R2"], r2_score(y, y_pred))
+
+
+def test_streaming_metrics_of_an_empty_test_range_are_nan():
+    result = StreamingMetrics().update(np.empty(0), np.empty(0)).result()
+    assert all(np.isnan(v) for v in result.values())
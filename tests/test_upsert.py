@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+import upsert
+
+
+def _frame(rng, n, cities=3):
+    times = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 200, n), unit="h")
+    return pd.DataFrame({"time": times, "city": rng.integers(0, cities, n), "value": rng.normal(size=n)})
+
+
+def test_row_keys_sort_by_city_then_time():
+    df = pd.DataFrame({"time": pd.to_datetime(["2025-01-02", "2025-01-01", "2025-01-03", "2025-01-01"]),
+                       "city": [0, 1, 0, 0]})
+    order = np.argsort(upsert.row_keys(df["time"], df["city"]))
+    expected = df.sort_values(["city", "time"]).index.to_numpy()
+    np.testing.assert_array_equal(order, expected)
+
+
+def test_upsert_matches_drop_duplicates_keep_last():
+    rng = np.random.default_rng(0)
+    existing = _frame(rng, 300).drop_duplicates(["city", "time"]).sort_values(["city", "time"], ignore_index=True)
+    incoming = _frame(rng, 150)   # overlaps the existing rows and repeats keys within the batch
+
+    existing_keys = upsert.row_keys(existing["time"], existing["city"])
+    keys, source, stats = upsert.upsert(existing_keys, upsert.row_keys(incoming["time"], incoming["city"]))
+    merged = upsert.take(existing["value"].to_numpy(), incoming["value"].to_numpy(), source)
+
+    expected = (pd.concat([existing, incoming], ignore_index=True)
+                .drop_duplicates(["city", "time"], keep="last")
+                .sort_values(["city", "time"], ignore_index=True))
+    np.testing.assert_array_equal(keys, upsert.row_keys(expected["time"], expected["city"]))
+    np.testing.assert_array_equal(merged, expected["value"].to_numpy())
+    assert stats["inserted"] == len(expected) - len(existing)
+    assert stats["inserted"] + stats["updated"] == incoming.drop_duplicates(["city", "time"]).shape[0]
+
+
+def test_upsert_into_empty_index():
+    keys, source, stats = upsert.upsert(np.array([], dtype=np.int64), np.array([5, 3, 5]))
+    np.testing.assert_array_equal(keys, [3, 5])
+    np.testing.assert_array_equal(source, [-2, -3])
+    assert stats == {"inserted": 2, "updated": 0}
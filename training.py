@@ -0,0 +1,238 @@
+import os
+import time
+import tracemalloc
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import mean_absolute_error, root_mean_squared_error, r2_score
+
+import feature_store
+import telemetry
+
+TARGET = "us_aqi"
+FEATURES = [c for c in feature_store.COLUMNS if c not in ("time", TARGET)]
+
+
+def iter_training_batches(batch_rows=65_536, start=None, end=None, cities=None):
+    # (time, X, y) chunks straight from the feature store, float32 / int8 dtypes kept
+    columns = ["time", TARGET] + FEATURES
+    for batch in feature_store.iter_batches(batch_rows, start, end, cities, columns=columns):
+        yield batch["time"].to_numpy(), batch[FEATURES], batch[TARGET].to_numpy()
+
+
+def time_cutoff(test_size=0.2, **filters):
+    # Chronological split point: the last `test_size` share of hours is held out
+    times = feature_store.read(columns=["time"], **filters)["time"]
+    return times.quantile(1 - test_size)
+
+
+def per_city_split(df, test_size=0.2):
+    # Test-row mask for a chronological split per city: the last `test_size` share of
+    # every city's hours, so each city is in the test set (rows in time order per city)
+    position = df.groupby("city", sort=False).cumcount().to_numpy()
+    size = df.groupby("city", sort=False)["city"].transform("size").to_numpy()
+    return position >= (size * (1 - test_size)).astype(np.int64)
+
+
+class LinearStats:
+    # Running sums for exact (ridge) least squares in one pass over the data:
+    # n, sum(x), sum(y), X^T X and X^T y, accumulated in float64.
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.sum_x = np.zeros(n_features)
+        self.sum_y = 0.0
+        self.xtx = np.zeros((n_features, n_features))
+        self.xty = np.zeros(n_features)
+
+    def update(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.n += len(y)
+        self.sum_x += X.sum(axis=0)
+        self.sum_y += y.sum()
+        self.xtx += X.T @ X
+        self.xty += X.T @ y
+        return self
+
+    def merge(self, other):
+        self.n += other.n
+        self.sum_x += other.sum_x
+        self.sum_y += other.sum_y
+        self.xtx += other.xtx
+        self.xty += other.xty
+        return self
+
+    def solve(self, alpha=0.0):
+        # Same problem sklearn solves: centre X and y, penalise coefficients only
+        mean_x = self.sum_x / self.n
+        mean_y = self.sum_y / self.n
+        xtx = self.xtx - self.n * np.outer(mean_x, mean_x)
+        xty = self.xty - self.n * mean_x * mean_y
+        if alpha:
+            coef = np.linalg.solve(xtx + alpha * np.eye(len(xty)), xty)
+        else:
+            coef = np.linalg.lstsq(xtx, xty, rcond=None)[0]
+        return coef, mean_y - mean_x @ coef
+
+    def fit_estimator(self, estimator, feature_names):
+        # Fill a LinearRegression/Ridge instance so it predicts (and pickles) like a fitted one
+        coef, intercept = self.solve(getattr(estimator, "alpha", 0.0))
+        estimator.coef_ = coef
+        estimator.intercept_ = intercept
+        estimator.n_features_in_ = len(feature_names)
+        estimator.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        if hasattr(estimator, "solver"):
+            estimator.solver_ = "cholesky"
+        else:
+            estimator.rank_ = np.linalg.matrix_rank(self.xtx)
+            estimator.singular_ = np.array([])
+        return estimator
+
+    def save(self, path):
+        np.savez(path, n=self.n, sum_x=self.sum_x, sum_y=self.sum_y, xtx=self.xtx, xty=self.xty)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        stats = cls(len(data["sum_x"]))
+        stats.n = int(data["n"])
+        stats.sum_x = data["sum_x"]
+        stats.sum_y = float(data["sum_y"])
+        stats.xtx = data["xtx"]
+        stats.xty = data["xty"]
+        return stats
+
+
+class StreamingMetrics:
+    # MAE / RMSE / R2 accumulated batch by batch
+
+    def __init__(self):
+        self.n = 0
+        self.abs_err = 0.0
+        self.sq_err = 0.0
+        self.sum_y = 0.0
+        self.sum_y2 = 0.0
+
+    def update(self, y_true, y_pred):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        err = y_true - np.asarray(y_pred, dtype=np.float64)
+        self.n += len(y_true)
+        self.abs_err += np.abs(err).sum()
+        self.sq_err += (err ** 2).sum()
+        self.sum_y += y_true.sum()
+        self.sum_y2 += (y_true ** 2).sum()
+        return self
+
+    def result(self):
+        if self.n == 0:
+            # Empty test range: nothing to score
+            return {"MAE": np.nan, "RMSE": np.nan, "R2": np.nan}
+        ss_tot = self.sum_y2 - self.sum_y ** 2 / self.n
+        return {
+            "MAE": self.abs_err / self.n,
+            "RMSE": np.sqrt(self.sq_err / self.n),
+            "R2": 1 - self.sq_err / ss_tot,
+        }
+
+
+def _rss_mb(field):
+    # VmRSS (current) / VmHWM (peak) of this process from /proc, None off Linux
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def _start_rss_peak():
+    # Reset the peak RSS (Linux), so a fit in a reused pool worker gets its own peak;
+    # elsewhere fall back to the growth of ru_maxrss, which misses peaks below earlier ones
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _rss_mb("VmRSS"), True
+    except OSError:
+        return telemetry.peak_rss_mb(), False
+
+
+def _rss_peak_since(start):
+    before, reset = start
+    after = _rss_mb("VmHWM") if reset else telemetry.peak_rss_mb()
+    if before is None or after is None:
+        return float("nan")
+    return round(max(after - before, 0.0), 1)
+
+
+def _peak_fit_memory(model, X_train, y_train, X_test):
+    # Separate traced fit + predict of an unfitted copy: tracemalloc slows down
+    # allocation-heavy fits a lot, so it must not run while the timings are taken
+    tracemalloc.start()
+    try:
+        model.fit(X_train, y_train)
+        model.predict(X_test)
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def _fit_and_score(name, model, X_train, y_train, X_test, y_test, measure_memory=False):
+    # Runs inside a pool worker; X/y arrive as read-only memmaps shared by all workers
+    probe = clone(model) if measure_memory else None
+    rss = _start_rss_peak()
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_s = time.perf_counter() - start
+    start = time.perf_counter()
+    y_pred = model.predict(X_test)
+    predict_s = time.perf_counter() - start
+    peak_mem_mb = _rss_peak_since(rss)
+    row = {
+        "Model": name,
+        "MAE": mean_absolute_error(y_test, y_pred),
+        "RMSE": root_mean_squared_error(y_test, y_pred),
+        "R2": r2_score(y_test, y_pred),
+        "fit_s": fit_s,
+        "predict_s": predict_s,
+        "peak_mem_mb": peak_mem_mb,
+    }
+    if measure_memory:
+        row["traced_mem_mb"] = _peak_fit_memory(probe, X_train, y_train, X_test)
+    return name, model, y_pred, row
+
+
+def train_parallel(models, X_train, y_train, X_test, y_test, n_jobs=-1, measure_memory=False):
+    """Fit and score candidate models concurrently in a process pool.
+
+    Arrays above 1 MB are dumped once and memory-mapped read-only into every
+    worker, so the training matrix is not copied per model. Cores not used by
+    the pool are handed to estimators with their own `n_jobs` (RandomForest).
+    `peak_mem_mb` is how far the worker's RSS peaked above its level before the
+    fit. With `measure_memory`, each model is also fitted a second time under
+    tracemalloc for its peak Python-tracked allocations (`traced_mem_mb`); the
+    timings always come from the untraced fit. Returns `{name: (fitted_model, y_pred, result_row)}` in `models` order.
+    """
+    feature_names = list(X_train.columns) if hasattr(X_train, "columns") else None
+    X_train, X_test = np.ascontiguousarray(X_train, dtype=np.float32), np.ascontiguousarray(X_test, dtype=np.float32)
+    y_train, y_test = np.asarray(y_train, dtype=np.float64), np.asarray(y_test, dtype=np.float64)
+
+    cpus = os.cpu_count() or 1
+    workers = min(len(models), cpus if n_jobs in (None, -1) else n_jobs)
+    for model in models.values():
+        if "n_jobs" in model.get_params():
+            model.set_params(n_jobs=max(1, cpus - workers + 1))
+
+    results = Parallel(n_jobs=workers, backend="loky", max_nbytes="1M", mmap_mode="r")(
+        delayed(_fit_and_score)(name, model, X_train, y_train, X_test, y_test, measure_memory)
+        for name, model in models.items()
+    )
+    fitted = {}
+    for name, model, y_pred, row in results:
+        if feature_names is not None:
+            # Fitted on a bare array; restore the column names predict.py validates against
+            model.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        fitted[name] = (model, y_pred, row)
+    return fitted
@@ -0,0 +1,161 @@
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import mean_absolute_error, root_mean_squared_error
+
+from training import TARGET, FEATURES
+
+# --- Config ---
+FOLD_CACHE_DIR = ".cache/folds"
+N_FOLDS = 4
+HOLDOUT = 0.4   # share of each city's timeline split into the walk-forward test blocks
+ETA = 2         # successive halving keeps the best 1/ETA configs per rung
+
+# Grids over the model families defined in model.build_models()
+SEARCH_SPACE = {
+    "LinearRegression": {},
+    "RidgeRegression": {"alpha": [0.1, 1.0, 10.0, 100.0]},
+    "RandomForest": {"max_depth": [6, 10, None], "min_samples_split": [2, 10]},
+    "GradientBoosting": {"learning_rate": [0.05, 0.1], "max_depth": [3, 5]},
+}
+
+
+def configs(families=SEARCH_SPACE):
+    # Every (family, params) pair in the grid
+    for family in families:
+        grid = SEARCH_SPACE.get(family, {})
+        keys = sorted(grid)
+        for values in itertools.product(*(grid[k] for k in keys)):
+            yield family, dict(zip(keys, values))
+
+
+def data_hash(df, n_folds=N_FOLDS, holdout=HOLDOUT):
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update(f"{n_folds}:{holdout}".encode())
+    return digest.hexdigest()[:16]
+
+
+def walk_forward_folds(df, n_folds=N_FOLDS, holdout=HOLDOUT):
+    """Expanding-window folds, split per city and then by time.
+
+    The last `holdout` share of every city's hours is cut into `n_folds`
+    consecutive test blocks; fold k trains on everything each city saw before
+    its block k. Returns a list of (train_rows, test_rows) position arrays.
+    """
+    folds = [([], []) for _ in range(n_folds)]
+    for _, rows in df.groupby("city", sort=True).indices.items():
+        rows = rows[np.argsort(df["time"].to_numpy()[rows], kind="stable")]
+        first_test = int(len(rows) * (1 - holdout))
+        edges = np.linspace(first_test, len(rows), n_folds + 1).astype(int)
+        for k in range(n_folds):
+            folds[k][0].append(rows[:edges[k]])
+            folds[k][1].append(rows[edges[k]:edges[k + 1]])
+    return [(np.concatenate(train), np.concatenate(test)) for train, test in folds]
+
+
+def cached_folds(df, n_folds=N_FOLDS, holdout=HOLDOUT, cache_dir=FOLD_CACHE_DIR):
+    # Fold matrices are built once per data hash and reused by later searches;
+    # workers memory-map X/y instead of receiving copies
+    path = os.path.join(cache_dir, data_hash(df, n_folds, holdout))
+    if not os.path.exists(os.path.join(path, "folds.npz")):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "X.npy"), np.ascontiguousarray(df[FEATURES], dtype=np.float32))
+        np.save(os.path.join(path, "y.npy"), df[TARGET].to_numpy(dtype=np.float64))
+        folds = walk_forward_folds(df, n_folds, holdout)
+        np.savez(
+            os.path.join(path, "folds.npz"),
+            **{f"train_{k}": train for k, (train, _) in enumerate(folds)},
+            **{f"test_{k}": test for k, (_, test) in enumerate(folds)},
+        )
+    return path
+
+
+def _load_fold(path, k):
+    X = np.load(os.path.join(path, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(path, "y.npy"), mmap_mode="r")
+    folds = np.load(os.path.join(path, "folds.npz"))
+    train, test = folds[f"train_{k}"], folds[f"test_{k}"]
+    return X[train], y[train], X[test], y[test]
+
+
+def _score(path, base_model, params, k):
+    X_train, y_train, X_test, y_test = _load_fold(path, k)
+    model = clone(base_model).set_params(**params)
+    if "n_jobs" in model.get_params():
+        model.set_params(n_jobs=1)  # folds already run in parallel
+    model.fit(X_train, y_train)
+    y_pred = model.predict(X_test)
+    return mean_absolute_error(y_test, y_pred), root_mean_squared_error(y_test, y_pred)
+
+
+def search(df, base_models, n_folds=N_FOLDS, holdout=HOLDOUT, eta=ETA, n_jobs=-1):
+    """Walk-forward hyperparameter search with successive halving.
+
+    `base_models` maps family name to an unfitted estimator whose parameters
+    the grid overrides. Each rung scores the surviving configs on the most
+    recent 1, 2, 4, ... folds and keeps the best 1/`eta` per family by mean
+    MAE, so weak configs never get the full set of folds. Scores from earlier
+    rungs are reused. Returns one row per (family, params) with its mean
+    fold scores.
+    """
+    path = cached_folds(df, n_folds, holdout)
+    fold_order = list(range(n_folds))[::-1]
+    survivors = list(configs(base_models))
+    scores = {}
+    budget = 1
+    with Parallel(n_jobs=n_jobs, backend="loky") as parallel:
+        while True:
+            todo = [
+                (family, params, k)
+                for family, params in survivors
+                for k in fold_order[:budget]
+                if (family, json.dumps(params, sort_keys=True), k) not in scores
+            ]
+            results = parallel(
+                delayed(_score)(path, base_models[family], params, k) for family, params, k in todo
+            )
+            for (family, params, k), result in zip(todo, results):
+                scores[(family, json.dumps(params, sort_keys=True), k)] = result
+            if budget >= n_folds:
+                break
+            survivors = _halve(survivors, scores, fold_order[:budget], eta)
+            budget = min(n_folds, budget * 2)
+
+    rows = []
+    for family, params in configs(base_models):
+        key = json.dumps(params, sort_keys=True)
+        fold_scores = [scores[(family, key, k)] for k in fold_order if (family, key, k) in scores]
+        rows.append({
+            "Model": family,
+            "params": key,
+            "folds": len(fold_scores),
+            "MAE": np.mean([s[0] for s in fold_scores]),
+            "RMSE": np.mean([s[1] for s in fold_scores]),
+        })
+    return pd.DataFrame(rows).sort_values(["folds", "MAE"], ascending=[False, True], ignore_index=True)
+
+
+def _halve(survivors, scores, folds, eta):
+    kept = []
+    for family in dict.fromkeys(f for f, _ in survivors):
+        ranked = sorted(
+            (p for f, p in survivors if f == family),
+            key=lambda p: np.mean([scores[(family, json.dumps(p, sort_keys=True), k)][0] for k in folds]),
+        )
+        kept += [(family, p) for p in ranked[:max(1, len(ranked) // eta)]]
+    return kept
+
+
+def best_params(results):
+    # Lowest-MAE fully evaluated config per family
+    full = results[results["folds"] == results["folds"].max()]
+    return {
+        family: json.loads(group.sort_values("MAE").iloc[0]["params"])
+        for family, group in full.groupby("Model")
+    }
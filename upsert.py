@@ -0,0 +1,59 @@
+import numpy as np
+
+# Key layout: city code in the high bits, hours since the Unix epoch in the low 32 bits.
+# Sorting by key therefore sorts by (city, time).
+HOUR_NS = 3_600_000_000_000
+CITY_SHIFT = 32
+
+
+def row_keys(times, cities):
+    hours = np.asarray(times, dtype="datetime64[ns]").astype(np.int64) // HOUR_NS
+    return (np.asarray(cities, dtype=np.int64) << CITY_SHIFT) | hours
+
+
+def upsert(existing_keys, incoming_keys):
+    """Merge a batch into a sorted key index with last-write-wins semantics.
+
+    `existing_keys` must be sorted and unique. Returns `(keys, source, stats)`
+    where `keys` is the merged sorted index, `source` holds for each merged row
+    either the existing row position (>= 0) or `-(batch position + 1)` for rows
+    taken from the batch, and `stats` counts inserted vs. updated rows.
+
+    Duplicates inside the batch resolve to their last occurrence. The batch is
+    matched with `searchsorted`, so matching costs O(b log n) for a batch of b
+    rows; only the final splice touches the existing rows.
+    """
+    existing_keys = np.asarray(existing_keys, dtype=np.int64)
+    incoming_keys = np.asarray(incoming_keys, dtype=np.int64)
+
+    # Last occurrence of each key within the batch wins
+    order = np.argsort(incoming_keys, kind="stable")
+    sorted_keys = incoming_keys[order]
+    last = np.ones(len(sorted_keys), dtype=bool)
+    last[:-1] = sorted_keys[1:] != sorted_keys[:-1]
+    batch_keys = sorted_keys[last]
+    batch_rows = order[last]
+
+    pos = np.searchsorted(existing_keys, batch_keys)
+    in_range = pos < len(existing_keys)
+    matched = np.zeros(len(batch_keys), dtype=bool)
+    matched[in_range] = existing_keys[pos[in_range]] == batch_keys[in_range]
+
+    source = np.arange(len(existing_keys), dtype=np.int64)
+    source[pos[matched]] = -(batch_rows[matched] + 1)
+
+    new_keys = batch_keys[~matched]
+    keys = np.insert(existing_keys, pos[~matched], new_keys)
+    source = np.insert(source, pos[~matched], -(batch_rows[~matched] + 1))
+
+    stats = {"inserted": int((~matched).sum()), "updated": int(matched.sum())}
+    return keys, source, stats
+
+
+def take(existing, incoming, source):
+    # Gather merged rows from two aligned column arrays according to `source`
+    from_batch = source < 0
+    out = np.empty(len(source), dtype=np.result_type(existing, incoming))
+    out[~from_batch] = existing[source[~from_batch]]
+    out[from_batch] = incoming[-source[from_batch] - 1]
+    return out